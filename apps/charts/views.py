@@ -9,9 +9,9 @@ from charts.serializers import (
 from core.permissions import SuperuserOrAdminPermission
 from core.prometheus import report_access_time_summary, report_access_total_counter
 from logs.logic.queries import BadRequestError, StatsComputer, TooMuchDataError
+from logs.logic.streaming import stats_data_streaming_response
 from logs.models import ReportType
 from logs.serializers import DimensionSerializer, MetricSerializer
-from pandas import DataFrame
 from rest_framework import serializers, status
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
@@ -68,8 +68,15 @@ class ChartDataView(APIView):
         # special attribute signaling that this view is used on dashboard and thus we
         # want to cache the data for extra speed using recache
         dashboard_view = 'dashboard' in request.GET
+        data_format = request.GET.get('format')
         try:
             computer = StatsComputer(report_view, request.GET)
+            if data_format in ('csv', 'xlsx'):
+                # for the bare result, we do not add any extra information, just output the list
+                # as it is read from the database
+                label_attrs = dict(view_type='chart_data', report_type=computer.used_report_type.pk)
+                report_access_total_counter.labels(**label_attrs).inc()
+                return stats_data_streaming_response(computer, request.user, data_format)
             data = computer.get_data(request.user, recache=dashboard_view)
         except TooMuchDataError:
             return Response({'too_much_data': True})
@@ -81,20 +88,6 @@ class ChartDataView(APIView):
         report_access_total_counter.labels(**label_attrs).inc()
         report_access_time_summary.labels(**label_attrs).observe(monotonic() - start)
 
-        data_format = request.GET.get('format')
-        if data_format in ('csv', 'xlsx'):
-            # for the bare result, we do not add any extra information, just output the list
-            data = DataFrame(data)
-            new_keys = [computer.io_prim_dim_name]
-            if computer.io_sec_dim_name:
-                new_keys.append(computer.io_sec_dim_name)
-            # we set the queried dimensions as index so that the default integer index is not
-            # added to the result
-            data.set_index(new_keys, drop=True, inplace=True)
-            return Response(
-                data,
-                headers={'Content-Disposition': f'attachment; filename="export.{data_format}"'},
-            )
         # prepare the data to return
         reply = {'data': data}
         if computer.prim_dim_obj:
@@ -23,3 +23,22 @@ celus_sentry_release = Gauge(
     'Value is always 1',
     ['hash'],
 )
+
+recache_renewal_queue_depth = Gauge(
+    'celus_recache_renewal_queue_depth',
+    'The number of cached queries which are due for renewal',
+    [],
+)
+
+recache_renewal_time_summary = Summary(
+    'celus_recache_renewal_time_seconds',
+    'The time it took to renew a cached query. Split by origin of the query',
+    ['origin'],
+)
+
+recache_renewal_delay_summary = Summary(
+    'celus_recache_renewal_delay_seconds',
+    'How long after its timeout a cached query was renewed - 0 when it was renewed in advance. '
+    'Split by origin of the query',
+    ['origin'],
+)
@@ -32,3 +32,38 @@ def cache_based_lock(lock_name, timeout=3600, blocking_timeout=None):
             if time() < lock_time + timeout:
                 # the lock has not yet timed out, so it should be ours
                 cache.delete(lock_name)
+
+
+@contextmanager
+def cache_based_semaphore(name, limit, timeout=3600):
+    """
+    Allows at most `limit` concurrent holders of the semaphore called `name`. Yields `True` if
+    the caller got a slot and `False` otherwise - in that case it should not do the guarded
+    work. A `limit` of 0 (or None) means that there is no limit at all.
+
+    The counter expires after `timeout` seconds, so that slots leaked by killed processes are
+    eventually freed.
+    """
+    if not limit:
+        yield True
+        return
+    key = f'semaphore_{name}'
+    cache.add(key, 0, timeout)
+    try:
+        value = cache.incr(key)
+    except ValueError:
+        # the key expired between `add` and `incr`
+        cache.add(key, 1, timeout)
+        value = 1
+    if value > limit:
+        cache.decr(key)
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        try:
+            cache.decr(key)
+        except ValueError:
+            # the key has expired in the meantime, there is nothing to release
+            pass
@@ -4,10 +4,19 @@ from django.db import models
 class FileFormat(models.TextChoices):
     XLSX = 'XLSX', 'XLSX'
     ZIP_CSV = 'ZIP_CSV', 'CSV files inside ZIP archive'
+    PARQUET = 'PARQUET', 'Parquet'
+    ARROW = 'ARROW', 'Arrow IPC stream'
 
     @classmethod
-    def file_extension(cls, value):
+    def file_extension(cls, value, multipart=False):
+        """
+        Columnar formats are stored in a ZIP archive if there are more parts (files)
+        """
         if value == cls.XLSX:
             return 'xlsx'
+        elif value == cls.PARQUET and not multipart:
+            return 'parquet'
+        elif value == cls.ARROW and not multipart:
+            return 'arrows'
         else:
             return 'zip'
@@ -0,0 +1,24 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('export', '0005_flexibledataexport_file_format')]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flexibledataexport',
+            name='file_format',
+            field=models.CharField(
+                choices=[
+                    ('XLSX', 'XLSX'),
+                    ('ZIP_CSV', 'CSV files inside ZIP archive'),
+                    ('PARQUET', 'Parquet'),
+                    ('ARROW', 'Arrow IPC stream'),
+                ],
+                default='XLSX',
+                max_length=10,
+            ),
+        )
+    ]
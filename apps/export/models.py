@@ -6,7 +6,12 @@ from django.db import models
 from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.utils.timezone import now
 from export.enums import FileFormat
-from logs.logic.reporting.export import FlexibleDataExcelExporter, FlexibleDataZipCSVExporter
+from logs.logic.reporting.export import (
+    FlexibleDataArrowExporter,
+    FlexibleDataExcelExporter,
+    FlexibleDataParquetExporter,
+    FlexibleDataZipCSVExporter,
+)
 from logs.logic.reporting.slicer import FlexibleDataSlicer, SlicerConfigError
 
 
@@ -86,6 +91,8 @@ class FlexibleDataExport(ExportBase):
     format_to_exporter = {
         FileFormat.XLSX: FlexibleDataExcelExporter,
         FileFormat.ZIP_CSV: FlexibleDataZipCSVExporter,
+        FileFormat.PARQUET: FlexibleDataParquetExporter,
+        FileFormat.ARROW: FlexibleDataArrowExporter,
     }
 
     export_params = models.JSONField(
@@ -124,6 +131,10 @@ class FlexibleDataExport(ExportBase):
             return cls._meta.get_field('file_format').default
         if fmt.lstrip('.').lower() in ('zip', 'csv'):
             return FileFormat.ZIP_CSV
+        if fmt.lstrip('.').lower() == 'parquet':
+            return FileFormat.PARQUET
+        if fmt.lstrip('.').lower() in ('arrow', 'arrows'):
+            return FileFormat.ARROW
         return FileFormat.XLSX
 
     def write_data(self, stream, progress_monitor=None) -> int:
@@ -133,7 +144,10 @@ class FlexibleDataExport(ExportBase):
         exporter = export_cls(
             slicer, report_name=self.name, report_owner=self.owner, include_tags=True
         )
-        return exporter.stream_data_to_sink(stream, progress_monitor=progress_monitor)
+        rec_count = exporter.stream_data_to_sink(stream, progress_monitor=progress_monitor)
+        if exporter.part_timings:
+            self.extra_info['part_timings'] = exporter.part_timings
+        return rec_count
 
     def create_output_file(self, progress_monitor=None, raise_exception=False):
         self.status = self.IN_PROGRESS
@@ -161,5 +175,7 @@ class FlexibleDataExport(ExportBase):
 
     def generate_filename(self):
         ts = now().strftime('%Y%m%d-%H%M%S')
-        ext = FileFormat.file_extension(self.file_format)
+        ext = FileFormat.file_extension(
+            self.file_format, multipart=bool(self.export_params.get('split_by'))
+        )
         return f'export-{self.pk}-{ts}.{ext}'
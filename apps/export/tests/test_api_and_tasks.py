@@ -68,6 +68,22 @@ class TestFlexibleExportApi:
         export = FlexibleDataExport.objects.get(pk=resp.json()['pk'])
         assert export.owner == admin_user
 
+    @pytest.mark.parametrize(['enabled', 'status_code'], [(True, 201), (False, 400)])
+    def test_create_columnar(self, admin_client, settings, enabled, status_code):
+        settings.ENABLE_COLUMNAR_EXPORT = enabled
+        with patch('export.views.process_flexible_export_task'):
+            resp = admin_client.post(
+                reverse('flexible-export-list'),
+                {
+                    'primary_dimension': 'platform',
+                    'groups': b64json(['metric']),
+                    'format': 'parquet',
+                },
+                content_type='application/json',
+            )
+        assert resp.status_code == status_code
+        assert FlexibleDataExport.objects.exists() == enabled
+
     def test_create_with_date_filter(self, admin_client, admin_user):
         with patch('export.views.process_flexible_export_task') as export_task:
             resp = admin_client.post(
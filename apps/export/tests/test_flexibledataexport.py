@@ -198,6 +198,31 @@ class TestFlexibleDataExport:
         data = export_output(export)
         assert data.splitlines()[0].startswith('Title/Database,ISSN,EISSN,ISBN,')
 
+    @pytest.mark.parametrize('fmt', [FileFormat.PARQUET, FileFormat.ARROW])
+    def test_create_output_file_columnar(self, slicer, admin_user, fmt):
+        pa = pytest.importorskip('pyarrow')
+        pq = pytest.importorskip('pyarrow.parquet')
+        export = FlexibleDataExport.create_from_slicer(slicer, admin_user, fmt=fmt)
+        out = BytesIO()
+        export.write_data(out)
+        if fmt == FileFormat.PARQUET:
+            table = pq.read_table(BytesIO(out.getvalue()))
+        else:
+            table = pa.ipc.open_stream(out.getvalue()).read_all()
+        assert table.column_names == [
+            'Platform',
+            'Tags',
+            'A / Metric 1',
+            'A / Metric 2',
+            'A / Metric 3',
+            'B / Metric 1',
+            'B / Metric 2',
+            'B / Metric 3',
+        ]
+        assert table.column('Platform').to_pylist() == ['Platform 1', 'Platform 2', 'Platform 3']
+        assert table.column('A / Metric 1').to_pylist() == [12294, 16182, 20070]
+        assert b'celus_report' in table.schema.metadata
+
     @pytest.mark.parametrize(['split_by'], [('platform',), ('date__year',), ('date',)])
     @pytest.mark.parametrize(
         ['fmt', 'split'],
@@ -206,6 +231,8 @@ class TestFlexibleDataExport:
             (FileFormat.ZIP_CSV, False),
             (FileFormat.XLSX, True),
             (FileFormat.XLSX, False),
+            (FileFormat.PARQUET, True),
+            (FileFormat.PARQUET, False),
         ],
     )
     def test_create_output_file_format(
@@ -214,12 +241,24 @@ class TestFlexibleDataExport:
         """
         Tests that using title as primary dimension also adds ISBN and other extra columns
         """
+        if fmt == FileFormat.PARQUET:
+            pq = pytest.importorskip('pyarrow.parquet')
         slicer = FlexibleDataSlicer(primary_dimension='target')
         if split:
             slicer.add_split_by(split_by)
         slicer.add_group_by('metric')
         export = FlexibleDataExport.create_from_slicer(slicer, admin_user, fmt=fmt)
         export.create_output_file(raise_exception=True)
+        if fmt == FileFormat.PARQUET:
+            if split:
+                assert export.output_file.name.endswith('.zip')
+                with ZipFile(export.output_file.file, 'r') as zipfile:
+                    for archname in zipfile.namelist():
+                        assert archname.endswith('.parquet')
+            else:
+                assert export.output_file.name.endswith('.parquet')
+                assert pq.read_table(BytesIO(export.output_file.read())).num_rows > 0
+            return
         assert export.output_file.name.endswith('.zip' if fmt == FileFormat.ZIP_CSV else '.xlsx')
         # both .zip and .xlsx are zip files
         with ZipFile(export.output_file.file, 'r') as zipfile:
@@ -230,3 +269,34 @@ class TestFlexibleDataExport:
                 assert (
                     '[Content_Types].xml' in zipfile.namelist()
                 ), 'XLSX should contain [Content_Types].xml'
+
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize('fmt', [FileFormat.ZIP_CSV, FileFormat.XLSX])
+    def test_parts_obtained_in_parallel(self, flexible_slicer_test_data, admin_user, fmt, settings):
+        """
+        Tests that parts obtained by several threads are written in the same order and with
+        the same content as when they are obtained one by one
+        """
+        slicer = FlexibleDataSlicer(primary_dimension='target')
+        slicer.add_split_by('platform')
+        slicer.add_group_by('metric')
+        export = FlexibleDataExport.create_from_slicer(slicer, admin_user, fmt=fmt)
+        outputs = []
+        for workers in (0, 2):
+            settings.EXPORT_PART_WORKERS = workers
+            out = BytesIO()
+            export.write_data(out)
+            with ZipFile(out, 'r') as zipfile:
+                outputs.append([(name, zipfile.read(name)) for name in sorted(zipfile.namelist())])
+        if fmt == FileFormat.ZIP_CSV:
+            assert outputs[0] == outputs[1]
+        else:
+            # xlsx files contain timestamps, so only the sheets are compared
+            sheets = [
+                [(name, data) for name, data in output if name.startswith('xl/worksheets/')]
+                for output in outputs
+            ]
+            assert sheets[0] == sheets[1]
+        timings = export.extra_info['part_timings']
+        assert timings, 'time spent on individual parts is recorded'
+        assert all(timing['rows'] > 0 for timing in timings)
@@ -1,8 +1,10 @@
+from django.conf import settings
 from logs.logic.reporting.slicer import FlexibleDataSlicer, SlicerConfigError
 from rest_framework.response import Response
 from rest_framework.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST
 from rest_framework.viewsets import ModelViewSet
 
+from .enums import FileFormat
 from .models import FlexibleDataExport
 from .serializers import FlexibleDataExportSerializer
 from .tasks import process_flexible_export_task
@@ -25,7 +27,11 @@ class FlexibleDataExportViewSet(ModelViewSet):
             slicer = FlexibleDataSlicer.create_from_params(request.data)
         except SlicerConfigError as e:
             return Response({'error': str(e)}, status=HTTP_400_BAD_REQUEST)
-        fmt = request.data.get('format')
+        fmt = FlexibleDataExport.cleanup_format(request.data.get('format'))
+        if fmt in (FileFormat.PARQUET, FileFormat.ARROW) and not settings.ENABLE_COLUMNAR_EXPORT:
+            return Response(
+                {'error': f'Format "{fmt.label}" is not available'}, status=HTTP_400_BAD_REQUEST
+            )
         name = request.data.get('name', '')
         export = FlexibleDataExport.create_from_slicer(slicer, request.user, fmt=fmt, name=name)
         process_flexible_export_task.apply_async(args=(export.pk,), countdown=2)
@@ -1,4 +1,9 @@
+from itertools import chain, islice
+from typing import Generator, List, Sequence
+
 from django.conf import settings
+from django.db.models import QuerySet
+from django.db.models.functions import Coalesce
 from hcube.api.backend import CubeBackend
 from hcube.api.models.cube import Cube
 from hcube.api.models.dimensions import DateDimension, IntDimension
@@ -118,9 +123,73 @@ class AccessLogCube(Cube):
             value=accesslog['value'],
         )
 
+    @classmethod
+    def accesslog_columns(cls) -> list:
+        """
+        Values to fetch from AccessLog for the columns of the cube in the same order.
+        NULLs are replaced by zeros by the database.
+        """
+        out = []
+        for name in chain(cls._dimensions, cls._metrics):
+            if AccessLog._meta.get_field(name).null:
+                out.append(Coalesce(name, 0))
+            else:
+                out.append(name)
+        return out
+
+    @classmethod
+    def accesslog_row_batches(
+        cls, queryset: QuerySet, batch_size=10_000
+    ) -> Generator[List[tuple], None, None]:
+        """
+        Yields lists of at most `batch_size` tuples with data for the cube columns for
+        accesslogs from `queryset`. A server-side cursor is used for fetching the data.
+        """
+        rows = queryset.values_list(*cls.accesslog_columns()).iterator(chunk_size=batch_size)
+        while batch := list(islice(rows, batch_size)):
+            yield batch
+
+    @classmethod
+    def store_accesslog_rows(cls, backend: ClickhouseCubeBackend, rows: Sequence[tuple]):
+        """
+        Stores rows as produced by `accesslog_row_batches` into the cube.
+
+        Bypasses `backend.store_records` which creates several objects per record and sends
+        the data in columnar form which is also the native format of ClickHouse.
+        """
+        if not rows:
+            return
+        meta = backend.get_table_meta(cls)
+        names = list(chain(cls._dimensions, cls._metrics))
+        columns = list(zip(*rows))
+        if meta.use_sign_col():
+            names.append(meta.sign_col)
+            columns.append([1] * len(rows))
+        with backend.pool.get_client() as client:
+            client.execute(
+                f'INSERT INTO {backend.database}.{backend.cube_to_table_name(cls)} '
+                f'({", ".join(names)}) VALUES',
+                columns,
+                columnar=True,
+            )
+
+    @classmethod
+    def sync_accesslogs_with_cube(
+        cls, backend: ClickhouseCubeBackend, queryset: QuerySet, batch_size=10_000
+    ) -> int:
+        """
+        Writes all accesslogs from `queryset` into the cube in batches of `batch_size` records.
+        Returns number of records synced.
+        """
+        out = 0
+        for rows in cls.accesslog_row_batches(queryset, batch_size=batch_size):
+            cls.store_accesslog_rows(backend, rows)
+            out += len(rows)
+        return out
+
     @classmethod
     def sync_import_batch_with_cube(
-        cls, backend: CubeBackend, import_batch: ImportBatch, batch_size=10_000
+        cls, backend: ClickhouseCubeBackend, import_batch: ImportBatch, batch_size=10_000
     ) -> int:
         """
         Writes all accesslogs from an import_batch into the cube using backend `backend`.
@@ -131,49 +200,31 @@ class AccessLogCube(Cube):
         Note: we do not care about duplicates in the cube because this is primarily targetting
         clickhouse where records with same key will be merged.
         """
-        to_write = []
-        out = 0
         # only sync accesslogs which are not for materialized reports - in ClickHouse, we have
         # a better way of optimizing access than materialized reports (e.g. projections)
-        for al in (
-            import_batch.accesslog_set.filter(report_type__materialization_spec__isnull=True)
-            .values()
-            .iterator()
-        ):
-            to_write.append(cls.translate_accesslog_dict_to_cube(al))
-            if len(to_write) >= batch_size:
-                backend.store_records(cls, to_write)
-                out += len(to_write)
-                to_write = []
-        if to_write:
-            backend.store_records(cls, to_write)
-        return out + len(to_write)
+        return cls.sync_accesslogs_with_cube(
+            backend,
+            import_batch.accesslog_set.filter(report_type__materialization_spec__isnull=True),
+            batch_size=batch_size,
+        )
 
     @classmethod
     def sync_import_batch_interest_with_cube(
-        cls, backend: CubeBackend, import_batch: ImportBatch, batch_size=10_000
+        cls, backend: ClickhouseCubeBackend, import_batch: ImportBatch, batch_size=10_000
     ) -> int:
         """
         Only syncs interest for specific batch by deleting all previous interest records for
         that batch and then recreating it.
         """
         interest_rt = ReportType.objects.get_interest_rt()
-        to_write = []
-        out = 0
         backend.delete_records(
             AccessLogCube.query().filter(
                 import_batch_id=import_batch.pk, report_type_id=interest_rt.pk
             )
         )
-        for al in import_batch.accesslog_set.filter(report_type=interest_rt).values().iterator():
-            to_write.append(cls.translate_accesslog_dict_to_cube(al))
-            if len(to_write) >= batch_size:
-                backend.store_records(cls, to_write)
-                out += len(to_write)
-                to_write = []
-        if to_write:
-            backend.store_records(cls, to_write)
-        return out + len(to_write)
+        return cls.sync_accesslogs_with_cube(
+            backend, import_batch.accesslog_set.filter(report_type=interest_rt), batch_size
+        )
 
     @classmethod
     def delete_import_batch(cls, backend: CubeBackend, import_batch_id: int):
@@ -1,13 +1,17 @@
 import logging
 import os
 import typing
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from datetime import date
-from time import time
+from time import monotonic, time
 
 from celus_nigiri.client import Sushi5Client, SushiError, SushiException
 from celus_nigiri.counter4 import Counter4ReportBase
 from celus_nigiri.counter5 import Counter5ReportBase, TransportError
 from core.exceptions import FileConsistencyError
+from core.task_support import cache_based_semaphore
 from django.conf import settings
 from django.db.transaction import atomic
 from logs.exceptions import DataStructureError
@@ -46,19 +50,23 @@ def check_importable_attempt(attempt: SushiFetchAttempt):
 
 
 @atomic
-def import_one_sushi_attempt(attempt: SushiFetchAttempt):
+def import_one_sushi_attempt(attempt: SushiFetchAttempt) -> Counter:
+    """
+    Imports data from the attempt and returns import stats (empty when nothing was imported)
+    """
+    stats = Counter()
     # check file consistency first
     try:
         attempt.check_self_checksum()
     except FileConsistencyError as exc:
         attempt.mark_crashed(exc)
-        return
+        return stats
 
     counter_version = attempt.credentials.counter_version
     reader_cls = attempt.counter_report.get_reader_class(json_format=attempt.file_is_json())
     if not reader_cls:
         logger.warning('Unsupported report type %s', attempt.counter_report.code)
-        return
+        return stats
 
     check_importable_attempt(attempt)
 
@@ -71,7 +79,7 @@ def import_one_sushi_attempt(attempt: SushiFetchAttempt):
     except FileNotFoundError as e:
         logger.error('Cannot find the referenced file - probably deleted?: %s', e)
         attempt.mark_crashed(e)
-        return
+        return stats
     try:
         if counter_version == 4:
             validate_data_v4(reader)
@@ -91,7 +99,7 @@ def import_one_sushi_attempt(attempt: SushiFetchAttempt):
         if hasattr(reader, 'header') and type(reader.header) is dict:
             attempt.extract_header_data(reader.header)
         attempt.save()
-        return
+        return stats
     # we need to create explicit connection between organization and platform
     op, created = OrganizationPlatform.objects.get_or_create(
         platform=attempt.credentials.platform, organization=attempt.credentials.organization
@@ -165,6 +173,7 @@ def import_one_sushi_attempt(attempt: SushiFetchAttempt):
         if attempt.extract_header_data(reader.header):
             attempt.save()
     attempt.mark_processed()
+    return stats
 
 
 def reprocess_attempt(attempt: SushiFetchAttempt) -> typing.Optional[SushiFetchAttempt]:
@@ -177,3 +186,133 @@ def reprocess_attempt(attempt: SushiFetchAttempt) -> typing.Optional[SushiFetchA
         logger.error('Importing sushi attempt #%d crashed: %s', attempt.pk, e)
         attempt.mark_crashed(e)
     return attempt
+
+
+@dataclass
+class ImportThroughput:
+    """
+    Keeps track of how many attempts and records were imported and how fast
+    """
+
+    attempts: int = 0
+    records: int = 0
+    start: float = field(default_factory=monotonic)
+
+    def add(self, stats: Counter):
+        self.attempts += 1
+        self.records += stats.get('new logs', 0)
+
+    @property
+    def duration(self) -> float:
+        return monotonic() - self.start
+
+    @property
+    def attempts_per_minute(self) -> float:
+        duration = self.duration
+        return 60 * self.attempts / duration if duration else 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        duration = self.duration
+        return self.records / duration if duration else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'attempts': self.attempts,
+            'records': self.records,
+            'duration': round(self.duration, 3),
+            'attempts_per_minute': round(self.attempts_per_minute, 3),
+            'records_per_second': round(self.records_per_second, 3),
+        }
+
+    def __str__(self):
+        return (
+            f'{self.attempts} attempts ({self.attempts_per_minute:.1f}/min), '
+            f'{self.records} records ({self.records_per_second:.1f}/s) in {self.duration:.1f} s'
+        )
+
+
+def import_claimed_attempt(attempt_id: int) -> typing.Optional[Counter]:
+    """
+    Claims the attempt with `select_for_update(skip_locked=True)` and imports it in its own
+    transaction. Returns None if the attempt was already claimed by someone else or is not
+    waiting for import anymore, otherwise returns the import stats.
+    """
+    with atomic():
+        attempt = (
+            SushiFetchAttempt.objects.select_for_update(skip_locked=True)
+            .filter(pk=attempt_id, status=AttemptStatus.IMPORTING)
+            .first()
+        )
+        if not attempt:
+            return None
+        try:
+            return import_one_sushi_attempt(attempt)
+        except Exception as e:
+            # we catch any kind of error to make sure that the worker does not die
+            logger.error('Importing sushi attempt #%d crashed: %s', attempt.pk, e)
+            attempt.mark_crashed(e)
+            return Counter()
+        finally:
+            attempt.data_file.close()
+
+
+def import_importing_attempts_one_by_one(
+    max_per_platform: int = 0, max_per_organization: int = 0, window: int = 100
+) -> ImportThroughput:
+    """
+    Imports attempts in the IMPORTING state one by one, each of them in its own transaction.
+
+    Several instances of this function may run at the same time in different processes because
+    each attempt is claimed using `select_for_update(skip_locked=True)`.
+
+    `max_per_platform` and `max_per_organization` limit the number of attempts imported at the
+    same time (by all the workers) for one platform or organization - 0 means no limit.
+    Attempts which hit the limit are left for later or for the worker which holds the slot.
+    """
+    throughput = ImportThroughput()
+    seen = set()
+    busy_platforms = set()
+    busy_organizations = set()
+    progress = False
+    while True:
+        candidates = list(
+            SushiFetchAttempt.objects.filter(status=AttemptStatus.IMPORTING)
+            .exclude(pk__in=seen)
+            .exclude(credentials__platform_id__in=busy_platforms)
+            .exclude(credentials__organization_id__in=busy_organizations)
+            .order_by('timestamp')
+            .values_list('pk', 'credentials__platform_id', 'credentials__organization_id')[:window]
+        )
+        if not candidates:
+            if (busy_platforms or busy_organizations) and progress:
+                # other workers may have finished in the meantime, so we try the busy ones again
+                busy_platforms.clear()
+                busy_organizations.clear()
+                progress = False
+                continue
+            break
+        for attempt_id, platform_id, organization_id in candidates:
+            if platform_id in busy_platforms or organization_id in busy_organizations:
+                continue
+            with ExitStack() as stack:
+                if not stack.enter_context(
+                    cache_based_semaphore(f'sushi_import_platform_{platform_id}', max_per_platform)
+                ):
+                    busy_platforms.add(platform_id)
+                    continue
+                if not stack.enter_context(
+                    cache_based_semaphore(
+                        f'sushi_import_organization_{organization_id}', max_per_organization
+                    )
+                ):
+                    busy_organizations.add(organization_id)
+                    continue
+                seen.add(attempt_id)
+                logger.info('----- Importing attempt #%d -----', attempt_id)
+                stats = import_claimed_attempt(attempt_id)
+                if stats is not None:
+                    throughput.add(stats)
+                    progress = True
+    logger.info('Imported %s', throughput)
+    return throughput
@@ -1,21 +1,36 @@
 import logging
 from collections import Counter
 from dataclasses import dataclass, field
-from itertools import chain
-from typing import Dict, List, Set
+from itertools import chain, islice
+from time import monotonic
+from typing import Dict, Iterable, List, Set
 
 from core.context_managers import needs_clickhouse_sync
+from core.task_support import cache_based_lock
 from django.db.models import F, Q, Sum
 from django.db.transaction import atomic, on_commit
 from django.utils.timezone import now
 from hcube.api.models.aggregation import Sum as HSum
+from redis.exceptions import LockError
 
 from ..cubes import AccessLogCube, ch_backend
-from ..models import AccessLog, ImportBatch, ImportBatchSyncLog
+from ..models import AccessLog, ClickhouseResyncShard, ImportBatch, ImportBatchSyncLog
 
 logger = logging.getLogger(__name__)
 
 
+def _invalidate_slicer_cache(import_batch_ids: Iterable[int]):
+    """
+    The slicer cache is invalidated when data are committed to the database, but ClickHouse
+    is synced later, so reports computed from ClickHouse in the meantime could be cached with
+    outdated data. Therefore the cache is invalidated again once the sync is committed.
+    """
+    from .reporting.cache import invalidate_slicer_cache_for_import_batches
+
+    import_batch_ids = list(import_batch_ids)
+    on_commit(lambda: invalidate_slicer_cache_for_import_batches(import_batch_ids))
+
+
 @needs_clickhouse_sync
 @atomic()
 def sync_import_batch_with_clickhouse(import_batch: ImportBatch, batch_size=10_000) -> int:
@@ -55,6 +70,7 @@ def sync_import_batch_with_clickhouse(import_batch: ImportBatch, batch_size=10_0
             # which is important because otherwise it would be always later than `last_clickhoused`
             # which would interfere with the way we find out-of-sync import batches
             ImportBatch.objects.filter(pk=import_batch.pk).update(last_clickhoused=now())
+            _invalidate_slicer_cache([import_batch.pk])
         return out
     elif sync_log.state == ImportBatchSyncLog.STATE_DELETE:
         # the import batch was already deleted, so we cannot do anything and just leave it
@@ -101,6 +117,7 @@ def sync_import_batch_interest_with_clickhouse(import_batch: ImportBatch, batch_
         else:
             sync_log.state = ImportBatchSyncLog.STATE_NO_CHANGE
             sync_log.save()
+            _invalidate_slicer_cache([import_batch.pk])
         return out
     elif sync_log.state == ImportBatchSyncLog.STATE_DELETE:
         # the import batch should be deleted, let's get out of here, we do not need to sync
@@ -109,6 +126,12 @@ def sync_import_batch_interest_with_clickhouse(import_batch: ImportBatch, batch_
         raise ValueError(f'Unhandled state {sync_log.state}')
 
 
+def _unsynced_import_batches():
+    return ImportBatch.objects.filter(
+        Q(last_clickhoused__isnull=True) | Q(last_clickhoused__lt=F('last_updated'))
+    )
+
+
 @needs_clickhouse_sync
 def sync_accesslogs_with_clickhouse_superfast(batch_size=100_000, ignore_timestamps=False) -> int:
     """
@@ -119,34 +142,113 @@ def sync_accesslogs_with_clickhouse_superfast(batch_size=100_000, ignore_timesta
     very fast as it does not have to make a query for each import batch.
     """
     total = 0
-    to_write = []
-    import_batch_ids = set()
-    qs = ImportBatch.objects.all()
-    if not ignore_timestamps:
-        qs = qs.filter(Q(last_clickhoused__isnull=True) | Q(last_clickhoused__lt=F('last_updated')))
-    for al in (
+    qs = ImportBatch.objects.all() if ignore_timestamps else _unsynced_import_batches()
+    ib_id_idx = list(AccessLogCube._dimensions).index('import_batch_id')
+    for rows in AccessLogCube.accesslog_row_batches(
         AccessLog.objects.filter(
             report_type__materialization_spec__isnull=True, import_batch__in=qs
-        )
-        .order_by('import_batch_id')
-        .values()
-        .iterator()
+        ).order_by('import_batch_id'),
+        batch_size=batch_size,
     ):
-        to_write.append(AccessLogCube.translate_accesslog_dict_to_cube(al))
-        import_batch_ids.add(al['import_batch_id'])
-        if len(to_write) >= batch_size:
-            ch_backend.store_records(AccessLogCube, to_write)
-            total += len(to_write)
-            to_write = []
-            updated = ImportBatch.objects.filter(pk__in=import_batch_ids).update(
-                last_clickhoused=now()
+        AccessLogCube.store_accesslog_rows(ch_backend, rows)
+        total += len(rows)
+        ib_ids = {row[ib_id_idx] for row in rows}
+        updated = ImportBatch.objects.filter(pk__in=ib_ids).update(last_clickhoused=now())
+        _invalidate_slicer_cache(ib_ids)
+        logger.debug('Synced with ClickHouse: %d records, %d import batches', total, updated)
+    return total
+
+
+@atomic()
+def create_clickhouse_resync_shards(
+    shard_count: int, ignore_timestamps=False
+) -> List[ClickhouseResyncShard]:
+    """
+    Splits import batches into `shard_count` shards with the same number of import batches
+    each. Shards of any previous resync are removed.
+    """
+    ClickhouseResyncShard.objects.all().delete()
+    qs = ImportBatch.objects.all() if ignore_timestamps else _unsynced_import_batches()
+    ib_ids = list(qs.order_by('pk').values_list('pk', flat=True))
+    shards = []
+    for i in range(shard_count):
+        start = len(ib_ids) * i // shard_count
+        end = len(ib_ids) * (i + 1) // shard_count
+        part = ib_ids[start:end]
+        if part:
+            shards.append(
+                ClickhouseResyncShard(
+                    first_import_batch_id=part[0],
+                    last_import_batch_id=part[-1],
+                    ignore_timestamps=ignore_timestamps,
+                )
             )
-            logger.debug('Synced with ClickHouse: %d records, %d import batches', total, updated)
-            import_batch_ids = set()
-    if to_write:
-        ch_backend.store_records(AccessLogCube, to_write)
-        ImportBatch.objects.filter(pk__in=import_batch_ids).update(last_clickhoused=now())
-    return total + len(to_write)
+    return ClickhouseResyncShard.objects.bulk_create(shards)
+
+
+@needs_clickhouse_sync
+def sync_clickhouse_resync_shard(
+    shard: ClickhouseResyncShard, import_batch_chunk=100, batch_size=100_000
+) -> int:
+    """
+    Syncs the import batches of a shard with Clickhouse, `import_batch_chunk` import batches
+    at a time. The shard is checkpointed after each chunk, so when interrupted, the sync
+    continues after the last finished chunk.
+
+    :return: number of synced rows
+    """
+    if shard.finished:
+        return 0
+    qs = ImportBatch.objects.all() if shard.ignore_timestamps else _unsynced_import_batches()
+    qs = qs.filter(pk__gte=shard.first_import_batch_id, pk__lte=shard.last_import_batch_id)
+    if shard.checkpoint is not None:
+        qs = qs.filter(pk__gt=shard.checkpoint)
+    if not shard.started:
+        shard.started = now()
+        shard.save(update_fields=['started'])
+    total = 0
+    ib_ids = iter(qs.order_by('pk').values_list('pk', flat=True))
+    while chunk := list(islice(ib_ids, import_batch_chunk)):
+        start = monotonic()
+        rows = AccessLogCube.sync_accesslogs_with_cube(
+            ch_backend,
+            AccessLog.objects.filter(
+                import_batch_id__in=chunk, report_type__materialization_spec__isnull=True
+            ),
+            batch_size=batch_size,
+        )
+        ImportBatch.objects.filter(pk__in=chunk).update(last_clickhoused=now())
+        _invalidate_slicer_cache(chunk)
+        shard.checkpoint = chunk[-1]
+        shard.rows += rows
+        shard.sync_seconds += monotonic() - start
+        shard.save(update_fields=['checkpoint', 'rows', 'sync_seconds'])
+        total += rows
+        logger.info(
+            'Resync shard %s: %d rows, %.0f rows/s', shard, shard.rows, shard.rows_per_second
+        )
+    shard.finished = now()
+    shard.save(update_fields=['finished'])
+    return total
+
+
+def sync_clickhouse_resync_shard_by_id(shard_id: int) -> int:
+    """
+    Syncs shard with `shard_id` unless it is already being synced by another process
+    """
+    try:
+        with cache_based_lock(
+            f'clickhouse_resync_shard_{shard_id}', timeout=24 * 3600, blocking_timeout=1
+        ):
+            try:
+                shard = ClickhouseResyncShard.objects.get(pk=shard_id)
+            except ClickhouseResyncShard.DoesNotExist:
+                # the resync was restarted in the meantime
+                return 0
+            return sync_clickhouse_resync_shard(shard)
+    except LockError:
+        logger.info('Resync shard #%d is already being processed', shard_id)
+        return 0
 
 
 @needs_clickhouse_sync
@@ -163,6 +265,16 @@ def delete_import_batch_from_clickhouse(import_batch_id: int):
     # the ImportBatch has been deleted from postgres and the only thing we can do is to perform
     # the removal of data in clickhouse as well
     try:
+        # the import batch is not in the database anymore, so we get its attributes
+        # from clickhouse in order to invalidate the slicer cache
+        cache_attrs = [
+            (rec.report_type_id, rec.organization_id, rec.platform_id)
+            for rec in ch_backend.get_records(
+                AccessLogCube.query()
+                .filter(import_batch_id=import_batch_id)
+                .group_by('report_type_id', 'organization_id', 'platform_id')
+            )
+        ]
         AccessLogCube.delete_import_batch(ch_backend, import_batch_id)
     except Exception as exc:
         # we need to keep the exception in a different variable as exc will get out of scope
@@ -179,6 +291,14 @@ def delete_import_batch_from_clickhouse(import_batch_id: int):
         # delete the sync log - it is not of any use anymore
         sync_log.delete()
 
+        def invalidate():
+            from .reporting.cache import invalidate_slicer_cache_for_import_batch
+
+            for attrs in cache_attrs:
+                invalidate_slicer_cache_for_import_batch(*attrs)
+
+        on_commit(invalidate)
+
 
 @needs_clickhouse_sync
 @atomic()
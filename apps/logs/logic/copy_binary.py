@@ -0,0 +1,144 @@
+"""
+Ingestion of AccessLog data using the binary format of the PostgreSQL COPY command.
+
+Compared to the CSV based ingestion through `IBCopyMapping`, the values are not converted
+to text and parsed back by the database and the data go directly into the AccessLog table
+without a round trip through a temporary table.
+"""
+import struct
+from datetime import date, datetime, timedelta, timezone
+from typing import Generator, Iterable, List, Optional, Sequence
+
+from core.models import UL_ROBOT
+from django.db import connection
+from django.utils.timezone import now
+
+from ..models import AccessLog, ImportBatch
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+PGCOPY_NULL = struct.pack('>i', -1)
+PG_EPOCH_DATE = date(2000, 1, 1)
+PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+# struct formats of the supported integer types
+INT_FORMATS = {'integer': 'i', 'serial': 'i', 'smallint': 'h', 'bigint': 'q'}
+
+
+def encode_value(db_type: str, value) -> bytes:
+    """
+    Encodes one value into the binary COPY format including its length
+    """
+    if value is None:
+        return PGCOPY_NULL
+    if db_type == 'date':
+        if isinstance(value, str):
+            value = date.fromisoformat(value)
+        value = (value - PG_EPOCH_DATE).days
+        fmt = 'i'
+    elif db_type.startswith('timestamp'):
+        value = (value - PG_EPOCH) // timedelta(microseconds=1)
+        fmt = 'q'
+    else:
+        fmt = INT_FORMATS[db_type]
+    return struct.pack(f'>i{fmt}', struct.calcsize(fmt), value)
+
+
+class BinaryStream:
+    """
+    Read-only file-like object which serves bytes from an iterable of byte chunks on demand
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def readable(self):
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self._chunks = iter(())
+
+
+class AccessLogBinaryCopy:
+    """
+    Writes rows for one import batch into the AccessLog table using `COPY ... (FORMAT binary)`.
+
+    Only the `columns` (which must be integer columns) are expected in the rows, the values
+    which are the same for the whole import batch are encoded only once.
+    """
+
+    def __init__(self, import_batch: ImportBatch, columns: Sequence[str]):
+        self.import_batch = import_batch
+        self.columns = list(columns)
+        for column in self.columns:
+            if self._db_type(column) not in INT_FORMATS:
+                raise ValueError(f'Column "{column}" is not an integer column')
+        self.static_values = {
+            'created': now(),
+            'owner_level': UL_ROBOT,
+            'import_batch_id': import_batch.pk,
+            'date': import_batch.date,
+            'platform_id': import_batch.platform_id,
+            'report_type_id': import_batch.report_type_id,
+            'organization_id': import_batch.organization_id,
+        }
+        self._static_part = b''.join(
+            encode_value(self._db_type(column), value)
+            for column, value in self.static_values.items()
+        )
+        self._field_count = struct.pack('>h', len(self.columns) + len(self.static_values))
+
+    @staticmethod
+    def _db_type(column: str) -> str:
+        # `get_field` also accepts attnames, such as `metric_id`
+        return AccessLog._meta.get_field(column).db_type(connection)
+
+    def encode_rows(self, rows: Iterable[Sequence[Optional[int]]]) -> Generator[bytes, None, None]:
+        yield PGCOPY_HEADER
+        int_field = struct.Struct('>ii').pack
+        prefix = self._field_count
+        suffix = self._static_part
+        for row in rows:
+            yield b''.join(
+                [prefix]
+                + [PGCOPY_NULL if value is None else int_field(4, value) for value in row]
+                + [suffix]
+            )
+        yield PGCOPY_TRAILER
+
+    def copy_sql(self) -> str:
+        column_names = ', '.join(
+            f'"{AccessLog._meta.get_field(column).column}"'
+            for column in self.columns + list(self.static_values)
+        )
+        return f'COPY "{AccessLog._meta.db_table}" ({column_names}) FROM STDIN WITH (FORMAT binary)'
+
+    def copy(self, rows: Iterable[Sequence[Optional[int]]]) -> int:
+        """
+        Ingests the rows and returns the number of inserted records
+        """
+        with connection.cursor() as cursor:
+            cursor.copy_expert(self.copy_sql(), BinaryStream(self.encode_rows(rows)))
+            return cursor.rowcount
+
+
+def ingest_import_batch_data_binary(
+    import_batch: ImportBatch, columns: List[str], rows: Iterable[Sequence[Optional[int]]]
+) -> int:
+    """
+    Ingests `rows` with values for `columns` for the import batch into the AccessLog table
+    """
+    return AccessLogBinaryCopy(import_batch, columns).copy(rows)
@@ -1,17 +1,22 @@
 import csv
 import gc
+import heapq
 import logging
+import pickle
+import tempfile
 from collections import Counter
 from dataclasses import dataclass, field
 from datetime import date
-from io import StringIO
-from typing import Dict, Generator, Iterable, List, Optional, Set, Union
+from functools import partial
+from itertools import chain
+from typing import Dict, Generator, Iterable, List, Optional, Set, TextIO, Tuple, Union
 
 from celus_nigiri.counter5 import CounterRecord
 from core.logic.debug import log_memory
 from core.models import UL_ROBOT
 from core.task_support import cache_based_lock
 from django.conf import settings
+from django.core.cache import cache as django_cache
 from django.db.models.functions import Lower
 from django.db.transaction import atomic, on_commit
 from django.utils.timezone import now
@@ -23,10 +28,12 @@ from publications.models import Platform, PlatformTitle, Title
 
 from ..exceptions import DataStructureError, UnknownMetric, UnsupportedMetric
 from ..models import AccessLog, DimensionText, Metric, ReportType
+from .copy_binary import ingest_import_batch_data_binary
 
 logger = logging.getLogger(__name__)
 
 COUNTER_RECORD_BUFFER_SIZE = settings.COUNTER_RECORD_BUFFER_SIZE
+COUNTER_RECORD_AGGREGATION_LIMIT = settings.COUNTER_RECORD_AGGREGATION_LIMIT
 
 
 def get_or_create_with_map(model, mapping, attr_name, attr_value, other_attrs=None) -> int:
@@ -100,6 +107,209 @@ class Cache(dict):
         return result
 
 
+class LRUCache(Cache):
+    """
+    Cache with limited size which evicts the least recently used items when it is full
+    """
+
+    def __init__(self, max_size: int, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_size = max_size
+
+    def peek(self, key):
+        """
+        Returns the value (or None) without influencing the stats and the order of items
+        """
+        return dict.get(self, key)
+
+    def __getitem__(self, key):
+        # move the item to the end - it is the most recently used one now
+        value = dict.pop(self, key)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def __setitem__(self, key, value):
+        if dict.__contains__(self, key):
+            dict.__delitem__(self, key)
+        elif len(self) >= self.max_size:
+            # the first item is the least recently used one
+            dict.__delitem__(self, next(iter(self)))
+        dict.__setitem__(self, key, value)
+
+
+class SharedTitleCache:
+    """
+    Process-wide cache mapping title records to title IDs which survives between imports.
+
+    All the processes share a generation number stored in the Django cache. It is increased
+    when titles are merged or deleted and the local cache is cleared when the generation changes.
+    """
+
+    generation_key = 'shared_title_cache_generation'
+
+    def __init__(self, max_size: int):
+        self.cache = LRUCache(max_size)
+        self.generation = None
+
+    @classmethod
+    def key_for_record(cls, record: TitleRec) -> tuple:
+        return (
+            record.name.lower(),
+            frozenset(record.ids_to_set()),
+            frozenset(record.proprietary_ids),
+            record.pub_type,
+            record.uri,
+        )
+
+    def sync(self):
+        """
+        Clears the cache if titles were merged or deleted since the last sync
+        """
+        generation = django_cache.get(self.generation_key, 0)
+        if generation != self.generation:
+            if self.generation is not None:
+                logger.debug('Title cache generation changed - clearing %d items', len(self.cache))
+            self.cache.clear()
+            self.generation = generation
+
+    def update(self, data: Dict[tuple, int]):
+        for key, value in data.items():
+            self.cache[key] = value
+
+    @classmethod
+    def invalidate(cls):
+        """
+        Invalidates the cache in all processes
+        """
+        django_cache.add(cls.generation_key, 0, None)
+        try:
+            django_cache.incr(cls.generation_key)
+        except ValueError:
+            # the key was removed in the meantime
+            django_cache.set(cls.generation_key, 1, None)
+        shared_title_cache.cache.clear()
+
+
+shared_title_cache = SharedTitleCache(max_size=settings.SHARED_TITLE_CACHE_SIZE)
+
+
+class SpillingAggregator:
+    """
+    Sums values for records with the same key while keeping at most `max_keys` keys in memory.
+    When the limit is reached, the data are sorted and spilled into a temporary file (a run).
+    `items` then merges all the runs with the in-memory data, so that each key is yielded
+    exactly once.
+
+    The keys are expected to be tuples of ints or None values (which are sorted as 0).
+    """
+
+    def __init__(self, max_keys: int = COUNTER_RECORD_AGGREGATION_LIMIT, chunk_size: int = 10_000):
+        self.max_keys = max_keys
+        self.chunk_size = chunk_size
+        self._data = {}
+        self._runs = []
+
+    @property
+    def spill_count(self) -> int:
+        return len(self._runs)
+
+    def add(self, key: tuple, value: int):
+        if key in self._data:
+            self._data[key] += value
+        else:
+            self._data[key] = value
+            if len(self._data) >= self.max_keys:
+                self._spill()
+
+    @staticmethod
+    def _sort_key(item):
+        return tuple(0 if part is None else part for part in item[0])
+
+    def _spill(self):
+        run = tempfile.TemporaryFile()
+        items = sorted(self._data.items(), key=self._sort_key)
+        for start in range(0, len(items), self.chunk_size):
+            end = start + self.chunk_size
+            pickle.dump(items[start:end], run, pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self._runs.append(run)
+        self._data = {}
+        logger.debug('Spilled %d keys into run #%d', len(items), len(self._runs))
+
+    @staticmethod
+    def _read_run(run):
+        while True:
+            try:
+                chunk = pickle.load(run)
+            except EOFError:
+                return
+            yield from chunk
+
+    def items(self) -> Generator[Tuple[tuple, int], None, None]:
+        if not self._runs:
+            yield from self._data.items()
+            return
+        merged = heapq.merge(
+            sorted(self._data.items(), key=self._sort_key),
+            *(self._read_run(run) for run in self._runs),
+            key=self._sort_key,
+        )
+        last_key, last_value = next(merged)
+        for key, value in merged:
+            if key == last_key:
+                last_value += value
+            else:
+                yield last_key, last_value
+                last_key, last_value = key, value
+        yield last_key, last_value
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._data = {}
+
+
+class CSVStream:
+    """
+    Read-only file-like object which renders rows from an iterable into CSV on demand.
+    It makes it possible to stream data into `COPY FROM STDIN` without having the whole
+    CSV in memory.
+    """
+
+    class _Collector(list):
+        write = list.append
+
+    def __init__(self, rows: Iterable[Iterable]):
+        self._rows = iter(rows)
+        self._collector = self._Collector()
+        self._writer = csv.writer(self._collector)
+        self._length = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or self._length < size:
+            try:
+                self._writer.writerow(next(self._rows))
+            except StopIteration:
+                break
+            self._length += len(self._collector[-1])
+        data = ''.join(self._collector)
+        self._collector.clear()
+        self._length = 0
+        if 0 <= size < len(data):
+            # keep the rest for the next read
+            data, rest = data[:size], data[size:]
+            self._collector.append(rest)
+            self._length = len(rest)
+        return data
+
+    def close(self):
+        self._rows = iter(())
+
+
 def get_or_create_metric(mapping, value, controlled_metrics: List[str] = None) -> int:
     # already in mapping
     if record := mapping.get(value):
@@ -130,9 +340,11 @@ def get_or_create_metric(mapping, value, controlled_metrics: List[str] = None) -
 class TitleManager:
     id_attrs = ('isbn', 'issn', 'eissn', 'doi')
 
-    def __init__(self):
+    def __init__(self, shared_cache: Optional[SharedTitleCache] = None):
         self.name_to_records: Dict[str, List[TitleCompareRec]] = {}
         self._prefetch_done = False
+        # normalized names for which titles were already loaded from the database
+        self._prefetched_names: Set[str] = set()
         self.stats = Counter()
         # below we cache the incoming name and ids and map them to the TitleRecord to speed up
         # processing. We similarly cache the TitleRecord -> Title conversion
@@ -144,6 +356,11 @@ class TitleManager:
         # one title, such as when a TR report with YOP and other dimensions is imported
         self._counter_rec_to_title_rec_cache = Cache()
         self._title_rec_to_title_cache = Cache()
+        # the shared cache is used for titles resolved by previous imports in this process.
+        # Titles resolved here are only added to it by `publish_to_shared_cache` after commit
+        # because titles created in this transaction would not exist if it was rolled back
+        self.shared_cache = shared_cache
+        self._resolved_titles: Dict[tuple, int] = {}
 
     @classmethod
     def normalize_title(cls, name: str) -> str:
@@ -161,10 +378,27 @@ class TitleManager:
         return ret
 
     def prefetch_titles(self, records: [TitleRec]):
-        title_qs = Title.objects.all()
-        names = [self.normalize_title(rec.name) if rec.name else rec.name for rec in records]
-        title_qs = title_qs.annotate(lname=Lower('name')).filter(lname__in=names)
+        if self.shared_cache:
+            # titles from the shared cache are resolved without looking into the database
+            records = [
+                rec
+                for rec in records
+                if not rec.name
+                or self.shared_cache.cache.peek(self.shared_cache.key_for_record(rec)) is None
+            ]
+        names = {self.normalize_title(rec.name) if rec.name else rec.name for rec in records}
         self.name_to_records = {}
+        self._prefetched_names = set()
+        self._fetch_titles(names)
+        self._prefetch_done = True
+        logger.debug('Prefetched %d records', len(self.name_to_records))
+
+    def _fetch_titles(self, names: Set[str]):
+        """
+        Loads titles with given normalized names into `name_to_records`. The `lname` lookup
+        uses the `lower(name)` index on the title table.
+        """
+        title_qs = Title.objects.annotate(lname=Lower('name')).filter(lname__in=names)
         for row in title_qs.order_by('name').values(
             'name', 'isbn', 'issn', 'eissn', 'doi', 'pk', 'pub_type', 'proprietary_ids', 'uris'
         ):
@@ -181,8 +415,7 @@ class TitleManager:
                     proprietary_ids=row['proprietary_ids'],
                 )
             )
-        self._prefetch_done = True
-        logger.debug('Prefetched %d records', len(self.name_to_records))
+        self._prefetched_names |= names
 
     @classmethod
     def title_to_titlecomparerec(cls, title: Title) -> TitleCompareRec:
@@ -241,8 +474,34 @@ class TitleManager:
             self.stats['existing'] += 1
             return self._title_rec_to_title_cache[cache_key]
 
-        # make sure that `prefetch_titles` was called at least for this record
-        if not self.name_to_records:
+        if self.shared_cache:
+            shared_key = self.shared_cache.key_for_record(record)
+            if shared_key in self.shared_cache.cache:
+                self.stats['existing'] += 1
+                title_pk = self.shared_cache.cache[shared_key]
+                self._title_rec_to_title_cache[cache_key] = title_pk
+                return title_pk
+
+        title_pk = self._get_or_create(record, cache_key)
+        if self.shared_cache:
+            # after `_get_or_create` the title contains all the data from the record,
+            # so the same record will resolve to it without any change
+            self._resolved_titles[shared_key] = title_pk
+        return title_pk
+
+    def publish_to_shared_cache(self):
+        """
+        Adds titles resolved by this manager to the shared cache once the current transaction
+        is committed
+        """
+        if self.shared_cache and self._resolved_titles:
+            resolved, self._resolved_titles = self._resolved_titles, {}
+            on_commit(partial(self.shared_cache.update, resolved))
+
+    def _get_or_create(self, record: TitleRec, cache_key: int) -> int:
+        # make sure that `prefetch_titles` was called - titles for records which were not
+        # prefetched are loaded by `find_matching_title` one name at a time
+        if not self._prefetch_done:
             self.prefetch_titles([record])
 
         winner = self.find_matching_title(record)
@@ -316,6 +575,9 @@ class TitleManager:
     def find_matching_title(self, record: TitleRec) -> Optional[TitleCompareRec]:
         if not self._prefetch_done:
             raise ValueError('.prefetch_titles was not done - you must do it before calling this')
+        if (name := self.normalize_title(record.name)) not in self._prefetched_names:
+            self.stats['name lookup'] += 1
+            self._fetch_titles({name})
         candidates = self.name_to_records.get(record.name.lower(), [])
         if candidates:
             return self.select_best_candidate(record, candidates)
@@ -466,21 +728,28 @@ def import_counter_records(
     import_batch_kwargs: Optional[dict] = None,
     skip_clickhouse_sync: bool = False,
     buffer_size: int = COUNTER_RECORD_BUFFER_SIZE,
+    aggregation_limit: int = COUNTER_RECORD_AGGREGATION_LIMIT,
 ) -> ([ImportBatch], Counter):
     """
     If `months` are given, then only import data for the months listed in there, skip others.
     Months are given as strings in ISO format.
+    `aggregation_limit` is the max number of distinct records per import batch kept in memory
+    before they are spilled to disk.
     """
     stats = Counter()
-    tm = TitleManager()
+    if settings.SHARED_TITLE_CACHE_SIZE:
+        shared_title_cache.sync()
+        tm = TitleManager(shared_cache=shared_title_cache)
+    else:
+        tm = TitleManager()
     # mapping of months to import batches - has to be shared between calls to
     # _import_counter_record so that the same import batches are used for all data
     month_to_ib = {}
     # the following accumulates values to be inserted later on
-    # the data there are not subject to splitting to buffers because they are relatively
-    # small anyway
-    ib_id_to_key_to_value = {}
-    # the key in the above dict of dicts will be as follows:
+    # the aggregators merge records with the same key and spill data to disk when there is
+    # too much of it, so that memory consumption is bounded even for very large files
+    ib_id_to_aggregator: Dict[int, SpillingAggregator] = {}
+    # the keys in the aggregators will be as follows:
     ib_id_to_key_structure = ['metric_id', 'target_id'] + [
         f'dim{i+1}' for i, dim in enumerate(report_type.dimensions_sorted)
     ]
@@ -506,57 +775,58 @@ def import_counter_records(
                     report_type, organization, platform, month, ib_kwargs=import_batch_kwargs
                 )
         for ib in month_to_ib.values():
-            if ib.pk not in ib_id_to_key_to_value:
-                ib_id_to_key_to_value[ib.pk] = {}
+            if ib.pk not in ib_id_to_aggregator:
+                ib_id_to_aggregator[ib.pk] = SpillingAggregator(max_keys=aggregation_limit)
         return _preprocess_counter_records(
             report_type,
             record_batch,
             stats,
             tm,
             month_to_ib,
-            ib_id_to_key_to_value,
+            ib_id_to_aggregator,
             ib_id_to_key_structure,
         )
 
-    buff: List[CounterRecord] = []
-    for record in records:
-        # check months and skip early to avoid extra work on multi-month files
-        if (
-            months
-            and (record.start.isoformat() if isinstance(record.start, date) else record.start)
-            not in months
-        ):
-            continue
-
-        buff.append(record)
-        if len(buff) >= buffer_size:
+    try:
+        buff: List[CounterRecord] = []
+        for record in records:
+            # check months and skip early to avoid extra work on multi-month files
+            if (
+                months
+                and (record.start.isoformat() if isinstance(record.start, date) else record.start)
+                not in months
+            ):
+                continue
+
+            buff.append(record)
+            if len(buff) >= buffer_size:
+                process_buffer(buff)
+                buff = []
+                gc.collect()
+
+        # flush the rest of the buffer
+        if buff:
             process_buffer(buff)
-            buff = []
-            gc.collect()
-
-    # flush the rest of the buffer
-    if buff:
-        process_buffer(buff)
-
-    # after this, the ib_id_to_key_to_value is full and we can process it
-    import_batches = list(month_to_ib.values())
-    for ib in import_batches:
-        csv_data = StringIO()
-        writer = csv.writer(csv_data)
-        target_ids = set()
-        for i, (key, value) in enumerate(ib_id_to_key_to_value[ib.pk].items()):
-            rec = dict(zip(ib_id_to_key_structure, key))
-            rec['value'] = value
-            if rec['target_id']:
-                target_ids.add(rec['target_id'])
-            if i == 0:
-                # write the CSV header
-                writer.writerow(list(sorted(rec.keys())))
-            writer.writerow([v for k, v in sorted(rec.items())])
-            stats['new logs'] += 1
-        ingest_import_batch_data(ib, csv_data)
-        # and insert the PlatformTitle links
-        stats += create_platformtitle_links_from_import_batch(ib, target_ids)
+
+        # after this, the aggregators are full and we can stream their content into the db
+        import_batches = list(month_to_ib.values())
+        columns = sorted(ib_id_to_key_structure + ['value'])
+        for ib in import_batches:
+            aggregator = ib_id_to_aggregator[ib.pk]
+            target_ids = set()
+            rows = _aggregated_rows(aggregator, ib_id_to_key_structure, columns, target_ids, stats)
+            if settings.ACCESSLOG_INGEST_FORMAT == 'binary':
+                ingest_import_batch_data_binary(ib, columns, rows)
+            else:
+                ingest_import_batch_data(ib, CSVStream(chain([columns], rows)), headers=columns)
+            if aggregator.spill_count:
+                logger.info('Import batch #%d spilled %d runs', ib.pk, aggregator.spill_count)
+            aggregator.close()
+            # and insert the PlatformTitle links
+            stats += create_platformtitle_links_from_import_batch(ib, target_ids)
+    finally:
+        for aggregator in ib_id_to_aggregator.values():
+            aggregator.close()
 
     log_memory('XX3')
 
@@ -572,7 +842,11 @@ def import_counter_records(
                 )
 
         on_commit(sync_with_clickhouse)
-    for i, cache in enumerate([tm._counter_rec_to_title_rec_cache, tm._title_rec_to_title_cache]):
+    tm.publish_to_shared_cache()
+    caches = [tm._counter_rec_to_title_rec_cache, tm._title_rec_to_title_cache]
+    if tm.shared_cache:
+        caches.append(tm.shared_cache.cache)
+    for i, cache in enumerate(caches):
         logger.info(
             f'Title manager: step #{i+1} cache hits: {cache._hits}, misses: {cache._misses}, '
             f'size: {len(cache)}'
@@ -621,7 +895,7 @@ def _preprocess_counter_records(
     stats: Counter,
     tm: TitleManager,
     month_to_import_batch: Dict[str, ImportBatch],
-    ib_id_to_key_to_value: Dict[int, Dict],
+    ib_id_to_aggregator: Dict[int, SpillingAggregator],
     ib_id_to_key_structure: list,
 ):
     # prepare controlled metrics filtering
@@ -674,14 +948,31 @@ def _preprocess_counter_records(
         # here we detect possible duplicated keys and merge matching records
         key = tuple(id_attrs[k] for k in ib_id_to_key_structure)
         # we prepare the data to insert already split by individual import batch
-        to_insert = ib_id_to_key_to_value[import_batch.pk]
-        if key in to_insert:
-            to_insert[key] += record.value
-        else:
-            to_insert[key] = record.value
+        ib_id_to_aggregator[import_batch.pk].add(key, record.value)
     logger.info('Title statistics: %s', tm.stats)
 
 
+def _aggregated_rows(
+    aggregator: SpillingAggregator,
+    key_structure: List[str],
+    columns: List[str],
+    target_ids: Set[int],
+    stats: Counter,
+) -> Generator[list, None, None]:
+    """
+    Yields rows with the aggregated data with values in the order given by `columns`.
+    IDs of all titles are collected into `target_ids` on the way.
+    """
+    order = [(key_structure + ['value']).index(column) for column in columns]
+    target_idx = key_structure.index('target_id')
+    for key, value in aggregator.items():
+        if key[target_idx]:
+            target_ids.add(key[target_idx])
+        row = key + (value,)
+        stats['new logs'] += 1
+        yield [row[i] for i in order]
+
+
 def create_platformtitle_links_from_import_batch(import_batch: ImportBatch, target_ids: Set[int]):
     """
     Based on the platform and organization from the import_batch and a list of unique
@@ -739,25 +1030,39 @@ class IBCopyMapping(CopyMapping):
     The original CopyMapping is not thread-safe as it always uses the same temporary
     table. This version uses a table name dependent on the import batch ID, which should
     be safe enough for our use case.
+
+    When `headers` are given, they are not read from the CSV file, so the file does not need
+    to be seekable and may be a stream (the header line must still be present in the data).
     """
 
-    def __init__(self, model, csv_path_or_obj, ib_id, **kwargs):
+    def __init__(self, model, csv_path_or_obj, ib_id, headers=None, **kwargs):
+        self._known_headers = headers
         # the third argument is mapping, which is detected automatically from the CSV
         # header, so we just pass an empty dict here
         super().__init__(model, csv_path_or_obj, {}, **kwargs)
         self.temp_table_name = f"{self.temp_table_name}_{ib_id}"
 
+    def get_headers(self):
+        if self._known_headers is not None:
+            return list(self._known_headers)
+        return super().get_headers()
 
-def ingest_import_batch_data(import_batch: ImportBatch, file_content: StringIO):
+
+def ingest_import_batch_data(
+    import_batch: ImportBatch, file_content: TextIO, headers: Optional[List[str]] = None
+):
     """
     Look for a CSV file with the preprocessed data to be ingested into the AccessLog table.
+    If `headers` are not given, `file_content` must be seekable as the headers are read from it.
     """
     log_memory('XX6')
-    file_content.seek(0)
+    if headers is None:
+        file_content.seek(0)
     c = IBCopyMapping(
         AccessLog,
         file_content,
         import_batch.pk,
+        headers=headers,
         static_mapping={
             'created': now(),
             'owner_level': UL_ROBOT,
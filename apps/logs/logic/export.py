@@ -2,8 +2,9 @@ import codecs
 import csv
 import logging
 import os
+from itertools import islice
 from time import monotonic
-from typing import IO
+from typing import IO, Dict, List
 from zipfile import ZIP_DEFLATED, ZipFile
 
 from cachalot.api import cachalot_disabled
@@ -12,7 +13,14 @@ from django.core.cache import cache
 from django.db.models import QuerySet
 from django.utils.timezone import now
 
-from ..models import AccessLog, DimensionText, ReportType
+from ..models import AccessLog, Dimension, DimensionText, ReportType
+from .export_utils import (
+    COLUMNAR_ARROW,
+    COLUMNAR_PARQUET,
+    ColumnarWriter,
+    DictionaryEncoder,
+    arrow_text_type,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +37,10 @@ class CSVExport:
     }
     title_attrs = ['isbn', 'issn', 'eissn']
     outdir = 'export'
+    # number of rows fetched from the server side cursor at once
+    chunk_size = 10_000
+    # minimal number of seconds between two updates of the stored progress
+    progress_interval = 2.0
 
     def __init__(self, query_params: dict, zip_compress: bool = False, filename_base=None):
         self.query_params = query_params
@@ -37,6 +49,8 @@ class CSVExport:
             self.filename_base = filename_base
         else:
             self.filename_base = self.create_filename_base()
+        self._last_progress_time = None
+        self._dimension_texts = {}
 
     def create_filename_base(self) -> str:
         ts = now().strftime('%Y%m%d-%H%M%S.%f')
@@ -90,55 +104,212 @@ class CSVExport:
 
     def store_progress(self, value):
         cache.set(self.filename_base, value)
+        self._last_progress_time = monotonic()
 
-    def export_raw_accesslogs_to_stream_lowlevel(self, stream: IO, queryset: QuerySet):
-        start = monotonic()
-        text_id_to_text = {
-            dt['id']: dt['text'] for dt in DimensionText.objects.all().values('id', 'text')
+    def report_progress(self, value):
+        """
+        Stores the progress if it was not stored in the last `progress_interval` seconds
+        """
+        if (
+            self._last_progress_time is None
+            or monotonic() - self._last_progress_time >= self.progress_interval
+        ):
+            self.store_progress(value)
+            logger.debug('Stored %d records', value)
+
+    def dimension_texts(self, dimension: Dimension) -> Dict[int, str]:
+        """
+        Returns mapping between ids of texts of `dimension` and the texts. The texts are loaded
+        when first needed, so only dimensions of exported report types are loaded.
+        """
+        if dimension.pk not in self._dimension_texts:
+            self._dimension_texts[dimension.pk] = dict(
+                DimensionText.objects.filter(dimension=dimension).values_list('id', 'text')
+            )
+        return self._dimension_texts[dimension.pk]
+
+    @classmethod
+    def implicit_field_map(cls) -> Dict[str, str]:
+        """
+        Mapping between attributes retrieved from the accesslogs and the output field names
+        """
+        field_name_map = {
+            (f'{dim}__{attr}' if attr else dim): dim for dim, attr in cls.implicit_dims.items()
         }
-        logger.debug('Finished loading text remaps: %.2f s', monotonic() - start)
-        rt_to_dimensions = {
+        field_name_map.update({f'target__{attr}': attr for attr in cls.title_attrs})
+        return field_name_map
+
+    @classmethod
+    def report_type_dimensions(cls, queryset: QuerySet) -> Dict[int, List[Dimension]]:
+        return {
             rt.pk: rt.dimensions_sorted
             for rt in ReportType.objects.filter(
                 pk__in=queryset.distinct('report_type_id').values('report_type_id')
             )
         }
+
+    def export_raw_accesslogs_to_stream_lowlevel(self, stream: IO, queryset: QuerySet):
+        """
+        Writes the accesslogs from `queryset` into `stream` as CSV.
+
+        Records are fetched as tuples using a server side cursor. The values of explicit
+        dimensions are moved to columns according to the layout of the report type of each
+        record, which is prepared when the report type is first encountered.
+        """
+        start = monotonic()
+        rt_to_dimensions = self.report_type_dimensions(queryset)
         logger.debug('Finished loading report_types and dimensions: %.2f s', monotonic() - start)
         # get all field names for the CSV
-        field_name_map = {
-            (f'{dim}__{attr}' if attr else dim): dim for dim, attr in self.implicit_dims.items()
-        }
-        field_name_map.update({f'target__{attr}': attr for attr in self.title_attrs})
+        field_name_map = self.implicit_field_map()
         field_names = list(field_name_map.values())
         for tr, dims in rt_to_dimensions.items():
             field_names += [dim.short_name for dim in dims if dim.short_name not in field_names]
         field_names.append('value')
-        logger.debug('Finished preparing field names: %.2f s', monotonic() - start)
         # values that will be retrieved from the accesslogs
-        values = ['value', 'report_type_id']
-        values += list(field_name_map.keys())
+        values = list(field_name_map.keys())
+        values += ['value', 'report_type_id']
         values += [f'dim{i+1}' for i in range(7)]
-        # crate the writer
-        writer = csv.DictWriter(stream, field_names)
-        writer.writeheader()
+        implicit_count = len(field_name_map)
+        rt_index = implicit_count + 1
+        # the row starts with implicit dimensions, explicit ones are filled in later
+        dim_padding = (len(field_names) - implicit_count - 1) * ['']
+        # for each report type, a list of (index in record, index in output row, text remap)
+        rt_layouts = {}
+
+        def layout_for_report_type(rt_id):
+            layout = rt_layouts.get(rt_id)
+            if layout is None:
+                layout = rt_layouts[rt_id] = [
+                    (rt_index + 1 + i, field_names.index(dim.short_name), self.dimension_texts(dim))
+                    for i, dim in enumerate(rt_to_dimensions[rt_id])
+                ]
+            return layout
+
+        writer = csv.writer(stream)
+        writer.writerow(field_names)
         logger.debug('Finished preparing CSV writer: %.2f s', monotonic() - start)
         # write the records
         rec_num = 0
+        self.store_progress(0)
+        with cachalot_disabled(True):
+            # disable cachalot for this query because it returns a potentially huge number of records
+            # and would clog the cache
+            data = queryset.values_list(*values).iterator(chunk_size=self.chunk_size)
+            for rec_num, rec in enumerate(data, 1):
+                row = [*rec[:implicit_count], *dim_padding, rec[implicit_count]]
+                for index_in, index_out, remap in layout_for_report_type(rec[rt_index]):
+                    value = rec[index_in]
+                    row[index_out] = remap.get(value, value)
+                writer.writerow(row)
+                if rec_num % 1000 == 0:
+                    self.report_progress(rec_num)
+        self.store_progress(rec_num)
+        logger.debug('Stored %d records: %.2f s', rec_num, monotonic() - start)
+
+
+class ArrowExport(CSVExport):
+
+    """
+    Exports raw data into a Parquet file or an Arrow IPC stream.
+
+    Records are fetched from the database as tuples and written in record batches, texts
+    (names of implicit dimensions and texts of explicit dimensions) are dictionary encoded.
+    """
+
+    file_extensions = {COLUMNAR_PARQUET: 'parquet', COLUMNAR_ARROW: 'arrows'}
+    batch_size = 50_000
+
+    def __init__(self, query_params: dict, fmt: str = COLUMNAR_PARQUET, filename_base=None):
+        if fmt not in self.file_extensions:
+            raise ValueError(f'Unsupported format: {fmt}')
+        super().__init__(query_params, filename_base=filename_base)
+        self.fmt = fmt
+
+    @property
+    def filename(self) -> str:
+        return os.path.join(self.outdir, f'{self.filename_base}.{self.file_extensions[self.fmt]}')
+
+    def export_raw_accesslogs_to_file(self):
+        self.create_outdir()
+        with open(self.file_path, 'wb') as outfile:
+            self.export_raw_accesslogs_to_sink(outfile, queryset=self.create_queryset())
+
+    def export_raw_accesslogs_to_sink(self, sink: IO, queryset: QuerySet):
+        import pyarrow as pa
+
+        start = monotonic()
+        rt_to_dimensions = self.report_type_dimensions(queryset)
+        field_name_map = self.implicit_field_map()
+        # explicit dimensions are stored in columns named by the dimension, unless the name is
+        # already used by an implicit dimension
+        implicit_names = set(field_name_map.values())
+        dim_names = []
+        # indices of output dimension columns for dim1, dim2, ... of each report type
+        rt_to_dim_columns = {}
+        for rt_id, dims in rt_to_dimensions.items():
+            rt_to_dim_columns[rt_id] = []
+            for dim in dims:
+                name = dim.short_name
+                if name in implicit_names:
+                    name = f'{name}_dim'
+                if name not in dim_names:
+                    dim_names.append(name)
+                rt_to_dim_columns[rt_id].append(dim_names.index(name))
+        logger.debug('Finished preparing fields: %.2f s', monotonic() - start)
+
+        schema_fields = []
+        implicit_encoders = {}
+        for attr_in, attr_out in field_name_map.items():
+            if attr_out == 'date':
+                schema_fields.append(pa.field(attr_out, pa.date32()))
+            elif attr_out in self.title_attrs:
+                schema_fields.append(pa.field(attr_out, pa.string()))
+            else:
+                schema_fields.append(pa.field(attr_out, arrow_text_type()))
+                implicit_encoders[attr_out] = DictionaryEncoder()
+        schema_fields += [pa.field(name, arrow_text_type()) for name in dim_names]
+        schema_fields.append(pa.field('value', pa.int64()))
+        writer = ColumnarWriter(sink, pa.schema(schema_fields), fmt=self.fmt)
+        # texts of all dimensions stored in a column - dimensions of different sources may
+        # share the same name
+        dim_remaps = [{} for _name in dim_names]
+        for rt_id, dims in rt_to_dimensions.items():
+            for dim, column_idx in zip(dims, rt_to_dim_columns[rt_id]):
+                dim_remaps[column_idx].update(self.dimension_texts(dim))
+        dim_encoders = [DictionaryEncoder(remap=remap) for remap in dim_remaps]
+
+        values = list(field_name_map.keys()) + ['report_type_id']
+        values += [f'dim{i+1}' for i in range(7)]
+        values.append('value')
+        implicit_count = len(field_name_map)
+        rec_count = 0
         with cachalot_disabled(True):
             # disable cachalot for this query because it returns a potentially huge number of records
             # and would clog the cache
-            for rec_num, log in enumerate(queryset.values(*values).iterator()):  # type: int, dict
-                record = {
-                    attr_out: log.get(attr_in) for attr_in, attr_out in field_name_map.items()
-                }
-                record['value'] = log['value']
-                record['date'] = log['date']
-                for i, dim in enumerate(rt_to_dimensions[log['report_type_id']]):
-                    value = log.get(f'dim{i+1}')
-                    record[dim.short_name] = text_id_to_text.get(value, value)
-                writer.writerow(record)
-                if rec_num % 999 == 0:
-                    self.store_progress(rec_num + 1)
-                if rec_num % 99999 == 0:
-                    logger.debug('Stored %d records: %.2f s', rec_num, monotonic() - start)
-        self.store_progress(rec_num + 1)
+            data = queryset.values_list(*values).iterator(chunk_size=self.chunk_size)
+            while batch := list(islice(data, self.batch_size)):
+                columns = list(zip(*batch))
+                arrays = []
+                for attr_out, column in zip(field_name_map.values(), columns):
+                    if attr_out == 'date':
+                        arrays.append(pa.array(column, pa.date32()))
+                    elif attr_out in self.title_attrs:
+                        arrays.append(pa.array(column, pa.string()))
+                    else:
+                        arrays.append(implicit_encoders[attr_out].encode(column))
+                # explicit dimensions are moved to columns by their names
+                dim_columns = [len(batch) * [None] for _name in dim_names]
+                report_type_ids = columns[implicit_count]
+                for i, rt_id in enumerate(report_type_ids):
+                    for dim_idx, column_idx in enumerate(rt_to_dim_columns[rt_id]):
+                        dim_columns[column_idx][i] = columns[implicit_count + 1 + dim_idx][i]
+                arrays += [
+                    encoder.encode(column) for encoder, column in zip(dim_encoders, dim_columns)
+                ]
+                arrays.append(pa.array(columns[-1], pa.int64()))
+                writer.write_columns(arrays)
+                rec_count += len(batch)
+                self.report_progress(rec_count)
+        writer.close()
+        self.store_progress(rec_count)
+        logger.debug('Stored %d records: %.2f s', rec_count, monotonic() - start)
@@ -1,13 +1,34 @@
 import csv
+import json
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Union
+from typing import TYPE_CHECKING, Container, Iterable, List, Optional, Tuple, Union
 
 from xlsxwriter.worksheet import Worksheet
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+
 XSLX_COL_WIDTH_ADJ_RATIO = 0.75  # how to scale column width compared to the computed value
 XSLX_COL_WIDTH_ADJ_CONST = 2  # what to add to the scaled column width
 
 
+# formats supported by `ColumnarWriter`
+COLUMNAR_PARQUET = 'parquet'
+COLUMNAR_ARROW = 'arrow'
+
+
+def arrow_text_type() -> 'pa.DataType':
+    """
+    Type of dictionary encoded text columns in columnar exports.
+
+    pyarrow is imported only by the code producing columnar exports, so that it is not needed
+    by the rest of the application.
+    """
+    import pyarrow as pa
+
+    return pa.dictionary(pa.int32(), pa.string())
+
+
 def xslx_scale_column_width(width, max_col_width=60):
     return min(int(width * XSLX_COL_WIDTH_ADJ_RATIO) + XSLX_COL_WIDTH_ADJ_CONST, max_col_width)
 
@@ -139,3 +160,141 @@ class CSVListWriter(ListWriter):
 
     def writerow(self, values: list):
         self.writer.writerow(values)
+
+
+class CollectingListWriter(ListWriter):
+
+    """
+    ListWriter which stores the rows as lists of strings into a list given as `sink`
+    """
+
+    def writerow(self, values: list):
+        self.sink.append([str(value) for value in values])
+
+
+class DictionaryEncoder:
+
+    """
+    Dictionary encodes values of one column of a columnar export.
+
+    All record batches of the column share one dictionary which only grows, so Arrow IPC
+    streams may contain just the new values for each batch. Values may be translated to the
+    dictionary texts using `remap`, e.g. from ids of dimension texts.
+    """
+
+    def __init__(self, remap: Optional[dict] = None):
+        self.remap = remap or {}
+        self._indices = {}
+        self._texts = []
+        self._dictionary = None
+
+    def encode(self, values: Iterable) -> 'pa.DictionaryArray':
+        import pyarrow as pa
+
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            index = self._indices.get(value)
+            if index is None:
+                index = self._indices[value] = len(self._texts)
+                self._texts.append(str(self.remap.get(value, value)))
+            indices.append(index)
+        if self._dictionary is None or len(self._texts) != len(self._dictionary):
+            self._dictionary = pa.array(self._texts, pa.string())
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), self._dictionary)
+
+
+class ColumnarWriter:
+
+    """
+    Writes record batches into a Parquet file or an Arrow IPC stream
+    """
+
+    def __init__(self, sink, schema: 'pa.Schema', fmt: str = COLUMNAR_PARQUET):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.schema = schema
+        self.fmt = fmt
+        if fmt == COLUMNAR_PARQUET:
+            self._writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        elif fmt == COLUMNAR_ARROW:
+            options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+            self._writer = pa.ipc.new_stream(sink, schema, options=options)
+        else:
+            raise ValueError(f'Unsupported columnar format: {fmt}')
+
+    def write_columns(self, columns: List['pa.Array']):
+        import pyarrow as pa
+
+        batch = pa.RecordBatch.from_arrays(columns, schema=self.schema)
+        if self.fmt == COLUMNAR_PARQUET:
+            # each batch becomes one row group
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        self._writer.close()
+
+
+class ArrowDictWriter(DictWriter):
+
+    """
+    DictWriter producing Parquet or Arrow IPC output. Rows are collected and written in record
+    batches of `batch_size` rows. Fields from `numeric_fields` are stored as integers, all
+    others as dictionary encoded texts. `metadata` are stored in the schema as JSON.
+    """
+
+    def __init__(
+        self,
+        sink,
+        fields: List[Tuple[str, str]],
+        numeric_fields: Container[str] = (),
+        fmt: str = COLUMNAR_PARQUET,
+        metadata: Optional[dict] = None,
+        batch_size: int = 10_000,
+        **kwargs,
+    ):
+        import pyarrow as pa
+
+        super().__init__(sink, fields, **kwargs)
+        self.numeric_fields = numeric_fields
+        self.batch_size = batch_size
+        self.encoders = {
+            key: DictionaryEncoder() for key in self.field_order if key not in numeric_fields
+        }
+        schema = pa.schema(
+            [
+                pa.field(column, pa.int64() if key in numeric_fields else arrow_text_type())
+                for key, column in zip(self.field_order, self.columns)
+            ],
+            metadata={key: json.dumps(value) for key, value in (metadata or {}).items()},
+        )
+        self.writer = ColumnarWriter(sink, schema, fmt=fmt)
+        self._rows = []
+
+    def writerow(self, values: dict):
+        self._rows.append([values.get(key) for key in self.field_order])
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        import pyarrow as pa
+
+        if not self._rows:
+            return
+        columns = []
+        for key, column in zip(self.field_order, zip(*self._rows)):
+            if key in self.numeric_fields:
+                columns.append(pa.array(column, pa.int64()))
+            else:
+                columns.append(self.encoders[key].encode(column))
+        self.writer.write_columns(columns)
+        self._rows = []
+
+    def finalize(self):
+        self.flush()
+        self.writer.close()
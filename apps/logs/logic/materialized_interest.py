@@ -4,15 +4,26 @@ Stuff related to the artificial (materialized) report type 'interest' and its co
 import logging
 from collections import Counter
 from time import time
-from typing import Dict, Iterable, List, Set
+from typing import Dict, Iterable, List, Set, Tuple
 
 from core.task_support import cache_based_lock
 from django.conf import settings
+from django.db import connection
 from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q, Subquery, Sum
 from django.db.transaction import atomic, on_commit
 from django.utils.timezone import now
 from logs.constants import ACTION_INTEREST_CHANGE, ACTION_INTEREST_SMART_SYNC
-from logs.models import AccessLog, DimensionText, ImportBatch, LastAction, Metric, ReportType
+from logs.models import (
+    AccessLog,
+    Dimension,
+    DimensionText,
+    ImportBatch,
+    InterestGroup,
+    LastAction,
+    Metric,
+    ReportInterestMetric,
+    ReportType,
+)
 from publications.models import Platform
 
 logger = logging.getLogger(__name__)
@@ -21,8 +32,6 @@ logger = logging.getLogger(__name__)
 def sync_interest_by_import_batches(queryset=None) -> Counter:
     if not queryset:
         queryset = ImportBatch.objects.all()
-    stats = Counter()
-    interest_rt = ReportType.objects.get_interest_rt()
     # we want to make sure that the ImportBatch has some accesslogs because otherwise it might
     # be that we caught it just after creation before any AccessLogs are added to it
     queryset = (
@@ -30,18 +39,9 @@ def sync_interest_by_import_batches(queryset=None) -> Counter:
         .annotate(accesslog_count=Count('accesslog'))
         .filter(accesslog_count__gt=0)
     )
-    total_count = queryset.count()
-    logger.info('Found %d unprocessed import batches', total_count)
-    start = time()
-    for i, import_batch in enumerate(queryset):
-        cur_stats = sync_interest_for_import_batch(import_batch, interest_rt)
-        stats += cur_stats
-        if time() - start > 10:
-            logger.debug(
-                'Progress: %d/%d (%.1f %%)', i + 1, total_count, 100.0 * (i + 1) / total_count
-            )
-            start = time()
-    return stats
+    import_batch_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+    logger.info('Found %d unprocessed import batches', len(import_batch_ids))
+    return sync_interest_by_import_batches_in_chunks(import_batch_ids)
 
 
 @atomic
@@ -73,11 +73,9 @@ def sync_interest_for_import_batch(import_batch: ImportBatch, interest_rt: Repor
     stats['existing'] = same
     stats['removed'] = len(to_delete_pks)
     logger.debug('Import took: %.2f s; Stats: %s', time() - start, stats)
-    # sync with clickhouse
-    if settings.CLICKHOUSE_SYNC_ACTIVE and (really_new or to_delete_pks):
-        from .clickhouse import sync_import_batch_interest_with_clickhouse
-
-        on_commit(lambda: sync_import_batch_interest_with_clickhouse(import_batch))
+    # sync with clickhouse and invalidate cached reports
+    if really_new or to_delete_pks:
+        on_commit(lambda: _interest_changed([import_batch], interest_rt))
     return stats
 
 
@@ -142,18 +140,7 @@ def extract_interest_from_import_batch(
     metric_to_dim1 = {}
     dim1 = interest_rt.dimensions_sorted[0]
     for metric_id, ig in metric_to_ig.items():
-        # we do not use update_or_create here, because it creates one select and one update
-        # even if nothing has changed
-        dim_text, _created = DimensionText.objects.get_or_create(
-            dimension=dim1,
-            text=ig.short_name,
-            defaults={'text_local_en': ig.name_en, 'text_local_cs': ig.name_cs},
-        )
-        if dim_text.text_local_en != ig.name_en or dim_text.text_local_cs != ig.name_cs:
-            dim_text.text_local_en = ig.name_en
-            dim_text.text_local_cs = ig.name_cs
-            dim_text.save()
-        metric_to_dim1[metric_id] = dim_text.pk
+        metric_to_dim1[metric_id] = interest_group_dimension_text_id(ig, dim1)
     # get source data for the new logs
     new_logs = []
     # for the following dates, there are data for a superseeding report type, so we do not
@@ -200,6 +187,231 @@ def extract_interest_from_import_batch(
     return new_logs
 
 
+def interest_group_dimension_text_id(interest_group: InterestGroup, dimension: Dimension) -> int:
+    """
+    Returns id of the DimensionText representing `interest_group` in the interest report type
+    """
+    # we do not use update_or_create here, because it creates one select and one update
+    # even if nothing has changed
+    dim_text, _created = DimensionText.objects.get_or_create(
+        dimension=dimension,
+        text=interest_group.short_name,
+        defaults={'text_local_en': interest_group.name_en, 'text_local_cs': interest_group.name_cs},
+    )
+    if (
+        dim_text.text_local_en != interest_group.name_en
+        or dim_text.text_local_cs != interest_group.name_cs
+    ):
+        dim_text.text_local_en = interest_group.name_en
+        dim_text.text_local_cs = interest_group.name_cs
+        dim_text.save()
+    return dim_text.pk
+
+
+def interest_metric_map(interest_rt: ReportType) -> List[Tuple[int, int, int, int]]:
+    """
+    Returns tuples (report_type_id, metric_id, interest_metric_id, dim1) describing how
+    access logs of each report type and metric are converted into interest
+    """
+    dim1 = interest_rt.dimensions_sorted[0]
+    ig_to_dim1 = {}
+    ret = {}
+    for rim in ReportInterestMetric.objects.select_related('interest_group'):
+        if rim.interest_group_id not in ig_to_dim1:
+            ig_to_dim1[rim.interest_group_id] = interest_group_dimension_text_id(
+                rim.interest_group, dim1
+            )
+        # just like in `extract_interest_from_import_batch`, only one interest group is used
+        # when a metric is assigned to more of them
+        ret[(rim.report_type_id, rim.metric_id)] = (
+            rim.report_type_id,
+            rim.metric_id,
+            rim.target_metric_id or rim.metric_id,
+            ig_to_dim1[rim.interest_group_id],
+        )
+    return list(ret.values())
+
+
+# Computes interest for all the import batches with ids in `import_batch_ids` at once
+# and replaces the interest access logs which differ from the computed ones.
+# It does the same as `extract_interest_from_import_batch` followed by the comparison with
+# existing records in `sync_interest_for_import_batch`:
+# * only batches with report type which is an interest report for the platform are used
+# * dates for which data with the superseding report type exist are skipped
+# * metrics are remapped and interest group is stored in dim1 using `metric_map`
+BULK_INTEREST_SQL = """
+WITH metric_map (report_type_id, metric_id, interest_metric_id, dim1) AS (
+    SELECT * FROM unnest(
+        %(map_report_type_ids)s::int[], %(map_metric_ids)s::int[],
+        %(map_interest_metric_ids)s::int[], %(map_dim1s)s::int[]
+    )
+),
+batches AS (
+    SELECT ib.id, ib.report_type_id, ib.platform_id, ib.organization_id, rt.superseeded_by_id
+    FROM logs_importbatch AS ib
+        JOIN logs_reporttype AS rt ON rt.id = ib.report_type_id
+    WHERE ib.id = ANY(%(import_batch_ids)s)
+        AND EXISTS (
+            SELECT 1 FROM publications_platforminterestreport AS pir
+            WHERE pir.platform_id = ib.platform_id AND pir.report_type_id = ib.report_type_id
+        )
+),
+clashing_dates AS (
+    SELECT DISTINCT b.id AS import_batch_id, s.date
+    FROM batches AS b
+        JOIN logs_accesslog AS s
+            ON s.report_type_id = b.superseeded_by_id
+            AND s.platform_id = b.platform_id
+            AND (
+                s.organization_id = b.organization_id
+                OR (s.organization_id IS NULL AND b.organization_id IS NULL)
+            )
+),
+new_logs AS (
+    SELECT al.import_batch_id, al.organization_id, mm.interest_metric_id AS metric_id,
+           al.platform_id, al.target_id, al.date, mm.dim1, SUM(al.value)::int AS value
+    FROM logs_accesslog AS al
+        JOIN batches AS b ON b.id = al.import_batch_id AND b.report_type_id = al.report_type_id
+        JOIN metric_map AS mm
+            ON mm.report_type_id = al.report_type_id AND mm.metric_id = al.metric_id
+    WHERE al.import_batch_id = ANY(%(import_batch_ids)s)
+        AND NOT EXISTS (
+            SELECT 1 FROM clashing_dates AS cd
+            WHERE cd.import_batch_id = al.import_batch_id AND cd.date = al.date
+        )
+    GROUP BY al.import_batch_id, al.organization_id, al.metric_id, mm.interest_metric_id,
+             al.platform_id, al.target_id, al.date, mm.dim1
+),
+old_logs AS (
+    SELECT id, import_batch_id, organization_id, metric_id, platform_id, target_id, date, dim1,
+           value
+    FROM logs_accesslog
+    WHERE report_type_id = %(interest_rt_id)s AND import_batch_id = ANY(%(import_batch_ids)s)
+),
+deleted AS (
+    DELETE FROM logs_accesslog
+    WHERE id IN (
+        SELECT o.id FROM old_logs AS o
+        WHERE NOT EXISTS (
+            SELECT 1 FROM new_logs AS n
+            WHERE n.import_batch_id = o.import_batch_id AND n.metric_id = o.metric_id
+                AND n.date = o.date AND n.value = o.value
+                AND (n.organization_id, n.platform_id, n.target_id, n.dim1)
+                    IS NOT DISTINCT FROM (o.organization_id, o.platform_id, o.target_id, o.dim1)
+        )
+    )
+    RETURNING import_batch_id
+),
+inserted AS (
+    INSERT INTO logs_accesslog (
+        report_type_id, import_batch_id, organization_id, metric_id, platform_id, target_id,
+        date, dim1, value, created, owner_level
+    )
+    SELECT %(interest_rt_id)s, n.import_batch_id, n.organization_id, n.metric_id, n.platform_id,
+           n.target_id, n.date, n.dim1, n.value, %(created)s, %(owner_level)s
+    FROM new_logs AS n
+    WHERE NOT EXISTS (
+        SELECT 1 FROM old_logs AS o
+        WHERE n.import_batch_id = o.import_batch_id AND n.metric_id = o.metric_id
+            AND n.date = o.date AND n.value = o.value
+            AND (n.organization_id, n.platform_id, n.target_id, n.dim1)
+                IS NOT DISTINCT FROM (o.organization_id, o.platform_id, o.target_id, o.dim1)
+    )
+    RETURNING import_batch_id
+)
+SELECT
+    (SELECT count(*) FROM new_logs),
+    (SELECT count(*) FROM inserted),
+    (SELECT count(*) FROM deleted),
+    ARRAY(SELECT import_batch_id FROM inserted UNION SELECT import_batch_id FROM deleted)
+"""
+
+
+@atomic
+def sync_interest_for_import_batches(
+    import_batch_ids: List[int], interest_rt: ReportType, metric_map: List[tuple] = None
+) -> Counter:
+    """
+    Set based version of `sync_interest_for_import_batch` which processes all the import
+    batches in one query.
+
+    :param metric_map: output of `interest_metric_map` - may be given when it is reused
+                       for several calls
+    """
+    start = time()
+    if metric_map is None:
+        metric_map = interest_metric_map(interest_rt)
+    map_columns = list(zip(*metric_map)) or [[], [], [], []]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            BULK_INTEREST_SQL,
+            {
+                'map_report_type_ids': list(map_columns[0]),
+                'map_metric_ids': list(map_columns[1]),
+                'map_interest_metric_ids': list(map_columns[2]),
+                'map_dim1s': list(map_columns[3]),
+                'import_batch_ids': list(import_batch_ids),
+                'interest_rt_id': interest_rt.pk,
+                'created': now(),
+                'owner_level': AccessLog._meta.get_field('owner_level').default,
+            },
+        )
+        new_count, inserted, deleted, changed_ib_ids = cursor.fetchone()
+    ImportBatch.objects.filter(pk__in=import_batch_ids).update(
+        interest_timestamp=now(), last_updated=now()
+    )
+    stats = Counter({'new_logs': inserted, 'existing': new_count - inserted, 'removed': deleted})
+    logger.debug(
+        'Interest for %d batches took: %.2f s; Stats: %s',
+        len(import_batch_ids),
+        time() - start,
+        stats,
+    )
+    if changed_ib_ids:
+        changed_ibs = list(ImportBatch.objects.filter(pk__in=changed_ib_ids))
+        on_commit(lambda: _interest_changed(changed_ibs, interest_rt))
+    return stats
+
+
+def _interest_changed(import_batches: List[ImportBatch], interest_rt: ReportType):
+    from .reporting.cache import invalidate_slicer_cache_for_import_batch
+
+    for import_batch in import_batches:
+        invalidate_slicer_cache_for_import_batch(
+            interest_rt.pk, import_batch.organization_id, import_batch.platform_id
+        )
+    if settings.CLICKHOUSE_SYNC_ACTIVE:
+        from .clickhouse import sync_import_batch_interest_with_clickhouse
+
+        for import_batch in import_batches:
+            sync_import_batch_interest_with_clickhouse(import_batch)
+
+
+def sync_interest_by_import_batches_in_chunks(import_batch_ids: List[int]) -> Counter:
+    """
+    Processes import batches in chunks of `settings.INTEREST_SYNC_CHUNK_SIZE` using
+    `sync_interest_for_import_batches`
+    """
+    stats = Counter()
+    total_count = len(import_batch_ids)
+    if not total_count:
+        return stats
+    interest_rt = ReportType.objects.get_interest_rt()
+    metric_map = interest_metric_map(interest_rt)
+    chunk_size = settings.INTEREST_SYNC_CHUNK_SIZE
+    for i in range(0, total_count, chunk_size):
+        end = i + chunk_size
+        chunk = import_batch_ids[i:end]
+        stats += sync_interest_for_import_batches(chunk, interest_rt, metric_map=metric_map)
+        logger.info(
+            'Synced interest for %d out of %d batches, stats: %s',
+            i + len(chunk),
+            total_count,
+            stats,
+        )
+    return stats
+
+
 def remove_interest(queryset=None) -> Counter:
     if not queryset:
         queryset = ImportBatch.objects.all()
@@ -216,9 +428,13 @@ def remove_interest(queryset=None) -> Counter:
 def remove_interest_from_import_batch(
     import_batch: ImportBatch, interest_rt: ReportType
 ) -> Counter:
+    from .reporting.cache import invalidate_slicer_cache_for_import_batch
+
     deleted = import_batch.accesslog_set.filter(report_type=interest_rt).delete()
     import_batch.interest_timestamp = None
     import_batch.save()
+    args = (interest_rt.pk, import_batch.organization_id, import_batch.platform_id)
+    on_commit(lambda: invalidate_slicer_cache_for_import_batch(*args))
     return Counter({'deleted_accesslogs': deleted[0]})
 
 
@@ -244,6 +460,9 @@ def recompute_interest_by_batch(queryset=None, verbose=False):
         if total_count == 0:
             # short-circuit to save query for interest report type
             return stats
+        if not verbose:
+            import_batch_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+            return sync_interest_by_import_batches_in_chunks(import_batch_ids)
         interest_rt = ReportType.objects.get_interest_rt()
         for i, import_batch in enumerate(queryset.iterator()):
             old_sum = (
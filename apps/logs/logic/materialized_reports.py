@@ -1,13 +1,13 @@
 import logging
-from time import monotonic, time
-from typing import Callable, Iterable
+from time import monotonic
+from typing import Callable, Iterable, List, Union
 
-from django.db.models import Count, FloatField, Q, QuerySet, Sum
-from django.db.models.expressions import RawSQL
-from django.db.models.functions import Cast
-from django.db.transaction import atomic
+from django.db import connection
+from django.db.models import Count, Exists, OuterRef, QuerySet
+from django.db.transaction import atomic, on_commit
+from django.utils.timezone import now
 
-from ..models import AccessLog, ImportBatch, ReportType
+from ..models import AccessLog, ImportBatch, ImportBatchMaterialization, ReportType
 
 logger = logging.getLogger(__name__)
 
@@ -32,22 +32,20 @@ def sync_materialized_reports_for_import_batch(ib: ImportBatch):
         create_materialized_accesslogs_for_importbatches(mat_rt, [ib])
 
 
-def create_materialized_accesslogs(rt: ReportType, batch_size=None) -> int:
+def create_materialized_accesslogs(rt: ReportType, batch_size=1000) -> int:
     """
     Given an input materialized report type, it creates all the missing accesslogs. It detects
     what is missing by using data from individual ImportBatches.
-    In order to save memory, it works repeatedly on batches of ImportBatches rather than on
-    all of them at once.
+    In order to keep transactions reasonably short, it works repeatedly on batches of
+    ImportBatches rather than on all of them at once.
     :param rt:
-    :param batch_size: maximum number of ImportBatches to process at once, if None, we will guess
+    :param batch_size: maximum number of ImportBatches to process at once
     :return:
     """
     assert rt.materialization_spec, 'This code works only for materialized report types'
-    if batch_size is None:
-        batch_size = guess_batch_size_for_materialization(rt)
-        logger.info('Guessing batch_size for "%s": %d', rt, batch_size)
     # construct query
-    to_process = materialized_import_batch_queryset(rt)[:batch_size]
+    ib_id_query = materialized_import_batch_queryset(rt).order_by('pk').values_list('pk', flat=True)
+    to_process = list(ib_id_query[:batch_size])
     total = 0
     while to_process:
         start = monotonic()
@@ -56,137 +54,118 @@ def create_materialized_accesslogs(rt: ReportType, batch_size=None) -> int:
             'Batch materialization took %.1f s; records created: %d', monotonic() - start, size
         )
         total += size
-        to_process = materialized_import_batch_queryset(rt)[:batch_size]
+        to_process = list(ib_id_query[:batch_size])
     return total
 
 
-def guess_batch_size_for_materialization(rt: ReportType, desired_log_threshold=25_000):
-    """
-    We guess how much data will be 'compressed' when doing materialization and try to guess
-    the right size of input batches to generate a reasonable number of materialized AccessLogs
-    so that we don't overload the memory with each batch.
-    :param desired_log_threshold: The number of logs that should be created in one batch
-    :param rt:
-    :return:
-    """
-    keep, _remove = rt.materialization_spec.split_attributes(add_id_postfix=True)
-    import_batch_qs = materialized_import_batch_queryset(rt)
-    source_batch_count = import_batch_qs.count()
-    # the annotation bellow causes group by to be run and Import batches counted
-    # it is also faster than using distinct for some reason
-    result_log_count = (
-        AccessLog.objects.filter(
-            report_type=rt.materialization_spec.base_report_type,
-            import_batch_id__in=import_batch_qs,
-        )
-        .values('import_batch_id', *keep)
-        .annotate(value=Sum('value'))
-    )
-    result_log_count = result_log_count.count()
-    if source_batch_count and result_log_count:
-        return source_batch_count * desired_log_threshold // result_log_count
-    return 1000
+MATERIALIZATION_SQL = """
+INSERT INTO logs_accesslog
+    (report_type_id, import_batch_id{columns}, value, created, owner_level)
+SELECT %s, import_batch_id{columns}, SUM(value), %s, %s
+FROM logs_accesslog
+WHERE report_type_id = %s AND import_batch_id = ANY(%s)
+GROUP BY import_batch_id{columns}
+"""
 
 
 @atomic
 def create_materialized_accesslogs_for_importbatches(
-    rt: ReportType, ibs: Iterable[ImportBatch]
+    rt: ReportType, ibs: Iterable[Union[ImportBatch, int]]
 ) -> int:
     """
     Given an input materialized report type and a set of import batches, it creates all the
-    materialized AccessLogs.
+    materialized AccessLogs. The aggregation is done by a single `INSERT ... SELECT` statement,
+    so the data never leave the database.
     :param rt:
-    :param ibs: list or queryset of ImportBatches
-    :return:
+    :param ibs: list or queryset of ImportBatches or their ids
+    :return: number of created AccessLogs
     """
     assert rt.materialization_spec, 'This code works only for materialized report types'
+    # the timestamp must be taken before the source data are read so that changes done in
+    # the meantime are not marked as materialized
+    timestamp = now()
+    ib_ids = [ib if isinstance(ib, int) else ib.pk for ib in ibs]
     # remove existing materialized stuff from the ImportBatches
     # as we do not sync materialized report data to clickhouse, the code here does not
     # change anything from the clickhouse point of view
-    AccessLog.objects.filter(report_type=rt, import_batch__in=ibs).delete(
+    AccessLog.objects.filter(report_type=rt, import_batch_id__in=ib_ids).delete(
         i_know_what_i_am_doing=True
     )
-    # construct query
     keep, _remove = rt.materialization_spec.split_attributes(add_id_postfix=True)
-    query = (
-        AccessLog.objects.filter(
-            report_type=rt.materialization_spec.base_report_type, import_batch__in=ibs
+    # each kept column is preceded by a separator, so that nothing is added when all the
+    # dimensions are removed
+    columns = ''.join(f', {connection.ops.quote_name(column)}' for column in keep)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            MATERIALIZATION_SQL.format(columns=columns),
+            (
+                rt.pk,
+                timestamp,
+                AccessLog._meta.get_field('owner_level').default,
+                rt.materialization_spec.base_report_type_id,
+                ib_ids,
+            ),
         )
-        .values('import_batch_id', *keep)
-        .annotate(value=Sum('value'))
+        created = cursor.rowcount
+    ImportBatchMaterialization.objects.filter(report_type=rt, import_batch_id__in=ib_ids).delete()
+    ImportBatchMaterialization.objects.bulk_create(
+        [
+            ImportBatchMaterialization(
+                report_type=rt, import_batch_id=ib_id, materialized=timestamp
+            )
+            for ib_id in ib_ids
+        ]
     )
-    to_insert = [AccessLog(report_type=rt, **log) for log in query]
-    AccessLog.objects.bulk_create(to_insert)
-    for ib in ibs:
-        ib.materialization_data[f'r{rt.pk}'] = time()
-        ib.save(update_fields=['materialization_data'])
-    return len(to_insert)
+    on_commit(lambda: _materialized_data_changed(ib_ids))
+    return created
+
+
+def _materialized_data_changed(import_batch_ids: List[int]):
+    from .reporting.cache import invalidate_slicer_cache_for_import_batches
+
+    invalidate_slicer_cache_for_import_batches(import_batch_ids)
 
 
 def materialized_import_batch_queryset(rt: ReportType) -> QuerySet:
     """
-    Creates query attrs needed to get ImportBatches that should be 'materialized' for the
-    ReportType rt.
+    Returns ImportBatches that should be 'materialized' for the ReportType rt - those
+    which do not have an up-to-date `ImportBatchMaterialization` record.
     :param rt:
-    :return: [Q]
+    :return:
     """
-    if rt.materialization_spec.base_report_type.short_name == 'interest':
+    base_rt = rt.materialization_spec.base_report_type
+    up_to_date = ImportBatchMaterialization.objects.filter(
+        report_type=rt, import_batch_id=OuterRef('pk'), materialized__gte=rt.materialization_date
+    )
+    if base_rt.short_name == 'interest':
         # for interest based materialized report types, we need to check the interest calculation
         # as well. We only include batches
         #  * with interest calculated already and not data materialization
         #  * with interest calculated after data materialization
         #    (can happen if interest definition is changed)
-        # the interest_ts field will be added in annotation later on
-        no_materialization = Q(
-            **{f'materialization_data__r{rt.pk}__isnull': True}, interest_timestamp__isnull=False
+        up_to_date = up_to_date.filter(materialized__gt=OuterRef('interest_timestamp'))
+        return ImportBatch.objects.filter(interest_timestamp__isnull=False).filter(
+            ~Exists(up_to_date)
         )
-        stale_materialization = Q(
-            interest_ts__gte=Cast(RawSQL('materialization_data->%s', (f'r{rt.pk}',)), FloatField())
-        )
-        updated_materialization = Q(
-            **{f'materialization_data__r{rt.pk}__lt': rt.materialization_date.timestamp()}
-        )
-        # bellow we use RawSQL rather than Extract('interest_timestamp', 'epoch') because it
-        # returns the timestamp in active timezone rather than in UTC as time() is presented
-        # and thus even new data could appear stale due to the timezone shift :/
-        return ImportBatch.objects.annotate(
-            interest_ts=Cast(RawSQL('EXTRACT(EPOCH FROM interest_timestamp)', ()), FloatField())
-        ).filter(stale_materialization | updated_materialization | no_materialization)
-    else:
-        no_materialization = Q(**{f'materialization_data__r{rt.pk}__isnull': True})
-        updated_materialization = Q(
-            **{f'materialization_data__r{rt.pk}__lt': rt.materialization_date.timestamp()}
-        )
-        return ImportBatch.objects.filter(no_materialization | updated_materialization)
+    # only import batches of the base report type may contain data to materialize
+    return ImportBatch.objects.filter(report_type=base_rt).filter(~Exists(up_to_date))
 
 
 @atomic
 def remove_materialized_accesslogs(progress_callback: Callable[[int], None] = None):
     """
-    Deletes all the AccessLogs for materialized views and associated data from ImportBatches
-    :param progress_callback:
+    Deletes all the AccessLogs for materialized views and associated data about materialization
+    of ImportBatches
+    :param progress_callback: called with the number of processed report types
     :return:
     """
-    rt_keys = set()
     # materialized reports are not synced with clickhouse, so the following delete has no
     # influence on clickhouse sync
-    for rt in ReportType.objects.filter(materialization_spec__isnull=False):
+    for i, rt in enumerate(ReportType.objects.filter(materialization_spec__isnull=False)):
         rt.accesslog_set.all().delete(i_know_what_i_am_doing=True)
-        rt_keys.add(rt.pk)
-    # we iterate stupidly over all import batches, but that's life for you - I did not find
-    # a way to batch update json field, so I at least go over each import batch only once for
-    # all report types
-    for i, ib in enumerate(ImportBatch.objects.all()):
-        save = False
-        for rt_pk in rt_keys:
-            key = f'r{rt_pk}'
-            if key in ib.materialization_data:
-                ib.materialization_data.pop(key)
-                save = True
-        if save:
-            ib.save()
-        if progress_callback and i and i % 1000 == 0:
-            progress_callback(i)
+        ImportBatchMaterialization.objects.filter(report_type=rt).delete()
+        if progress_callback:
+            progress_callback(i + 1)
 
 
 def recompute_materialized_reports(progress_callback: Callable[[int], None] = None):
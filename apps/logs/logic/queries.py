@@ -2,7 +2,8 @@
 Functions that help in constructing django queries
 """
 import logging
-from typing import Iterable, Optional, Union
+from itertools import islice
+from typing import Iterable, Iterator, Optional, Union
 
 from charts.models import ReportDataView
 from core.logic.dates import date_filter_from_params
@@ -322,6 +323,36 @@ class StatsComputer:
         :param recache: should recache be used to cache the database query?
         :return:
         """
+        data = self.get_data_queryset()
+        if recache:
+            data = recache_queryset(data, origin='chart-data')
+        if len(data) > self.hard_result_count_limit:
+            logger.warning(
+                'Result size of %d exceeded the limit of %d records',
+                len(data),
+                self.hard_result_count_limit,
+            )
+            raise TooMuchDataError()
+        self.post_process_data(data, user)
+        return data
+
+    def iter_data(self, user, batch_size: int = 1000) -> Iterator[dict]:
+        """
+        Yields the same records as `get_data`, but without having all of them in memory.
+        The records are fetched and post-processed in batches of `batch_size`, so they may be
+        written out while the following ones are still being read. Unlike in `get_data`, the
+        number of records is not limited.
+        """
+        data = self.get_data_queryset().iterator(chunk_size=batch_size)
+        context = {}
+        while batch := list(islice(data, batch_size)):
+            self.post_process_data(batch, user, context=context)
+            yield from batch
+
+    def get_data_queryset(self) -> QuerySet:
+        """
+        Returns the query for the data without any post-processing
+        """
         # we use the prepared self.query where accesslogs are filtered
         # we just need to enforce one-metric rule if metric is not specified in the request
         self.enforce_metric_filter()
@@ -340,32 +371,28 @@ class StatsComputer:
                 .values(self.prim_dim_name, 'count')
                 .order_by(self.prim_dim_name)
             )
-        if recache:
-            data = recache_queryset(data, origin='chart-data')
-        if len(data) > self.hard_result_count_limit:
-            logger.warning(
-                'Result size of %d exceeded the limit of %d records',
-                len(data),
-                self.hard_result_count_limit,
-            )
-            raise TooMuchDataError()
-        self.post_process_data(data, user)
         return data
 
-    def post_process_data(self, data, user):
+    def post_process_data(self, data, user, context: Optional[dict] = None):
+        """
+        :param context: state shared between calls for parts of one result - texts of
+                        dimensions and numbering of anonymized organizations
+        """
+        context = {} if context is None else context
+        dimension_texts = context.setdefault('dimension_texts', {})
         # clean names of organizations
-        self.clean_organization_names(user, data)
+        self.clean_organization_names(user, data, context=context)
         # remap the values if text dimensions are involved
         # primary dimension
         if self.prim_dim_obj:
-            remap_dicts(self.prim_dim_obj, data, self.prim_dim_name)
+            remap_dicts(self.prim_dim_obj, data, self.prim_dim_name, mappings=dimension_texts)
         elif self.prim_dim_name in self.implicit_dims:
             # we remap the implicit dims if they are foreign key based
             to_text_fn = self.implicit_dim_to_text_fn.get(self.io_prim_dim_name, str)
             self.remap_implicit_dim(data, self.prim_dim_name, to_text_fn=to_text_fn)
         # secondary dimension
         if self.sec_dim_obj:
-            remap_dicts(self.sec_dim_obj, data, self.sec_dim_name)
+            remap_dicts(self.sec_dim_obj, data, self.sec_dim_name, mappings=dimension_texts)
         elif self.sec_dim_name in self.implicit_dims:
             # we remap the implicit dims if they are foreign key based
             to_text_fn = self.implicit_dim_to_text_fn.get(self.io_sec_dim_name, str)
@@ -503,16 +530,20 @@ class StatsComputer:
                     rec[dim_name] = to_text_fn(mapping[rec[dim_name]]).replace('_', ' ')
 
     @classmethod
-    def clean_organization_names(cls, user, data):
+    def clean_organization_names(cls, user, data, context: Optional[dict] = None):
         """
         If organization is present in the data, we need to anonymize the data for those
         organizations that the user does not have access to.
         :param user: instance of the current user
         :param data: records to be cleaned - organizations should be passed as their primary key
+        :param context: if given, the anonymized organizations keep their numbers between calls
         :return:
         """
-        user_organizations = {org.pk for org in user.accessible_organizations()}
-        org_nums = []
+        context = {} if context is None else context
+        if 'user_organizations' not in context:
+            context['user_organizations'] = {org.pk for org in user.accessible_organizations()}
+        user_organizations = context['user_organizations']
+        org_nums = context.setdefault('anonymized_organizations', [])
         for rec in data:
             if 'organization' in rec and rec['organization'] not in user_organizations:
                 org = rec['organization']
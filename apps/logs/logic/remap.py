@@ -1,9 +1,21 @@
+from typing import Optional
+
 from ..models import Dimension, DimensionText
 
 
-def remap_dicts(dimension: Dimension, records: [dict], key):
-    mapping = {
-        dt.pk: dt.text_local or dt.text for dt in DimensionText.objects.filter(dimension=dimension)
-    }
+def remap_dicts(dimension: Dimension, records: [dict], key, mappings: Optional[dict] = None):
+    """
+    :param mappings: if given, the texts of `dimension` are stored in it (under dimension pk)
+                     and reused in subsequent calls
+    """
+    if mappings is not None and dimension.pk in mappings:
+        mapping = mappings[dimension.pk]
+    else:
+        mapping = {
+            dt.pk: dt.text_local or dt.text
+            for dt in DimensionText.objects.filter(dimension=dimension)
+        }
+        if mappings is not None:
+            mappings[dimension.pk] = mapping
     for record in records:
         record[key] = mapping.get(record.get(key))
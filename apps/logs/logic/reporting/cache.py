@@ -0,0 +1,217 @@
+"""
+Caching of results computed by `FlexibleDataSlicer`.
+
+Results are stored in the Django cache under a key derived from the normalized slicer config,
+the organizations and tags the user may see and the part/language of the request.
+Each stored result remembers "generations" of the report types, organizations and platforms it
+depends on. Generations are counters increased whenever an import batch for the corresponding
+object is created or deleted or its access logs are changed in bulk (materialization, title
+merges, interest), so the result is only used when no relevant data were changed.
+Because ClickHouse is synced only after the database transaction is committed, generations are
+increased once more after the sync, so that results computed from not yet synced ClickHouse
+data are not used afterwards.
+"""
+import json
+import logging
+from hashlib import blake2b
+from typing import Callable, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from logs.logic.reporting.filters import TagDimensionFilter
+from logs.logic.reporting.slicer import FlexibleDataSlicer, SlicerRecords
+from logs.models import ImportBatch, ReportType
+from tags.models import Tag
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY_PREFIX = 'slicer-cache'
+GENERATION_KEY_PREFIX = 'slicer-gen'
+TAGS_GENERATION_KEY = f'{GENERATION_KEY_PREFIX}:tags'
+# when a filter has more values than this, it is not used to check validity of cached data
+MAX_DEPENDENCY_OBJECTS = 500
+
+
+def generation_key(dimension: str, pk: int) -> str:
+    return f'{GENERATION_KEY_PREFIX}:{dimension}:{pk}'
+
+
+def bump_generations(keys: Iterable[str]):
+    for key in keys:
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # the key was removed in the meantime
+            cache.set(key, 1, None)
+
+
+def import_batch_generation_keys(
+    report_type_id: int, organization_id: Optional[int], platform_id: Optional[int]
+) -> List[str]:
+    keys = [generation_key('report_type', report_type_id)]
+    if organization_id:
+        keys.append(generation_key('organization', organization_id))
+    if platform_id:
+        keys.append(generation_key('platform', platform_id))
+    return keys
+
+
+def invalidate_slicer_cache_for_import_batch(
+    report_type_id: int, organization_id: Optional[int], platform_id: Optional[int]
+):
+    """
+    Makes cached results which could contain data of the import batch with the given attributes
+    invalid
+    """
+    bump_generations(import_batch_generation_keys(report_type_id, organization_id, platform_id))
+
+
+def invalidate_slicer_cache_for_import_batches(import_batch_ids: Iterable[int]):
+    """
+    Makes cached results which could contain data of the given import batches invalid.
+    Should be used when access logs of the import batches are changed in bulk. Materialized
+    report types are covered as well, because their import batches belong to the base report
+    type which the slicer depends on. Interest is stored under the interest report type, so it
+    is invalidated for import batches which have interest computed.
+    """
+    keys = set()
+    interest_rt_id = None
+    for report_type_id, organization_id, platform_id, has_interest in (
+        ImportBatch.objects.filter(pk__in=list(import_batch_ids))
+        .order_by()
+        .annotate(
+            has_interest=ExpressionWrapper(
+                Q(interest_timestamp__isnull=False), output_field=BooleanField()
+            )
+        )
+        .values_list('report_type_id', 'organization_id', 'platform_id', 'has_interest')
+        .distinct()
+    ):
+        keys.update(import_batch_generation_keys(report_type_id, organization_id, platform_id))
+        if has_interest:
+            if interest_rt_id is None:
+                interest_rt_id = ReportType.objects.get_interest_rt().pk
+            keys.update(import_batch_generation_keys(interest_rt_id, organization_id, platform_id))
+    bump_generations(keys)
+
+
+def invalidate_slicer_cache_for_tags():
+    """
+    Makes all cached results which use tags invalid
+    """
+    bump_generations([TAGS_GENERATION_KEY])
+
+
+class SlicerCache:
+    """
+    Stores results of one `FlexibleDataSlicer` configuration in the Django cache
+    """
+
+    def __init__(self, slicer: FlexibleDataSlicer, timeout: Optional[int] = None):
+        self.slicer = slicer
+        self.timeout = settings.SLICER_CACHE_TIMEOUT if timeout is None else timeout
+
+    @property
+    def active(self) -> bool:
+        return self.timeout > 0
+
+    @property
+    def uses_tags(self) -> bool:
+        return self.slicer.tag_roll_up or any(
+            isinstance(fltr, TagDimensionFilter) for fltr in self.slicer.dimension_filters
+        )
+
+    def normalized_config(self) -> dict:
+        """
+        Returns the slicer config with filters in a canonical order plus everything else
+        which influences the result
+        """
+        config = self.slicer.config()
+        filters = []
+        for fltr in config['filters']:
+            fltr = {**fltr}
+            for attr in ('values', 'tag_ids'):
+                if attr in fltr:
+                    fltr[attr] = sorted(fltr[attr], key=str)
+            filters.append(fltr)
+        config['filters'] = sorted(filters, key=lambda fltr: json.dumps(fltr, sort_keys=True))
+        config['organizations'] = self._organization_ids()
+        if self.slicer.tag_filter:
+            config['tag_filter'] = sorted(
+                Tag.objects.filter(self.slicer.tag_filter).values_list('pk', flat=True)
+            )
+        return config
+
+    def _organization_ids(self) -> Optional[List[int]]:
+        org_filter = self.slicer.organization_filter
+        if org_filter is None:
+            return None
+        if type(org_filter) in (list, tuple, set):
+            return sorted(org_filter)
+        return sorted(org_filter.values_list('pk', flat=True))
+
+    def cache_key(self, kind: str, part: Optional[list] = None, lang: str = '') -> str:
+        key_data = {'kind': kind, 'part': part, 'lang': lang, 'config': self.normalized_config()}
+        key_hash = blake2b(
+            json.dumps(key_data, sort_keys=True, default=str).encode('utf-8'), digest_size=16
+        ).hexdigest()
+        return f'{CACHE_KEY_PREFIX}:{key_hash}'
+
+    def dependency_groups(self) -> List[List[str]]:
+        """
+        Returns groups of generation keys. Cached data are valid if generations in at least one
+        of the groups did not change - import batches are always specific for one report type,
+        organization and platform, so data that are not filtered by a dimension cannot be
+        influenced by changes of other values of that dimension.
+        """
+        groups = [
+            [generation_key('report_type', rt.pk) for rt in self.slicer.involved_report_types()]
+        ]
+        filters = self.slicer.create_filters()
+        for dimension in ('organization', 'platform'):
+            pks = filters.get(f'{dimension}_id__in')
+            if pks is not None and len(pks) <= MAX_DEPENDENCY_OBJECTS:
+                groups.append([generation_key(dimension, pk) for pk in pks])
+        return groups
+
+    def _current_generations(self, groups: List[List[str]]) -> dict:
+        keys = [key for group in groups for key in group]
+        if self.uses_tags:
+            keys.append(TAGS_GENERATION_KEY)
+        current = cache.get_many(keys)
+        return {key: current.get(key, 0) for key in keys}
+
+    @classmethod
+    def _is_valid(cls, stored: dict, current: dict, groups: List[List[str]]) -> bool:
+        if stored.get(TAGS_GENERATION_KEY) != current.get(TAGS_GENERATION_KEY):
+            return False
+        return any(all(stored.get(key) == current[key] for key in group) for group in groups)
+
+    def get_or_compute(
+        self, kind: str, compute: Callable, part: Optional[list] = None, lang: str = ''
+    ):
+        """
+        Returns cached result for `kind`, `part` and `lang` if there is a valid one.
+        Otherwise calls `compute` and stores its result. Querysets are evaluated into
+        `SlicerRecords` before being stored, so that they may be paginated without
+        recomputation.
+        """
+        if not self.active:
+            return compute()
+        key = self.cache_key(kind, part=part, lang=lang)
+        groups = self.dependency_groups()
+        # generations are obtained before the computation, so that changes done while the
+        # data are computed make the result invalid
+        current = self._current_generations(groups)
+        if (stored := cache.get(key)) is not None:
+            if self._is_valid(stored['generations'], current, groups):
+                logger.debug('Using cached slicer result %s', key)
+                return stored['data']
+            logger.debug('Cached slicer result %s is outdated', key)
+        data = compute()
+        if data is not None and not isinstance(data, dict):
+            data = SlicerRecords(data)
+        cache.set(key, {'generations': current, 'data': data}, self.timeout)
+        return data
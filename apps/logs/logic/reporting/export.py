@@ -1,19 +1,29 @@
 import codecs
+import copy
 import logging
+import shutil
 import tempfile
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain, islice
-from typing import Any, Callable, Optional, TextIO, Tuple, Type, Union
+from time import monotonic
+from typing import Any, Callable, Generator, Iterable, Optional, TextIO, Tuple, Type, Union
 from zipfile import ZIP_DEFLATED, ZipFile
 
 import xlsxwriter
 from django.conf import settings
+from django.db import connections
 from django.db.models import Field, ForeignKey, Model, QuerySet
 from django.db.models.base import ModelBase
 from django.utils.text import slugify
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 from logs.logic.export_utils import (
+    COLUMNAR_ARROW,
+    COLUMNAR_PARQUET,
+    ArrowDictWriter,
+    CollectingListWriter,
     CSVListWriter,
     DictWriter,
     ListWriter,
@@ -21,7 +31,7 @@ from logs.logic.export_utils import (
     MappingXlsxDictWriter,
     XlsxListWriter,
 )
-from logs.logic.reporting.slicer import FlexibleDataSlicer
+from logs.logic.reporting.slicer import FlexibleDataSlicer, SlicerRecords
 from logs.models import AccessLog, DimensionText, ReportType
 from mptt.models import MPTTModelBase
 from organizations.models import Organization
@@ -79,6 +89,8 @@ class FlexibleDataExporter(ABC):
         # mapping between primary dim value and connected tags, used in batch processing
         # inside write_qs_to_output
         self._tag_cache = {}
+        # time spent on individual parts of multipart exports
+        self.part_timings = []
 
     @property
     def include_tags(self):
@@ -355,6 +367,65 @@ class FlexibleDataExporter(ABC):
             for org in orgs.order_by('name'):
                 writer.writerow(['', org.name])
 
+    def _fetch_part_data(
+        self, key: list, in_thread: bool = False
+    ) -> Tuple[Union[QuerySet, SlicerRecords], float]:
+        start = monotonic()
+        if not in_thread:
+            # a queryset is evaluated lazily while being written
+            return self.slicer.get_data(part=key), monotonic() - start
+        try:
+            # get_data modifies the slicer, so each thread works with its own copy
+            slicer = copy.deepcopy(self.slicer)
+            # querysets have to be evaluated here in order to get the data in this thread
+            return SlicerRecords(slicer.get_data(part=key)), monotonic() - start
+        finally:
+            # the connections are specific for the thread, so they would not be reused
+            connections.close_all()
+
+    def iter_part_data(
+        self, keys: Iterable[list]
+    ) -> Generator[Tuple[list, Union[QuerySet, SlicerRecords], float], None, None]:
+        """
+        Yields tuples (key, data, query time) for parts given by `keys` in the same order.
+
+        Data for the parts are obtained by `settings.EXPORT_PART_WORKERS` threads, so that the
+        following parts are queried while the current one is written. Only a limited number of
+        parts is fetched in advance to keep the memory usage bounded.
+        """
+        workers = settings.EXPORT_PART_WORKERS
+        if workers <= 1:
+            for key in keys:
+                yield (key, *self._fetch_part_data(key))
+            return
+        keys = iter(keys)
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export-part')
+        try:
+            for key in islice(keys, 2 * workers):
+                pending.append((key, executor.submit(self._fetch_part_data, key, in_thread=True)))
+            while pending:
+                key, future = pending.popleft()
+                for next_key in islice(keys, 1):
+                    pending.append(
+                        (next_key, executor.submit(self._fetch_part_data, next_key, in_thread=True))
+                    )
+                yield (key, *future.result())
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def record_part_timing(self, part_name: str, rows: int, query_time: float, write_time: float):
+        self.part_timings.append(
+            {'part': part_name, 'rows': rows, 'query_time': query_time, 'write_time': write_time}
+        )
+        logger.debug(
+            'Exported part "%s": %d rows, query: %.2f s, write: %.2f s',
+            part_name,
+            rows,
+            query_time,
+            write_time,
+        )
+
     def _remainder_fn(self, part=None):
         if self.slicer.show_untagged_remainder:
             return lambda: {
@@ -417,16 +488,20 @@ class FlexibleDataZipCSVExporter(FlexibleDataExporter):
                         encoder, qs, extra_row_fn=extra_row_fn, progress_monitor=progress_monitor
                     )
             else:
-                total = parts.count()
-                for i, part in enumerate(parts):
-                    key = [part[name] for name in self.slicer.split_by]
-                    qs = self.slicer.get_data(part=key)
+                parts = list(parts)
+                total = len(parts)
+                keys = [[part[name] for name in self.slicer.split_by] for part in parts]
+                for i, (part, (key, qs, query_time)) in enumerate(
+                    zip(parts, self.iter_part_data(keys))
+                ):
+                    start = monotonic()
                     extra_row_fn = self._remainder_fn(part=key)
                     fname = "-".join([slugify(p) for p in self.translate_part_key(part)])
                     with outzip.open(fname + '.csv', 'w', force_zip64=True) as outfile:
                         writer = codecs.getwriter('utf-8')
                         encoder = writer(outfile)
-                        self.write_qs_to_output(encoder, qs, extra_row_fn=extra_row_fn)
+                        row_count = self.write_qs_to_output(encoder, qs, extra_row_fn=extra_row_fn)
+                    self.record_part_timing(fname, row_count, query_time, monotonic() - start)
                     if progress_monitor:
                         progress_monitor(i + 1, total)
 
@@ -501,16 +576,22 @@ class FlexibleDataExcelExporter(FlexibleDataExporter):
                     for part in parts
                 ]
                 sheetname_parts.sort()
-                for i, (sheetname, part) in enumerate(sheetname_parts):
-                    key = [part[name] for name in self.slicer.split_by]
-                    qs = self.slicer.get_data(part=key)
-
+                keys = [
+                    [part[name] for name in self.slicer.split_by] for _name, part in sheetname_parts
+                ]
+                # the sheets must be written one after another, but data for the following
+                # sheets are being obtained in the meantime
+                for i, ((sheetname, _part), (key, qs, query_time)) in enumerate(
+                    zip(sheetname_parts, self.iter_part_data(keys))
+                ):
+                    start = monotonic()
                     sheet = workbook.add_worksheet(sheetname)
                     row_count = self.write_qs_to_output(
                         sheet, qs, extra_row_fn=self._remainder_fn(part=key)
                     )
                     if row_count > 0:
                         self.add_chart_sheet(workbook, sheetname, row_count=row_count)
+                    self.record_part_timing(sheetname, row_count, query_time, monotonic() - start)
                     if progress_monitor:
                         progress_monitor(i + 1, total)
 
@@ -595,3 +676,84 @@ class FlexibleDataExcelExporter(FlexibleDataExporter):
             i += 1
         self._seen_sheetnames.add(new_sheetname.lower())
         return new_sheetname
+
+
+class FlexibleDataColumnarExporter(FlexibleDataExporter):
+
+    """
+    Exporter creating Parquet files or Arrow IPC streams. Multipart output is written as
+    a ZIP archive with one file per part. Report metadata are stored in the schema metadata
+    of each file under the `celus_report` key.
+    """
+
+    columnar_format = COLUMNAR_PARQUET
+    file_extension = 'parquet'
+
+    def __init__(self, slicer: FlexibleDataSlicer, **kwargs):
+        super().__init__(slicer, **kwargs)
+        self._metadata = []
+
+    def stream_data_to_sink(
+        self, sink, progress_monitor: Optional[Callable[[int, int], None]] = None
+    ):
+        self._metadata = []
+        self.create_report_metadata(CollectingListWriter(self._metadata))
+        if not self.slicer.split_by:
+            qs = self.slicer.get_data()
+            return self.write_part(
+                sink, qs, extra_row_fn=self._remainder_fn(), progress_monitor=progress_monitor
+            )
+
+        parts = list(self.slicer.get_parts_queryset())
+        total = len(parts)
+        keys = [[part[name] for name in self.slicer.split_by] for part in parts]
+        with ZipFile(sink, 'w', compression=ZIP_DEFLATED) as outzip:
+            for i, (part, (key, qs, query_time)) in enumerate(
+                zip(parts, self.iter_part_data(keys))
+            ):
+                start = monotonic()
+                fname = "-".join([slugify(p) for p in self.translate_part_key(part)])
+                with outzip.open(
+                    f'{fname}.{self.file_extension}', 'w', force_zip64=True
+                ) as outfile:
+                    row_count = self.write_part(
+                        outfile, qs, extra_row_fn=self._remainder_fn(part=key)
+                    )
+                self.record_part_timing(fname, row_count, query_time, monotonic() - start)
+                if progress_monitor:
+                    progress_monitor(i + 1, total)
+
+    def write_part(self, sink, qs, **kwargs) -> int:
+        # the columnar writers need to know the position in the output, which is not
+        # supported by all sinks (e.g. zip archive members), so a temporary file is used
+        with tempfile.TemporaryFile() as tmp_file:
+            row_count = self.write_qs_to_output(tmp_file, qs, **kwargs)
+            if not row_count:
+                # write_qs_to_output does not create a writer without data, but the output
+                # has to be a valid file
+                fields = [(self.prim_dim_key, self.primary_column_name())]
+                self.create_writer(tmp_file, fields).finalize()
+            tmp_file.seek(0)
+            shutil.copyfileobj(tmp_file, sink)
+        return row_count
+
+    def create_writer(self, output, fields: list) -> DictWriter:
+        return ArrowDictWriter(
+            output,
+            fields=fields,
+            numeric_fields={key for key, _column in fields if key.startswith('grp-')},
+            fmt=self.columnar_format,
+            metadata={'celus_report': self._metadata},
+        )
+
+
+class FlexibleDataParquetExporter(FlexibleDataColumnarExporter):
+
+    columnar_format = COLUMNAR_PARQUET
+    file_extension = 'parquet'
+
+
+class FlexibleDataArrowExporter(FlexibleDataColumnarExporter):
+
+    columnar_format = COLUMNAR_ARROW
+    file_extension = 'arrows'
@@ -3,7 +3,7 @@ import operator
 from collections import OrderedDict
 from enum import Enum
 from functools import reduce
-from typing import Iterable, List, Optional, Type
+from typing import Callable, Iterable, List, Optional, Type
 
 from core.logic.dates import date_range_from_params, month_end, parse_month
 from core.logic.serialization import parse_b64json
@@ -41,15 +41,36 @@ from organizations.models import Organization
 from tags.models import Tag, TagClass
 
 
+class SlicerRecords(list):
+    """
+    List of records obtained from Clickhouse which supports the parts of the QuerySet interface
+    used by the consumers of `FlexibleDataSlicer.get_data`
+    """
+
+    def count(self) -> int:
+        return len(self)
+
+    def iterator(self):
+        return iter(self)
+
+
 class FlexibleDataSlicer:
     implicit_dims = ['date', 'platform', 'metric', 'organization', 'target', 'report_type']
 
     def __init__(
-        self, primary_dimension, tag_roll_up=False, include_all_zero_rows=False, use_clickhouse=None
+        self,
+        primary_dimension,
+        tag_roll_up=False,
+        include_all_zero_rows=False,
+        use_clickhouse=None,
+        pivot_in_python=None,
     ):
         self.use_clickhouse = (
             settings.CLICKHOUSE_QUERY_ACTIVE if use_clickhouse is None else use_clickhouse
         )
+        # if None, data are pivoted in Python when there are more groups than
+        # `settings.SLICER_PIVOT_GROUP_THRESHOLD`
+        self.pivot_in_python = pivot_in_python
         self.primary_dimension = primary_dimension
         self.dimension_filters: List[DimensionFilter] = []
         self.group_by = []
@@ -280,7 +301,7 @@ class FlexibleDataSlicer:
         if gb_query.count() > max_number:
             raise SlicerConfigError(
                 f'There are too many ({gb_query.count()}) possible groups, please refine '
-                f'you configuration',
+                f'your configuration',
                 SlicerConfigErrorCode.E101,
                 details={'group_count': gb_query.count()},
             )
@@ -297,8 +318,11 @@ class FlexibleDataSlicer:
         return annotations
 
     def _group_dict_to_group_key(self, group: dict) -> str:
-        keys = [group[dim] for dim in self.group_by]
-        return 'grp-' + ','.join(map(str, keys))
+        return self._group_values_to_group_key(group[dim] for dim in self.group_by)
+
+    @classmethod
+    def _group_values_to_group_key(cls, values: Iterable) -> str:
+        return 'grp-' + ','.join(map(str, values))
 
     def decode_key(self, key: str) -> dict:
         if not key.startswith('grp-'):
@@ -498,18 +522,48 @@ class FlexibleDataSlicer:
 
     def get_parts_queryset(self):
         if self.split_by:
+            if self.clickhouse_active and all(
+                self._clickhouse_column(dim) for dim in self.split_by
+            ):
+                try:
+                    return self.get_parts_clickhouse()
+                except ClickhouseIncompatibleFilter:
+                    pass
             return self.get_possible_dimension_values_queryset(self.split_by)
         return None
 
+    def get_parts_clickhouse(self) -> SlicerRecords:
+        query = self.get_possible_dimension_values_queryset(self.split_by, use_clickhouse=True)
+        columns = [self._clickhouse_column(dim) for dim in self.split_by]
+        return SlicerRecords(
+            {
+                dim: self._clickhouse_value_to_python(column, getattr(rec, column))
+                for dim, column in zip(self.split_by, columns)
+            }
+            for rec in ch_backend.get_records(query)
+        )
+
     def get_data(self, lang='en', part: Optional[list] = None) -> QuerySet[dict]:
         """
         :param lang: language in which texts should be obtained - influences sorting
         :param part: when `split_by` is set, this defines for which part the result should be
                      obtained. It should be a list of the same length as `split_by`
         """
+        if self.can_use_clickhouse_for_data():
+            try:
+                return self.get_data_clickhouse(part=part)
+            except ClickhouseIncompatibleFilter:
+                # some filter cannot be expressed for clickhouse, we fall back to django ORM
+                pass
         # we do the following just before getting data in order to ensure the slicer is finalized
         # TODO: we could lock the slicer for further changes after that
+        # Note: materialized report types are not synced to clickhouse, so this must not be done
+        # before clickhouse is used
         self._replace_report_type_with_materialized()
+        if self.can_pivot_in_python() and self._use_pivot(
+            lambda: self.get_possible_groups_queryset().count()
+        ):
+            return self.get_data_pivot(lang=lang, part=part)
         qs = self.get_queryset(part=part)
         obs = []
         for ob in self.order_by:
@@ -567,6 +621,305 @@ class FlexibleDataSlicer:
             logger.debug('Slicer query: empty')
         return qs
 
+    def _use_pivot(self, group_count: Callable[[], int]) -> bool:
+        """
+        :param group_count: returns the number of possible groups, it is only called when
+                            the decision is not given by `pivot_in_python`
+        """
+        if self.pivot_in_python is not None:
+            return self.pivot_in_python
+        return group_count() > settings.SLICER_PIVOT_GROUP_THRESHOLD
+
+    def can_pivot_in_python(self) -> bool:
+        """
+        Tells if `get_data` can be computed by one GROUP BY query pivoted in Python. Zero usage
+        rows and tag roll-up need the primary dimension objects to be queried and only sorting
+        by groups and by the primary dimension itself is supported.
+        """
+        if self.include_all_zero_rows or self.tag_roll_up or not self.group_by:
+            return False
+        if self.primary_dimension in self.group_by:
+            return False
+        field, modifier = AccessLog.get_dimension_field(self.primary_dimension)
+        if not (
+            isinstance(field, ForeignKey)
+            or (field and self.primary_dimension.startswith('dim'))
+            or (isinstance(field, DateField) and modifier in ('', 'year'))
+        ):
+            # unsupported dimensions are reported by `get_queryset`
+            return False
+        for ob in self.order_by:
+            ob = ob.lstrip('-')
+            if not ob.startswith('grp-') and ob != self.primary_dimension:
+                return False
+        return True
+
+    def _check_pivot_group_count(self, group_count: int):
+        if group_count > settings.SLICER_PIVOT_MAX_GROUPS:
+            raise SlicerConfigError(
+                f'There are too many ({group_count}) possible groups, please refine '
+                f'your configuration',
+                SlicerConfigErrorCode.E101,
+                details={'group_count': group_count},
+            )
+
+    def get_data_pivot(self, lang='en', part: Optional[list] = None) -> SlicerRecords:
+        """
+        Computes the same data as `get_queryset`, but instead of one filtered aggregation for
+        each group, it aggregates by the primary dimension and the group dimensions at once and
+        pivots the result in Python. Only usable when `can_pivot_in_python` returns True.
+        """
+        self.check_params()
+        self.check_params_for_data_query()
+        self.check_part(part)
+
+        filters = {**self.filters}
+        if part:
+            for dim, value in zip(self.split_by, part):
+                fltr = self.filter_instance(dim, value)
+                filters.update(fltr.query_params())
+        groups = self.get_possible_groups_queryset()
+        group_keys = [
+            self._group_values_to_group_key(group)
+            for group in groups.values_list(*self.group_by)[: settings.SLICER_PIVOT_MAX_GROUPS + 1]
+        ]
+        self._check_pivot_group_count(len(group_keys))
+        records = (
+            AccessLog.objects.filter(**filters)
+            .values_list(self.primary_dimension, *self.group_by)
+            .annotate(value_sum=Sum('value'))
+            .order_by()
+        )
+        field, _modifier = AccessLog.get_dimension_field(self.primary_dimension)
+        out_key = 'pk' if isinstance(field, ForeignKey) else self.primary_dimension
+        rows = self._pivot_records(records.iterator(), group_keys, out_key)
+        self._sort_pivoted_rows(rows, out_key, lang=lang)
+        return rows
+
+    def _pivot_records(
+        self, records: Iterable[tuple], group_keys: List[str], out_key: str
+    ) -> SlicerRecords:
+        """
+        Turns records of the form (primary value, *group values, value) into rows with
+        one column for each of `group_keys`. Rows with zero total are dropped.
+        """
+        if not group_keys:
+            return SlicerRecords()
+        empty_row = dict.fromkeys(group_keys, 0)
+        empty_row['_total'] = 0
+        rows = {}
+        for primary_value, *group_values, value in records:
+            row = rows.get(primary_value)
+            if row is None:
+                row = rows[primary_value] = {out_key: primary_value, **empty_row}
+            key = self._group_values_to_group_key(group_values)
+            if key in empty_row:
+                # groups missing from the possible groups are ignored just like in SQL
+                row[key] += value
+            row['_total'] += value
+        return SlicerRecords(row for row in rows.values() if row['_total'] > 0)
+
+    def _sort_pivoted_rows(self, rows: SlicerRecords, out_key: str, lang='en'):
+        """
+        Sorts the rows in place according to `self.order_by` in the same way the database
+        would do it in `get_data`
+        """
+        # python sort is stable, so we sort by the least significant key first
+        for ob in reversed(self.order_by):
+            reverse = ob.startswith('-')
+            ob = ob.lstrip('-')
+            if ob.startswith('grp-'):
+                if rows and ob in rows[0]:
+                    rows.sort(key=operator.itemgetter(ob), reverse=reverse)
+                continue
+            if ob != self.primary_dimension:
+                logger.debug('Ignoring order by "%s"', ob)
+                continue
+            values = {row[out_key] for row in rows}
+            field, _modifier = AccessLog.get_dimension_field(ob)
+            if isinstance(field, ForeignKey):
+                # the same sort values as used by `get_data`
+                model = field.remote_field.model
+                qs = model.objects.filter(pk__in=values)
+                if ob == 'target':
+                    sort_values = dict(qs.values_list('pk', 'name'))
+                else:
+                    sort_values = dict(
+                        qs.annotate(
+                            sort_name=Concat(F(f'name_{lang}'), F('short_name'))
+                        ).values_list('pk', 'sort_name')
+                    )
+            elif ob.startswith('dim'):
+                sort_values = dict(
+                    DimensionText.objects.filter(pk__in=values).values_list('pk', 'text')
+                )
+            else:
+                sort_values = {value: value for value in values}
+
+            def sort_key(row):
+                value = sort_values.get(row[out_key])
+                # NULLs come last in ascending order in the database
+                return value is None, value
+
+            rows.sort(key=sort_key, reverse=reverse)
+
+    @classmethod
+    def _clickhouse_column(cls, dimension: str) -> Optional[str]:
+        """
+        Returns the name of the clickhouse column for `dimension` or None if there is none
+        """
+        field, modifier = AccessLog.get_dimension_field(dimension)
+        if not field or modifier:
+            return None
+        column = f'{dimension}_id' if isinstance(field, ForeignKey) else dimension
+        return column if column in AccessLogCube._dimensions else None
+
+    @classmethod
+    def _clickhouse_value_to_python(cls, column: str, value):
+        # NULLs are stored as zeros in clickhouse
+        if value == 0 and AccessLog._meta.get_field(column).null:
+            return None
+        return value
+
+    @property
+    def clickhouse_active(self) -> bool:
+        """
+        Clickhouse is used for computing data only when querying it is active in the settings
+        """
+        return settings.CLICKHOUSE_QUERY_ACTIVE and self.use_clickhouse
+
+    def can_use_clickhouse_for_data(self) -> bool:
+        """
+        Tells if `get_data` can be computed in Clickhouse. Zero usage rows, tag roll-up and
+        sorting by the names of objects need data which are only present in the database.
+        """
+        if not self.clickhouse_active or self.include_all_zero_rows or self.tag_roll_up:
+            return False
+        for dim in [self.primary_dimension, *self.group_by, *self.split_by]:
+            if not self._clickhouse_column(dim):
+                return False
+        for ob in self.order_by:
+            ob = ob.lstrip('-')
+            if ob.startswith('dim') or (ob.startswith(self.primary_dimension) and ob != 'date'):
+                return False
+        return True
+
+    def _clickhouse_group_aggregations(self, max_number=100) -> (dict, dict):
+        """
+        Clickhouse equivalent of `_prepare_annotations`. Returns a dict of aggregations and
+        a dict mapping the aggregation names to group keys. Group keys cannot be used as names
+        of aggregations directly because they are not valid identifiers.
+        """
+        aggregations = {'total_': HSum('value')}
+        names = {'total_': '_total'}
+        if not self.group_by:
+            return aggregations, names
+        query = self.get_possible_dimension_values_queryset(self.group_by, use_clickhouse=True)
+        group_count = ch_backend.get_count(query)
+        if group_count > max_number:
+            raise SlicerConfigError(
+                f'There are too many ({group_count}) possible groups, please refine '
+                f'your configuration',
+                SlicerConfigErrorCode.E101,
+                details={'group_count': group_count},
+            )
+        columns = [self._clickhouse_column(dim) for dim in self.group_by]
+        for i, group in enumerate(ch_backend.get_records(query)):
+            group = group._asdict()
+            key = self._group_dict_to_group_key(
+                {
+                    dim: self._clickhouse_value_to_python(column, group[column])
+                    for dim, column in zip(self.group_by, columns)
+                }
+            )
+            aggregations[f'grp{i}'] = HSum(
+                'value', filters=[{column: group[column] for column in columns}]
+            )
+            names[f'grp{i}'] = key
+        return aggregations, names
+
+    def get_data_clickhouse(self, part: Optional[list] = None) -> SlicerRecords:
+        """
+        Computes the same data as `get_queryset` in Clickhouse. Only usable when
+        `can_use_clickhouse_for_data` returns True.
+        """
+        self.check_params()
+        self.check_params_for_data_query()
+        self.check_part(part)
+
+        filters = self.create_filters(use_clickhouse=True)
+        if part:
+            for dim, value in zip(self.split_by, part):
+                fltr = self.filter_instance(dim, value)
+                filters.update(fltr.query_params(clickhouse_compatible=True))
+        primary = self._clickhouse_column(self.primary_dimension)
+        if self.primary_dimension not in self.group_by:
+            groups = self.get_possible_dimension_values_queryset(self.group_by, use_clickhouse=True)
+            if self._use_pivot(lambda: ch_backend.get_count(groups)):
+                return self._get_data_clickhouse_pivot(filters, groups)
+        aggregations, names = self._clickhouse_group_aggregations()
+        if len(aggregations) == 1:
+            # there are no groups and thus no data
+            return SlicerRecords()
+        query = AccessLogCube.query().filter(**filters).group_by(primary).aggregate(**aggregations)
+        key_to_name = {key: name for name, key in names.items()}
+        obs = []
+        for ob in self.order_by:
+            prefix = '-' if ob.startswith('-') else ''
+            ob = ob.lstrip('-')
+            if ob in key_to_name:
+                obs.append(prefix + key_to_name[ob])
+            elif ob == self.primary_dimension:
+                obs.append(prefix + primary)
+            else:
+                # unknown or inconsistent orderings are dropped in the same way as in `get_data`
+                logger.debug('Ignoring order by "%s"', ob)
+        if obs:
+            query = query.order_by(*obs)
+        out_key = 'pk' if primary.endswith('_id') else self.primary_dimension
+        result = SlicerRecords()
+        for rec in ch_backend.get_records(query):
+            rec = rec._asdict()
+            if not rec['total_']:
+                continue
+            row = {out_key: self._clickhouse_value_to_python(primary, rec.pop(primary))}
+            row.update((names[name], value) for name, value in rec.items())
+            result.append(row)
+        return result
+
+    def _get_data_clickhouse_pivot(self, filters: dict, groups) -> SlicerRecords:
+        """
+        Clickhouse equivalent of `get_data_pivot`
+        """
+        columns = [self._clickhouse_column(dim) for dim in self.group_by]
+        group_keys = [
+            self._group_values_to_group_key(
+                self._clickhouse_value_to_python(column, getattr(group, column))
+                for column in columns
+            )
+            for group in ch_backend.get_records(groups)
+        ]
+        self._check_pivot_group_count(len(group_keys))
+        primary = self._clickhouse_column(self.primary_dimension)
+        query = (
+            AccessLogCube.query()
+            .filter(**filters)
+            .group_by(primary, *columns)
+            .aggregate(value_sum=HSum('value'))
+        )
+        records = (
+            [
+                self._clickhouse_value_to_python(column, value)
+                for column, value in zip([primary, *columns], rec)
+            ]
+            + [rec.value_sum]
+            for rec in ch_backend.get_records(query)
+        )
+        out_key = 'pk' if primary.endswith('_id') else self.primary_dimension
+        rows = self._pivot_records(records, group_keys, out_key)
+        self._sort_pivoted_rows(rows, out_key)
+        return rows
+
     def get_remainder(self, part: Optional[list] = None) -> dict:
         """
         In case `tag_roll_up` is active, this gets the remaining usage for untagged objects.
@@ -587,11 +940,15 @@ class FlexibleDataSlicer:
                 tag_filters = [self.tag_filter] if self.tag_filter else []
                 if self.tag_class:
                     tag_filters.append(Q(tag_class_id=self.tag_class))
+                tags = Tag.objects.filter(tag_class__scope=tag_scope.value, *tag_filters)
+                if self.clickhouse_active:
+                    try:
+                        return self._get_remainder_clickhouse(primary_cls, tags, part=part)
+                    except ClickhouseIncompatibleFilter:
+                        pass
                 # find all untagged objects
                 # tag_scope.value is used to enforce string value - cachalot does not like enums
-                qs = primary_cls.objects.exclude(
-                    tags__in=Tag.objects.filter(tag_class__scope=tag_scope.value, *tag_filters)
-                )
+                qs = primary_cls.objects.exclude(tags__in=tags)
                 # apply the same filters that are used for the main query
                 if primary_cls is Organization and self.organization_filter is not None:
                     qs = qs.filter(pk__in=self.organization_filter)
@@ -617,6 +974,30 @@ class FlexibleDataSlicer:
         # and thus cannot be one of the taggable models (Organization, Platform, Title)
         raise ValueError('Remainder can only be computed when primary dimension supports tags')
 
+    def _get_remainder_clickhouse(self, primary_cls, tags: QuerySet, part=None) -> dict:
+        """
+        Computes the remainder in Clickhouse by excluding the ids of tagged objects
+        """
+        tagged_ids = primary_cls.objects.filter(tags__in=tags).values_list('pk', flat=True)
+        if tagged_ids.distinct().count() > CLICKHOUSE_ID_COUNT_LIMIT:
+            raise ClickhouseIncompatibleFilter('Too many tagged objects')
+        filters = self.create_filters(use_clickhouse=True)
+        if self.split_by and part:
+            for dim, value in zip(self.split_by, part):
+                fltr = self.filter_instance(dim, value)
+                filters.update(fltr.query_params(clickhouse_compatible=True))
+        primary = self._clickhouse_column(self.primary_dimension)
+        # zero stands for NULL - such records do not belong to any object
+        filters[f'{primary}__not_in'] = [0, *set(tagged_ids)]
+        aggregations, names = self._clickhouse_group_aggregations()
+        rec = ch_backend.get_one_record(
+            AccessLogCube.query().filter(**filters).aggregate(**aggregations)
+        )
+        out = {names[name]: value or 0 for name, value in rec._asdict().items()}
+        if not self.group_by:
+            out['total'] = out['_total']
+        return out
+
     def check_part(self, part):
         """
         Checks that the `split_by` definition is compatible with the part value given
@@ -840,7 +1221,7 @@ class SlicerConfigError(Exception):
     """
     E100: It is not possible to group by explicit dimension unless exactly one report
           type is selected by a filter
-    E101: There are too many possible groups, please refine you configuration,
+    E101: There are too many possible groups, please refine your configuration,
     E102: The specified primary dimension is not supported.
     E103: The specified primary dimension is not valid.
     E104: The attribute 'primary_dimension' must be present in the request.
@@ -0,0 +1,72 @@
+"""
+Streaming of tabular data into HTTP responses.
+
+CSV output is produced row by row, so the first bytes are sent as soon as the first rows are
+read from the database. XLSX files cannot be created incrementally, so the workbook is written
+into a temporary file in constant memory mode and the file is then streamed in chunks.
+"""
+import csv
+import tempfile
+from typing import Iterable, Iterator, List
+
+import xlsxwriter
+from django.http import StreamingHttpResponse
+
+from .queries import StatsComputer
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Echo:
+    """
+    File-like object which just returns what is written into it, to be used with `csv.writer`
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header: List[str], rows: Iterable[Iterable]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_xlsx(header: List[str], rows: Iterable[Iterable], chunk_size=64 * 1024) -> Iterator[bytes]:
+    with tempfile.NamedTemporaryFile('rb') as tmp_file:
+        workbook = xlsxwriter.Workbook(
+            tmp_file.name, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'}
+        )
+        sheet = workbook.add_worksheet()
+        sheet.write_row(0, 0, header)
+        for i, row in enumerate(rows, 1):
+            sheet.write_row(i, 0, row)
+        workbook.close()
+        while chunk := tmp_file.read(chunk_size):
+            yield chunk
+
+
+def stats_data_streaming_response(
+    computer: StatsComputer, user, data_format: str
+) -> StreamingHttpResponse:
+    """
+    Returns a response with the data of `computer` in `data_format` ('csv' or 'xlsx').
+
+    The columns are the same as those of the pandas based output - the primary and secondary
+    dimension followed by the value.
+    """
+    header = [computer.io_prim_dim_name]
+    if computer.io_sec_dim_name:
+        header.append(computer.io_sec_dim_name)
+    header.append('count')
+    rows = ([rec.get(key) for key in header] for rec in computer.iter_data(user))
+    if data_format == 'xlsx':
+        content, content_type = iter_xlsx(header, rows), XLSX_CONTENT_TYPE
+    else:
+        content, content_type = iter_csv(header, rows), 'text/csv'
+    return StreamingHttpResponse(
+        content,
+        content_type=content_type,
+        headers={'Content-Disposition': f'attachment; filename="export.{data_format}"'},
+    )
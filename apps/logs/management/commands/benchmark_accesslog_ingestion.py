@@ -0,0 +1,78 @@
+from itertools import chain
+from random import choice, randint
+from time import monotonic, process_time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.transaction import atomic, set_rollback
+from logs.logic.copy_binary import ingest_import_batch_data_binary
+from logs.logic.data_import import CSVStream, ingest_import_batch_data
+from logs.models import ImportBatch, Metric, ReportType
+from organizations.models import Organization
+from publications.models import Platform, Title
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compares the speed of CSV and binary COPY ingestion of AccessLog data on a synthetic '
+        'import batch. All the data are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('report_type', help='short name of the report type to use')
+        parser.add_argument('-n', dest='rows', type=int, default=1_000_000, help='number of rows')
+        parser.add_argument(
+            '-r', dest='repeat', type=int, default=1, help='number of runs of each method'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            report_type = ReportType.objects.get(short_name=options['report_type'])
+        except ReportType.DoesNotExist:
+            raise CommandError(f'Report type "{options["report_type"]}" does not exist')
+        organization = Organization.objects.first()
+        platform = Platform.objects.first()
+        metric_ids = list(Metric.objects.values_list('pk', flat=True)[:20])
+        title_ids = list(Title.objects.values_list('pk', flat=True)[:10_000]) or [None]
+        if not organization or not platform or not metric_ids:
+            raise CommandError('At least one organization, platform and metric must exist')
+
+        columns = ['metric_id', 'target_id'] + [
+            f'dim{i+1}' for i, _dim in enumerate(report_type.dimensions_sorted)
+        ]
+        # dimension values are not FKs, so any number will do
+        rows = [
+            [choice(metric_ids), choice(title_ids)] + [randint(1, 100) for _col in columns[2:]]
+            for _i in range(options['rows'])
+        ]
+        columns.append('value')
+        for row in rows:
+            row.append(randint(1, 1000))
+        self.stderr.write(f'Prepared {len(rows)} rows with columns: {", ".join(columns)}')
+
+        def csv_method(ib):
+            ingest_import_batch_data(ib, CSVStream(chain([columns], rows)), headers=columns)
+
+        def binary_method(ib):
+            ingest_import_batch_data_binary(ib, columns, rows)
+
+        for name, method in [('csv', csv_method), ('binary', binary_method)]:
+            for i in range(options['repeat']):
+                with atomic():
+                    ib = ImportBatch.objects.create(
+                        report_type=report_type,
+                        organization=organization,
+                        platform=platform,
+                        date='1970-01-01',
+                    )
+                    start = monotonic()
+                    cpu_start = process_time()
+                    method(ib)
+                    duration = monotonic() - start
+                    cpu_duration = process_time() - cpu_start
+                    count = ib.accesslog_set.count()
+                    set_rollback(True)
+                self.stdout.write(
+                    f'{name} #{i+1}: {duration:.2f} s (python CPU: {cpu_duration:.2f} s), '
+                    f'{count / duration:.0f} rows/s'
+                )
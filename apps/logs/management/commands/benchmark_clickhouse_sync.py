@@ -0,0 +1,69 @@
+from time import monotonic, process_time
+
+from django.core.management.base import BaseCommand
+from logs.cubes import AccessLogCube, ch_backend
+from logs.models import AccessLog
+
+
+class BenchmarkAccessLogCube(AccessLogCube):
+    """
+    Same as AccessLogCube, but stored in a separate table, so that the real data are not touched
+    """
+
+    class Clickhouse(AccessLogCube.Clickhouse):
+        table_name = 'AccessLogCubeBenchmark'
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Compares the speed of syncing AccessLogs into ClickHouse record by record and in '
+        'columnar form. Existing AccessLogs are written into a temporary ClickHouse table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', dest='rows', type=int, default=1_000_000, help='maximum number of rows'
+        )
+        parser.add_argument('-b', dest='batch_size', type=int, default=100_000)
+        parser.add_argument(
+            '-r', dest='repeat', type=int, default=1, help='number of runs of each method'
+        )
+
+    def handle(self, *args, **options):
+        cube = BenchmarkAccessLogCube
+        batch_size = options['batch_size']
+        qs = AccessLog.objects.filter(report_type__materialization_spec__isnull=True).order_by(
+            'import_batch_id'
+        )[: options['rows']]
+
+        def records_method():
+            to_write = []
+            for al in qs.values().iterator(chunk_size=batch_size):
+                to_write.append(cube.translate_accesslog_dict_to_cube(al))
+                if len(to_write) >= batch_size:
+                    ch_backend.store_records(cube, to_write)
+                    to_write = []
+            if to_write:
+                ch_backend.store_records(cube, to_write)
+
+        def columnar_method():
+            cube.sync_accesslogs_with_cube(ch_backend, qs, batch_size=batch_size)
+
+        try:
+            for name, method in [('records', records_method), ('columnar', columnar_method)]:
+                for i in range(options['repeat']):
+                    ch_backend.drop_storage(cube)
+                    ch_backend.initialize_storage(cube)
+                    start = monotonic()
+                    cpu_start = process_time()
+                    method()
+                    duration = monotonic() - start
+                    cpu_duration = process_time() - cpu_start
+                    count = ch_backend.get_count(cube.query())
+                    self.stdout.write(
+                        f'{name} #{i+1}: {duration:.2f} s (python CPU: {cpu_duration:.2f} s), '
+                        f'{count / duration:.0f} rows/s'
+                    )
+        finally:
+            ch_backend.drop_storage(cube)
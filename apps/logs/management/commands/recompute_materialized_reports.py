@@ -14,6 +14,6 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         start = time()
         stats = recompute_materialized_reports(
-            progress_callback=lambda x: print(f'Done {x} batches')
+            progress_callback=lambda x: print(f'Done {x} report types')
         )
         logger.info('Duration: %s, Stats: %s', time() - start, stats)
@@ -1,13 +1,15 @@
 import logging
-from time import time
+from time import sleep, time
 
 from django.core.management.base import BaseCommand
 from django.db.models import F, Q
 from logs.logic.clickhouse import (
+    create_clickhouse_resync_shards,
     sync_accesslogs_with_clickhouse_superfast,
     sync_import_batch_with_clickhouse,
 )
-from logs.models import ImportBatch
+from logs.models import ClickhouseResyncShard, ImportBatch
+from logs.tasks import sync_clickhouse_resync_shard_task
 
 logger = logging.getLogger(__name__)
 
@@ -29,9 +31,42 @@ class Command(BaseCommand):
             action='store_true',
             help='use a much slower but memory friendly (for the postgres server) method',
         )
+        parser.add_argument(
+            '-s',
+            dest='shards',
+            type=int,
+            default=0,
+            help='split import batches into this number of shards and sync them concurrently '
+            'using celery workers',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='continue syncing unfinished shards of a previous sharded sync',
+        )
+        parser.add_argument(
+            '-w',
+            dest='wait',
+            action='store_true',
+            help='wait for the sharded sync to finish and report progress of the shards',
+        )
 
     def handle(self, *args, **options):
         start = time()
+        if options['shards'] or options['resume']:
+            if options['resume']:
+                shards = list(ClickhouseResyncShard.objects.filter(finished__isnull=True))
+            else:
+                shards = create_clickhouse_resync_shards(
+                    options['shards'], ignore_timestamps=options['all']
+                )
+            for shard in shards:
+                sync_clickhouse_resync_shard_task.delay(shard.pk)
+            logger.info('Dispatched %d shards', len(shards))
+            if options['wait']:
+                self.wait_for_shards([shard.pk for shard in shards])
+                logger.info('Duration: %s', time() - start)
+            return
         if options['save_memory']:
             count = 0
             qs = ImportBatch.objects.all()
@@ -48,3 +83,18 @@ class Command(BaseCommand):
         else:
             count = sync_accesslogs_with_clickhouse_superfast(ignore_timestamps=options['all'])
         logger.info('Duration: %s, Count: %s', time() - start, count)
+
+    def wait_for_shards(self, shard_ids, interval=10):
+        while True:
+            sleep(interval)
+            shards = list(ClickhouseResyncShard.objects.filter(pk__in=shard_ids))
+            for shard in shards:
+                state = 'done' if shard.finished else f'at #{shard.checkpoint}'
+                self.stderr.write(
+                    f'Shard {shard}: {state}, {shard.rows} rows, {shard.rows_per_second:.0f} rows/s'
+                )
+            if all(shard.finished for shard in shards):
+                break
+            self.stderr.write('')
+        total = sum(shard.rows for shard in shards)
+        self.stdout.write(f'Synced {total} rows in {len(shards)} shards')
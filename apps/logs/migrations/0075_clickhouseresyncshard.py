@@ -0,0 +1,46 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('logs', '0074_mdu_method')]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClickhouseResyncShard',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('first_import_batch_id', models.PositiveBigIntegerField()),
+                ('last_import_batch_id', models.PositiveBigIntegerField()),
+                (
+                    'ignore_timestamps',
+                    models.BooleanField(
+                        default=True,
+                        help_text='Sync all import batches, not only those changed since last sync',
+                    ),
+                ),
+                (
+                    'checkpoint',
+                    models.PositiveBigIntegerField(
+                        blank=True,
+                        help_text='Id of the last import batch which was completely synced',
+                        null=True,
+                    ),
+                ),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                (
+                    'sync_seconds',
+                    models.FloatField(default=0, help_text='Time spent syncing the rows'),
+                ),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={'ordering': ('first_import_batch_id',)},
+        )
+    ]
@@ -0,0 +1,56 @@
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+# converts the `r<report_type_id>: <timestamp>` records from `ImportBatch.materialization_data`
+COPY_MATERIALIZATION_DATA_SQL = """
+INSERT INTO logs_importbatchmaterialization (report_type_id, import_batch_id, materialized)
+    SELECT rt.id, ib.id, to_timestamp(data.value::float)
+    FROM logs_importbatch AS ib
+        CROSS JOIN LATERAL jsonb_each_text(ib.materialization_data) AS data (key, value)
+        JOIN logs_reporttype AS rt ON 'r' || rt.id = data.key;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('logs', '0075_clickhouseresyncshard')]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatchMaterialization',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'materialized',
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        help_text='When the data used for materialization were read',
+                    ),
+                ),
+                (
+                    'import_batch',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='materializations',
+                        to='logs.importbatch',
+                    ),
+                ),
+                (
+                    'report_type',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to='logs.reporttype'
+                    ),
+                ),
+            ],
+            options={'unique_together': {('report_type', 'import_batch')}},
+        ),
+        migrations.RunSQL(COPY_MATERIALIZATION_DATA_SQL, migrations.RunSQL.noop),
+        migrations.RemoveField(model_name='importbatch', name='materialization_data'),
+    ]
@@ -456,11 +456,6 @@ class ImportBatch(models.Model):
     interest_timestamp = models.DateTimeField(
         null=True, blank=True, help_text='When was interest processed for this batch'
     )
-    materialization_data = models.JSONField(
-        default=dict,
-        blank=True,
-        help_text='Internal information about materialized report data in this batch',
-    )
     last_clickhoused = models.DateTimeField(
         null=True, help_text='When was the import batch last synced with clickhouse'
     )
@@ -479,6 +474,23 @@ class ImportBatch(models.Model):
         return self.PREPROCESSED_DATA_DIR / f"ib-{self.pk}.csv"
 
 
+class ImportBatchMaterialization(models.Model):
+    """
+    Records that data of an import batch were materialized into a materialized report type
+    """
+
+    report_type = models.ForeignKey(ReportType, on_delete=models.CASCADE)
+    import_batch = models.ForeignKey(
+        ImportBatch, on_delete=models.CASCADE, related_name='materializations'
+    )
+    materialized = models.DateTimeField(
+        default=now, help_text='When the data used for materialization were read'
+    )
+
+    class Meta:
+        unique_together = (('report_type', 'import_batch'),)
+
+
 class AccessLogQuerySet(QuerySet):
     def delete(self, i_know_what_i_am_doing=False):
         if not i_know_what_i_am_doing:
@@ -1253,6 +1265,37 @@ class ImportBatchSyncLog(CreatedUpdatedMixin, models.Model):
     state = models.PositiveSmallIntegerField(choices=STATE_CHOICES, default=STATE_NO_CHANGE)
 
 
+class ClickhouseResyncShard(models.Model):
+    """
+    One part of a full resync of AccessLogs with Clickhouse. The import batches are split into
+    shards by their id and each shard is synced separately, so that shards may be processed
+    concurrently. The progress of a shard is checkpointed, so an interrupted resync may be resumed.
+    """
+
+    first_import_batch_id = models.PositiveBigIntegerField()
+    last_import_batch_id = models.PositiveBigIntegerField()
+    ignore_timestamps = models.BooleanField(
+        default=True, help_text='Sync all import batches, not only those changed since last sync'
+    )
+    checkpoint = models.PositiveBigIntegerField(
+        null=True, blank=True, help_text='Id of the last import batch which was completely synced'
+    )
+    rows = models.PositiveBigIntegerField(default=0)
+    sync_seconds = models.FloatField(default=0, help_text='Time spent syncing the rows')
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('first_import_batch_id',)
+
+    def __str__(self):
+        return f'#{self.first_import_batch_id}-#{self.last_import_batch_id}'
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.sync_seconds if self.sync_seconds else 0
+
+
 class LastAction(CreatedUpdatedMixin, models.Model):
     """
     Stores information about when an action was last made, so that it can be used in caching
@@ -4,6 +4,11 @@ from django.db.transaction import on_commit
 from django.dispatch import receiver
 from logs.constants import ACTION_INTEREST_CHANGE
 from logs.logic.clickhouse import delete_import_batch_from_clickhouse
+from logs.logic.data_import import SharedTitleCache
+from logs.logic.reporting.cache import (
+    invalidate_slicer_cache_for_import_batch,
+    invalidate_slicer_cache_for_tags,
+)
 from logs.models import (
     ImportBatch,
     ImportBatchSyncLog,
@@ -11,7 +16,8 @@ from logs.models import (
     ManualDataUpload,
     ReportInterestMetric,
 )
-from publications.models import PlatformInterestReport
+from publications.models import PlatformInterestReport, Title
+from tags.models import OrganizationTag, PlatformTag, Tag, TaggingBatch, TitleTag
 
 
 @receiver(post_delete, sender=ImportBatch)
@@ -34,6 +40,15 @@ def import_batch_create_sync_log(sender, instance: ImportBatch, using, **kwargs)
     )
 
 
+@receiver([post_delete, post_save], sender=ImportBatch)
+def import_batch_invalidate_slicer_cache(sender, instance: ImportBatch, using, **kwargs):
+    if kwargs.get('created', True):
+        # import batches do not change their data after creation, so only creation and
+        # deletion are relevant
+        args = (instance.report_type_id, instance.organization_id, instance.platform_id)
+        on_commit(lambda: invalidate_slicer_cache_for_import_batch(*args))
+
+
 @receiver(post_save, sender=ManualDataUpload)
 def mdu_prepare_preflight(sender, instance: ManualDataUpload, using, created, **kwargs):
     if created:
@@ -48,3 +63,19 @@ def store_last_action_interest_change_pir(sender, instance, using, **kwargs):
 @receiver([post_delete, post_save], sender=ReportInterestMetric)
 def store_last_action_interest_change_rim(sender, instance, using, **kwargs):
     LastAction.update_action(ACTION_INTEREST_CHANGE)
+
+
+@receiver(post_delete, sender=Title)
+def title_delete_invalidate_title_cache(sender, instance: Title, using, **kwargs):
+    # this covers title merging as well because merged titles are deleted
+    on_commit(SharedTitleCache.invalidate)
+
+
+@receiver([post_delete, post_save], sender=Tag)
+@receiver([post_delete, post_save], sender=TitleTag)
+@receiver([post_delete, post_save], sender=PlatformTag)
+@receiver([post_delete, post_save], sender=OrganizationTag)
+@receiver(post_save, sender=TaggingBatch)
+def tags_change_invalidate_slicer_cache(sender, instance, using, **kwargs):
+    # tagging batches use bulk operations which do not send signals for individual tags
+    on_commit(invalidate_slicer_cache_for_tags)
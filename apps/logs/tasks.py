@@ -12,8 +12,9 @@ import celery
 from core.context_managers import needs_clickhouse_sync
 from core.logic.error_reporting import email_if_fails
 from core.models import User
-from core.task_support import cache_based_lock
+from core.task_support import cache_based_lock, cache_based_semaphore
 from core.tasks import async_mail_admins
+from django.conf import settings
 from django.db import DatabaseError
 from django.db.models import Q
 from django.db.transaction import atomic
@@ -25,10 +26,19 @@ from logs.exceptions import (
     NibblerErrors,
     UnknownReportTypeInPreflight,
 )
-from logs.logic.attempt_import import check_importable_attempt, import_one_sushi_attempt
-from logs.logic.clickhouse import compare_db_with_clickhouse, process_one_import_batch_sync_log
+from logs.logic.attempt_import import (
+    ImportThroughput,
+    check_importable_attempt,
+    import_importing_attempts_one_by_one,
+    import_one_sushi_attempt,
+)
+from logs.logic.clickhouse import (
+    compare_db_with_clickhouse,
+    process_one_import_batch_sync_log,
+    sync_clickhouse_resync_shard_by_id,
+)
 from logs.logic.custom_import import custom_import_preflight_check, import_custom_data
-from logs.logic.export import CSVExport
+from logs.logic.export import ArrowExport, CSVExport
 from logs.logic.materialized_interest import (
     recompute_interest_by_batch,
     smart_interest_sync,
@@ -62,11 +72,23 @@ def sync_interest_task():
 
 @celery.shared_task
 @email_if_fails
-@atomic
 def import_new_sushi_attempts_task():
     """
     Go over new sushi attempts that contain data and import them
+
+    When `SUSHI_IMPORT_WORKERS` is set, the attempts are not imported here, but by that many
+    `import_sushi_attempts_worker_task` tasks running in parallel.
     """
+    if settings.SUSHI_IMPORT_WORKERS:
+        for _i in range(settings.SUSHI_IMPORT_WORKERS):
+            import_sushi_attempts_worker_task.delay()
+    else:
+        import_new_sushi_attempts_serially()
+
+
+@atomic
+def import_new_sushi_attempts_serially():
+    throughput = ImportThroughput()
     try:
         # select_for_update locks fetch attempts
         attempts = SushiFetchAttempt.objects.select_for_update(nowait=True).filter(
@@ -78,7 +100,7 @@ def import_new_sushi_attempts_task():
         for i, attempt in enumerate(attempts):
             logger.info('----- Importing attempt #%d -----', i)
             try:
-                import_one_sushi_attempt(attempt)
+                throughput.add(import_one_sushi_attempt(attempt))
             except Exception as e:
                 # we catch any kind of error to make sure that the loop does not die
                 logger.error('Importing sushi attempt #%d crashed: %s', attempt.pk, e)
@@ -92,6 +114,28 @@ def import_new_sushi_attempts_task():
 
     except DatabaseError:
         logger.warning("Sushi import attempts are currently being processed.")
+    else:
+        logger.info('Imported %s', throughput)
+
+
+@celery.shared_task
+@email_if_fails
+def import_sushi_attempts_worker_task():
+    """
+    One worker of the parallel import of sushi attempts. Each attempt is claimed and imported
+    in its own transaction, so that the workers do not block each other.
+    """
+    with cache_based_semaphore(
+        'import_sushi_attempts_worker', settings.SUSHI_IMPORT_WORKERS
+    ) as acquired:
+        if not acquired:
+            logger.info('All sushi import workers are already running')
+            return None
+        throughput = import_importing_attempts_one_by_one(
+            max_per_platform=settings.SUSHI_IMPORT_MAX_PER_PLATFORM,
+            max_per_organization=settings.SUSHI_IMPORT_MAX_PER_ORGANIZATION,
+        )
+        return throughput.as_dict()
 
 
 @celery.shared_task
@@ -157,11 +201,15 @@ def smart_interest_sync_task():
 
 @celery.shared_task
 @email_if_fails
-def export_raw_data_task(query_params, filename_base, zip_compress=False):
+def export_raw_data_task(query_params, filename_base, zip_compress=False, fmt=None):
     """
-    Exports raw data into a file in the MEDIA directory
+    Exports raw data into a file in the MEDIA directory. If `fmt` is given, a columnar
+    format ('parquet' or 'arrow') is used instead of CSV.
     """
-    exporter = CSVExport(query_params, zip_compress=zip_compress, filename_base=filename_base)
+    if fmt:
+        exporter = ArrowExport(query_params, fmt=fmt, filename_base=filename_base)
+    else:
+        exporter = CSVExport(query_params, zip_compress=zip_compress, filename_base=filename_base)
     try:
         exporter.export_raw_accesslogs_to_file()
     except Exception as e:
@@ -254,6 +302,15 @@ def process_one_import_batch_sync_log_task(import_batch_id):
     process_one_import_batch_sync_log(import_batch_id)
 
 
+@celery.shared_task
+@email_if_fails
+def sync_clickhouse_resync_shard_task(shard_id: int):
+    """
+    Syncs one shard of a full resync with Clickhouse
+    """
+    sync_clickhouse_resync_shard_by_id(shard_id)
+
+
 @celery.shared_task
 @email_if_fails
 @atomic
@@ -1,7 +1,7 @@
 import json
 import locale
-from datetime import timedelta
-from io import StringIO
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
 from unittest.mock import patch
 
 import pytest
@@ -18,10 +18,12 @@ from core.tests.conftest import (  # noqa - fixtures
 from django.db.models import Max, Min
 from django.urls import reverse
 from logs.models import AccessLog, Dimension, DimensionText, MduMethod, Metric, ReportType
+from openpyxl import load_workbook
 from organizations.models import UserOrganization
 from publications.logic.fake_data import TitleFactory
 from publications.models import Platform
 from publications.tests.conftest import interest_rt  # noqa - fixtures
+from recache.models import CachedQuery
 from sushi.models import AttemptStatus, CounterReportsToCredentials
 
 from test_fixtures.entities.credentials import CredentialsFactory
@@ -105,6 +107,46 @@ class TestChartDataAPI:
         assert resp.status_code == 200
         assert 'data' in resp.json()
 
+    @pytest.mark.parametrize(
+        ['primary_dim', 'secondary_dim'], [['platform', None], ['date', 'metric']]
+    )
+    def test_api_data_with_recache_hit(
+        self,
+        counter_records,
+        organizations,
+        report_type_nd,
+        primary_dim,
+        secondary_dim,
+        master_admin_client,
+    ):
+        """
+        The second request is answered from recache and must return the same data
+        """
+        platform = Platform.objects.create(
+            ext_id=1234, short_name='Platform1', name='Platform 1', provider='Provider 1'
+        )
+        data = [
+            ['Title1', '2018-01-01', '1v1', '2v1', '3v1', 1],
+            ['Title1', '2018-01-01', '1v2', '2v1', '3v1', 2],
+        ]
+        crs = list(counter_records(data, metric='Hits', platform='Platform1'))
+        organization = organizations["branch"]
+        report_type = report_type_nd(3)
+        import_counter_records(report_type, organization, platform, crs)
+        params = {'organization': organization.pk, 'prim_dim': primary_dim, 'dashboard': True}
+        if secondary_dim:
+            params['sec_dim'] = secondary_dim
+        url = reverse('chart_data_raw', args=(report_type.pk,))
+        resp = master_admin_client.get(url, params)
+        assert resp.status_code == 200
+        assert CachedQuery.objects.count() == 1
+        data = resp.json()['data']
+        assert type(data) is list
+        assert len(data) == 1
+        resp = master_admin_client.get(url, params)
+        assert resp.status_code == 200
+        assert resp.json()['data'] == data
+
     @pytest.mark.parametrize(
         'primary_dim, secondary_dim, count',
         [
@@ -220,6 +262,87 @@ class TestChartDataAPI:
         assert 'data' in data
         assert data['data'] == result
 
+    @pytest.mark.parametrize(
+        'primary_dim, secondary_dim, result',
+        [
+            ['date', None, ['date,count', '2018-01-01,3']],
+            ['date', 1, ['date,dim0,count', '2018-01-01,1v1,1', '2018-01-01,1v2,2']],
+            ['platform', 'metric', ['platform,metric,count', 'Platform1,Hits,3']],
+        ],
+    )
+    def test_api_csv_output(
+        self,
+        counter_records,
+        organizations,
+        report_type_nd,
+        primary_dim,
+        secondary_dim,
+        result,
+        master_admin_client,
+    ):
+        platform = Platform.objects.create(
+            ext_id=1234, short_name='Platform1', name='Platform 1', provider='Provider 1'
+        )
+        data = [
+            ['Title1', '2018-01-01', '1v1', '2v1', '3v1', 1],
+            ['Title1', '2018-01-01', '1v2', '2v1', '3v1', 2],
+        ]
+        crs = list(counter_records(data, metric='Hits', platform='Platform1'))
+        organization = organizations["branch"]
+        report_type = report_type_nd(3)
+        import_counter_records(report_type, organization, platform, crs)
+        params = {'organization': organization.pk, 'prim_dim': primary_dim, 'format': 'csv'}
+        if secondary_dim:
+            if type(secondary_dim) is int:
+                params['sec_dim'] = report_type.dimensions_sorted[secondary_dim - 1].short_name
+            else:
+                params['sec_dim'] = secondary_dim
+        resp = master_admin_client.get(reverse('chart_data_raw', args=(report_type.pk,)), params)
+        assert resp.status_code == 200
+        assert resp.streaming
+        assert resp['Content-Disposition'] == 'attachment; filename="export.csv"'
+        assert b''.join(resp.streaming_content).decode('utf-8').splitlines() == result
+
+    @pytest.mark.parametrize(
+        ['primary_dim', 'secondary_dim', 'result'],
+        [
+            ['date', None, [('date', 'count'), (datetime(2018, 1, 1), 3)]],
+            ['platform', 'metric', [('platform', 'metric', 'count'), ('Platform1', 'Hits', 3)]],
+        ],
+    )
+    def test_api_xlsx_output(
+        self,
+        counter_records,
+        organizations,
+        report_type_nd,
+        primary_dim,
+        secondary_dim,
+        result,
+        master_admin_client,
+    ):
+        platform = Platform.objects.create(
+            ext_id=1234, short_name='Platform1', name='Platform 1', provider='Provider 1'
+        )
+        data = [
+            ['Title1', '2018-01-01', '1v1', '2v1', '3v1', 1],
+            ['Title1', '2018-01-01', '1v2', '2v1', '3v1', 2],
+        ]
+        crs = list(counter_records(data, metric='Hits', platform='Platform1'))
+        organization = organizations["branch"]
+        report_type = report_type_nd(3)
+        import_counter_records(report_type, organization, platform, crs)
+        params = {'organization': organization.pk, 'prim_dim': primary_dim, 'format': 'xlsx'}
+        if secondary_dim:
+            params['sec_dim'] = secondary_dim
+        resp = master_admin_client.get(reverse('chart_data_raw', args=(report_type.pk,)), params)
+        assert resp.status_code == 200
+        assert resp.streaming
+        assert resp['Content-Disposition'] == 'attachment; filename="export.xlsx"'
+        sheet = load_workbook(BytesIO(b''.join(resp.streaming_content))).active
+        assert list(sheet.values) == result
+        if primary_dim == 'date':
+            assert sheet['A2'].number_format == 'yyyy-mm-dd'
+
     def test_api_filtering(
         self, counter_records, organizations, report_type_nd, authenticated_client
     ):
@@ -4,6 +4,7 @@ from unittest.mock import patch
 import pytest
 from core.logic.dates import month_end, parse_date
 from core.models import UL_ORG_ADMIN
+from core.task_support import cache_based_semaphore
 from django.core.files.base import ContentFile
 from django.db.models import Sum
 from sushi.models import AttemptStatus, SushiCredentials, SushiFetchAttempt
@@ -19,7 +20,11 @@ from test_fixtures.scenarios.basic import (  # noqa - fixtures
 )
 
 from ..exceptions import UnknownMetric
-from ..logic.attempt_import import check_importable_attempt, import_one_sushi_attempt
+from ..logic.attempt_import import (
+    check_importable_attempt,
+    import_importing_attempts_one_by_one,
+    import_one_sushi_attempt,
+)
 from ..models import Metric
 
 
@@ -322,3 +327,51 @@ class TestAttemptImport:
             with pytest.raises(UnknownMetric):
                 import_one_sushi_attempt(fetch_attempt)
             assert metric_count == Metric.objects.count(), "no new metric created"
+
+    @pytest.mark.parametrize(['platform_busy'], [(False,), (True,)])
+    def test_import_one_by_one(
+        self, organizations, counter_report_type_named, platforms, platform_busy
+    ):
+        cr_type = counter_report_type_named('TR', version=5)
+        creds = SushiCredentials.objects.create(
+            organization=organizations["empty"],
+            platform=platforms["empty"],
+            counter_version=5,
+            lock_level=UL_ORG_ADMIN,
+            url="http://a.b.c/",
+        )
+        attempts = []
+        for _i in range(2):
+            with (Path(__file__).parent / "data/counter5/5_TR_with_warning.json").open() as f:
+                data_file = ContentFile(f.read())
+                data_file.name = "something.json"
+            attempts.append(
+                FetchAttemptFactory.create(
+                    credentials=creds,
+                    counter_report=cr_type,
+                    start_date="2018-11-01",
+                    end_date="2018-11-30",
+                    data_file=data_file,
+                    status=AttemptStatus.IMPORTING,
+                )
+            )
+
+        with cache_based_semaphore(
+            f'sushi_import_platform_{platforms["empty"].pk}', 1 if platform_busy else 0
+        ):
+            throughput = import_importing_attempts_one_by_one(max_per_platform=1)
+
+        for attempt in attempts:
+            attempt.refresh_from_db()
+        if platform_busy:
+            # another worker holds the only slot for the platform
+            assert throughput.attempts == 0
+            assert all(attempt.status == AttemptStatus.IMPORTING for attempt in attempts)
+        else:
+            assert throughput.attempts == 2
+            # the second attempt clashes with the import batch of the first one
+            assert {attempt.status for attempt in attempts} == {
+                AttemptStatus.SUCCESS,
+                AttemptStatus.IMPORT_FAILED,
+            }
+            assert throughput.records == 8
@@ -2,6 +2,7 @@ from typing import Union
 from unittest.mock import patch
 
 import pytest
+from django.core.cache import cache
 from django.core.management import call_command
 from django.db import connection
 from django.db.models import Sum
@@ -10,13 +11,18 @@ from logs.cubes import AccessLogCube, ch_backend
 from logs.logic.clickhouse import (
     ComparisonResult,
     compare_db_with_clickhouse,
+    create_clickhouse_resync_shards,
     process_one_import_batch_sync_log,
     resync_import_batch_with_clickhouse,
     sync_accesslogs_with_clickhouse_superfast,
+    sync_clickhouse_resync_shard,
     sync_import_batch_with_clickhouse,
 )
 from logs.logic.data_import import import_counter_records
 from logs.logic.materialized_interest import smart_interest_sync, sync_interest_by_import_batches
+from logs.logic.reporting.cache import SlicerCache
+from logs.logic.reporting.filters import ForeignKeyDimensionFilter
+from logs.logic.reporting.slicer import FlexibleDataSlicer
 from logs.models import (
     AccessLog,
     ImportBatch,
@@ -137,6 +143,22 @@ class TestClickhouseSync:
             assert ib.last_clickhoused is not None
             assert ib.last_clickhoused > ib.last_updated
 
+    def test_synced_values(self, counter_records, organizations, report_type_nd):
+        """
+        Values synced in columnar form match the values in the database, NULLs become zeros
+        """
+        self._prepare_counter_records(counter_records, organizations, report_type_nd)
+        expected = [
+            AccessLogCube.translate_accesslog_dict_to_cube(al)._asdict()
+            for al in AccessLog.objects.order_by('pk').values()
+        ]
+        ch_recs = sorted(
+            (rec._asdict() for rec in ch_backend.get_records(AccessLogCube.query())),
+            key=lambda rec: rec['id'],
+        )
+        assert ch_recs == expected
+        assert expected[0]['dim4'] == 0
+
     def test_general_accesslog_sync(self, counter_records, organizations, report_type_nd):
         self._prepare_counter_records(counter_records, organizations, report_type_nd, lowlevel=True)
         assert AccessLog.objects.count() == 6
@@ -147,6 +169,36 @@ class TestClickhouseSync:
         # retry to check no more syncs will be done
         assert sync_accesslogs_with_clickhouse_superfast() == 0, 'no more syncs'
 
+    def test_resync_shards(self, counter_records, organizations, report_type_nd):
+        *_, ibs = self._prepare_counter_records(
+            counter_records, organizations, report_type_nd, lowlevel=True
+        )
+        shards = create_clickhouse_resync_shards(2, ignore_timestamps=True)
+        assert len(shards) == 2
+        assert shards[0].first_import_batch_id == min(ib.pk for ib in ibs)
+        assert shards[1].last_import_batch_id == max(ib.pk for ib in ibs)
+        assert sum(sync_clickhouse_resync_shard(shard) for shard in shards) == 6
+        assert len(list(ch_backend.get_records(AccessLogCube.query()))) == 6
+        for shard in shards:
+            shard.refresh_from_db()
+            assert shard.finished is not None
+            assert shard.checkpoint == shard.last_import_batch_id
+            assert shard.rows_per_second > 0
+        assert sync_clickhouse_resync_shard(shards[0]) == 0, 'finished shard is not synced again'
+
+    def test_resync_shard_resume(self, counter_records, organizations, report_type_nd):
+        *_, ibs = self._prepare_counter_records(
+            counter_records, organizations, report_type_nd, lowlevel=True
+        )
+        (shard,) = create_clickhouse_resync_shards(1, ignore_timestamps=True)
+        first_ib = min(ibs, key=lambda ib: ib.pk)
+        # simulate a sync interrupted after the first import batch
+        shard.checkpoint = first_ib.pk
+        shard.save()
+        expected = AccessLog.objects.exclude(import_batch=first_ib).count()
+        assert sync_clickhouse_resync_shard(shard, import_batch_chunk=1) == expected
+        assert shard.rows == expected
+
     def test_one_import_batch_sync_interest_calculation(
         self, counter_records, organizations, report_type_nd
     ):
@@ -336,6 +388,32 @@ class TestClickhouseSync:
             == 2 * old_sum_cube
         ), 'the interest with the new metric should be doubled'
 
+    def test_slicer_cache_invalidated_by_sync(
+        self, counter_records, organizations, report_type_nd, settings
+    ):
+        """
+        Tests that reports computed from ClickHouse before the data were synced are not used
+        from the cache after the sync
+        """
+        settings.SLICER_CACHE_TIMEOUT = 3600
+        cache.delete_pattern('slicer-*')
+        _platform, report_type, _ibs = self._prepare_counter_records(
+            counter_records, organizations, report_type_nd, lowlevel=True
+        )
+
+        def get_data():
+            slicer = FlexibleDataSlicer('organization')
+            slicer.add_group_by('metric')
+            slicer.add_filter(ForeignKeyDimensionFilter('report_type', report_type))
+            return list(SlicerCache(slicer).get_or_compute('data', slicer.get_data))
+
+        assert get_data() == [], 'data are not synced yet'
+        sync_accesslogs_with_clickhouse_superfast()
+        data = get_data()
+        assert len(data) == 1
+        assert data[0]['pk'] == organizations[0].pk
+        cache.delete_pattern('slicer-*')
+
     def test_sync_import_batch_with_clickhouse_with_exception(
         self, counter_records, organizations, report_type_nd
     ):
@@ -1,9 +1,13 @@
+import csv
+from datetime import date
+from io import StringIO
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 from celus_nigiri.counter4 import Counter4BR2Report
 from celus_nigiri.counter5 import Counter5TableReport, Counter5TRReport
+from core.models import UL_ROBOT
 from django.db.models import Count, Sum
 from django.urls import reverse
 from logs.models import AccessLog, DimensionText, ImportBatch
@@ -13,7 +17,7 @@ from publications.models import PlatformTitle, Title
 from test_fixtures.entities.logs import ManualDataUploadFullFactory
 
 from ..exceptions import DataStructureError
-from ..logic.data_import import import_counter_records
+from ..logic.data_import import CSVStream, SpillingAggregator, import_counter_records
 
 
 @pytest.mark.django_db
@@ -68,14 +72,16 @@ class TestDataImport:
         assert DimensionText.objects.get(pk=al.dim1).text == crs[0].dimension_data['dim0']
         assert al.dim2 is None
 
+    @pytest.mark.parametrize(['ingest_format'], [('csv',), ('binary',)])
     def test_data_import_mutli_3d(
-        self, counter_records_nd, organizations, report_type_nd, platform
+        self, counter_records_nd, organizations, report_type_nd, platform, settings, ingest_format
     ):
+        settings.ACCESSLOG_INGEST_FORMAT = ingest_format
         assert AccessLog.objects.count() == 0
         assert Title.objects.count() == 0
         crs = list(counter_records_nd(3, record_number=10))
         report_type = report_type_nd(3)
-        _ibs, stats = import_counter_records(report_type, organizations[0], platform, crs)
+        ibs, stats = import_counter_records(report_type, organizations[0], platform, crs)
         assert stats['skipped logs'] == 0
         assert stats['new logs'] == 10
         assert AccessLog.objects.count() == 10
@@ -87,6 +93,13 @@ class TestDataImport:
         assert DimensionText.objects.get(pk=al.dim2).text == crs[0].dimension_data['dim1']
         assert DimensionText.objects.get(pk=al.dim3).text == crs[0].dimension_data['dim2']
         assert al.dim4 is None
+        # check the values common for the whole import batch
+        assert al.import_batch_id == ibs[0].pk
+        assert al.date == date(2019, 1, 1)
+        assert al.platform_id == platform.pk
+        assert al.organization_id == organizations[0].pk
+        assert al.report_type_id == report_type.pk
+        assert al.owner_level == UL_ROBOT
 
     @pytest.mark.parametrize(
         ['months', 'log_count', 'log_sum'],
@@ -186,6 +199,61 @@ class TestDataImport:
         assert stats['new logs'] == 1
         assert stats['new platformtitles'] == 1
 
+    @pytest.mark.parametrize(['aggregation_limit'], [(1,), (2,), (100,)])
+    def test_spilling_during_import(
+        self, counter_records_nd, organizations, report_type_nd, platform, aggregation_limit
+    ):
+        """
+        Test that the data are the same regardless of how often they have to be spilled to disk
+        """
+        crs = list(counter_records_nd(2, record_number=10))
+        rt = report_type_nd(2)
+        _ibs, stats = import_counter_records(
+            rt,
+            organizations[0],
+            platform,
+            crs + crs,
+            buffer_size=3,
+            aggregation_limit=aggregation_limit,
+        )
+        assert AccessLog.objects.count() == 10
+        assert stats['new logs'] == 10
+        assert AccessLog.objects.aggregate(total=Sum('value'))['total'] == 2 * sum(
+            cr.value for cr in crs
+        )
+
+
+class TestSpillingAggregator:
+    @pytest.mark.parametrize(['max_keys'], [(1,), (3,), (1000,)])
+    def test_items(self, max_keys):
+        aggregator = SpillingAggregator(max_keys=max_keys, chunk_size=2)
+        expected = {}
+        for i in range(100):
+            key = (i % 7, None if i % 3 else i % 5)
+            aggregator.add(key, i)
+            expected[key] = expected.get(key, 0) + i
+        result = list(aggregator.items())
+        assert len(result) == len(expected), 'each key is present only once'
+        assert dict(result) == expected
+        if max_keys < len(expected):
+            assert aggregator.spill_count > 0
+        aggregator.close()
+
+
+class TestCSVStream:
+    @pytest.mark.parametrize(['size'], [(-1,), (1,), (7,), (10_000,)])
+    def test_read(self, size):
+        rows = [['a', 'b']] + [[i, None if i % 2 else 'x,y'] for i in range(100)]
+        stream = CSVStream(rows)
+        data = ''
+        while chunk := stream.read(size):
+            data += chunk
+        expected = StringIO()
+        writer = csv.writer(expected)
+        for row in rows:
+            writer.writerow(row)
+        assert data == expected.getvalue()
+
 
 @pytest.mark.django_db
 class TestCounter4Import:
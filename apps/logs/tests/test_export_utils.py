@@ -1,6 +1,22 @@
-from io import StringIO
+from io import BytesIO, StringIO
 
-from ..logic.export_utils import MappingCSVDictWriter
+import pytest
+
+from ..logic.export_utils import (
+    COLUMNAR_ARROW,
+    COLUMNAR_PARQUET,
+    ArrowDictWriter,
+    DictionaryEncoder,
+    MappingCSVDictWriter,
+)
+
+
+def read_columnar(data: bytes, fmt: str):
+    if fmt == COLUMNAR_PARQUET:
+        pq = pytest.importorskip('pyarrow.parquet')
+        return pq.read_table(BytesIO(data))
+    pa = pytest.importorskip('pyarrow')
+    return pa.ipc.open_stream(data).read_all()
 
 
 class TestMappingDictWriter:
@@ -9,3 +25,40 @@ class TestMappingDictWriter:
         writer = MappingCSVDictWriter(out, fields=[('a', 'A'), ('b', 'B')])
         writer.writerow({'a': 1, 'b': 2})
         assert out.getvalue().splitlines() == ['A,B', '1,2']
+
+
+class TestArrowDictWriter:
+    @pytest.mark.parametrize('fmt', [COLUMNAR_PARQUET, COLUMNAR_ARROW])
+    def test_simple(self, fmt):
+        pa = pytest.importorskip('pyarrow')
+        out = BytesIO()
+        writer = ArrowDictWriter(
+            out,
+            fields=[('a', 'A'), ('b', 'B')],
+            numeric_fields={'b'},
+            fmt=fmt,
+            metadata={'report': [['Name', 'test']]},
+            batch_size=2,
+        )
+        for i, text in enumerate(['x', 'y', 'x', None, 'z']):
+            writer.writerow({'a': text, 'b': i})
+        writer.finalize()
+        table = read_columnar(out.getvalue(), fmt)
+        assert table.column_names == ['A', 'B']
+        assert table.schema.field('A').type == pa.dictionary(pa.int32(), pa.string())
+        assert table.column('A').to_pylist() == ['x', 'y', 'x', None, 'z']
+        assert table.column('B').to_pylist() == [0, 1, 2, 3, 4]
+        assert table.schema.metadata[b'report'] == b'[["Name", "test"]]'
+
+
+class TestDictionaryEncoder:
+    def test_dictionary_is_shared_between_batches(self):
+        pytest.importorskip('pyarrow')
+        encoder = DictionaryEncoder(remap={1: 'one', 2: 'two'})
+        first = encoder.encode([1, 1, 2])
+        second = encoder.encode([3, 1])
+        assert first.to_pylist() == ['one', 'one', 'two']
+        assert second.to_pylist() == ['3', 'one']
+        # the dictionary of the first batch is a prefix of the second one
+        assert second.dictionary.to_pylist()[: len(first.dictionary)] == ['one', 'two']
+        assert second.indices.to_pylist() == [2, 0]
@@ -658,6 +658,97 @@ class TestFlexibleDataSlicerComputations:
         assert data == {'m1': expected}
 
 
+@pytest.mark.django_db
+class TestFlexibleDataSlicerPivot:
+    """
+    Checks that pivoting data in Python gives the same results as computing them in SQL
+    """
+
+    @pytest.mark.parametrize(
+        ['primary_dimension', 'group_by', 'order_by'],
+        [
+            ('organization', ['platform'], []),
+            ('platform', ['metric', 'organization'], []),
+            ('target', ['date'], ['target']),
+            ('target', ['date'], ['-target']),
+            ('platform', ['metric'], ['-platform']),
+            ('dim1', ['metric'], ['dim1']),
+            ('date', ['organization'], ['-date']),
+            ('date__year', ['metric', 'platform'], ['date__year']),
+        ],
+    )
+    def test_get_data(self, flexible_slicer_test_data, primary_dimension, group_by, order_by):
+        def compute(pivot):
+            slicer = FlexibleDataSlicer(primary_dimension, pivot_in_python=pivot)
+            report_type = flexible_slicer_test_data['report_types'][0]
+            slicer.add_filter(ForeignKeyDimensionFilter('report_type', report_type))
+            for dim in group_by:
+                slicer.add_group_by(dim)
+            slicer.order_by = order_by
+            assert slicer.can_pivot_in_python()
+            return list(slicer.get_data())
+
+        pivot_data = compute(True)
+        sql_data = compute(False)
+        assert len(pivot_data) > 0
+        if order_by:
+            assert pivot_data == sql_data
+        else:
+            assert sorted(pivot_data, key=lambda rec: rec['pk']) == sorted(
+                sql_data, key=lambda rec: rec['pk']
+            )
+
+    def test_order_by_group(self, flexible_slicer_test_data):
+        metric = flexible_slicer_test_data['metrics'][1]
+        key = f'grp-{metric.pk}'
+
+        def compute(pivot):
+            slicer = FlexibleDataSlicer('target', pivot_in_python=pivot)
+            slicer.add_group_by('metric')
+            slicer.order_by = ['-' + key]
+            return list(slicer.get_data())
+
+        pivot_data = compute(True)
+        assert [rec[key] for rec in pivot_data] == sorted(
+            [rec[key] for rec in pivot_data], reverse=True
+        )
+        assert [rec[key] for rec in pivot_data] == [rec[key] for rec in compute(False)]
+
+    def test_pivot_used_above_threshold(self, flexible_slicer_test_data, settings):
+        slicer = FlexibleDataSlicer('platform')
+        slicer.add_group_by('metric')
+        slicer.add_group_by('organization')
+        settings.SLICER_PIVOT_GROUP_THRESHOLD = 1
+        assert isinstance(slicer.get_data(), list)
+        settings.SLICER_PIVOT_GROUP_THRESHOLD = 100
+        assert not isinstance(slicer.get_data(), list)
+
+    @pytest.mark.parametrize('pivot', [True, False])
+    def test_groups_not_counted_when_pivot_given(self, pivot, settings):
+        settings.SLICER_PIVOT_GROUP_THRESHOLD = 1
+        group_count = MagicMock(return_value=100)
+        assert (
+            FlexibleDataSlicer('platform', pivot_in_python=pivot)._use_pivot(group_count) == pivot
+        )
+        group_count.assert_not_called()
+        assert FlexibleDataSlicer('platform')._use_pivot(group_count)
+        group_count.assert_called_once()
+
+    def test_max_groups(self, flexible_slicer_test_data, settings):
+        settings.SLICER_PIVOT_MAX_GROUPS = 2
+        slicer = FlexibleDataSlicer('platform', pivot_in_python=True)
+        slicer.add_group_by('metric')
+        with pytest.raises(SlicerConfigError) as exc:
+            slicer.get_data()
+        assert exc.value.code == 'E101'
+
+    def test_not_pivoted_with_zero_rows(self, flexible_slicer_test_data):
+        slicer = FlexibleDataSlicer('platform', include_all_zero_rows=True, pivot_in_python=True)
+        slicer.add_group_by('metric')
+        assert not slicer.can_pivot_in_python()
+        assert len(slicer.get_data()) == Platform.objects.count()
+
+
 @pytest.mark.clickhouse
 @pytest.mark.usefixtures('clickhouse_on_off')
 @pytest.mark.django_db(transaction=True)
@@ -816,8 +907,91 @@ class TestFlexibleDataSlicerPossibleDimensionValues:
         assert metric_data['count'] == result_count
 
 
+@pytest.mark.clickhouse
+@pytest.mark.usefixtures('clickhouse_db')
+@pytest.mark.django_db(transaction=True)
+class TestFlexibleDataSlicerClickhouse:
+    """
+    Checks that data computed in clickhouse are the same as those from the database
+    """
+
+    @pytest.mark.parametrize(
+        ['primary_dimension', 'group_by', 'order_by'],
+        [
+            ('organization', ['platform'], []),
+            ('target', ['metric'], []),
+            ('platform', ['metric', 'organization'], []),
+            ('date', ['organization'], ['date']),
+            ('date', ['organization'], ['-date']),
+        ],
+    )
+    @pytest.mark.parametrize('pivot', [False, True])
+    def test_get_data(
+        self, flexible_slicer_test_data, primary_dimension, group_by, order_by, pivot
+    ):
+        def compute(use_clickhouse):
+            slicer = FlexibleDataSlicer(
+                primary_dimension, use_clickhouse=use_clickhouse, pivot_in_python=pivot
+            )
+            for dim in group_by:
+                slicer.add_group_by(dim)
+            slicer.order_by = order_by
+            assert slicer.can_use_clickhouse_for_data() == use_clickhouse
+            return list(slicer.get_data())
+
+        ch_data = compute(True)
+        db_data = compute(False)
+        assert len(ch_data) > 0
+        if order_by:
+            assert ch_data == db_data
+        else:
+            key = 'pk' if primary_dimension != 'date' else 'date'
+            assert sorted(ch_data, key=lambda rec: rec[key]) == sorted(
+                db_data, key=lambda rec: rec[key]
+            )
+
+    def test_get_data_with_parts(self, flexible_slicer_test_data):
+        def compute(use_clickhouse):
+            slicer = FlexibleDataSlicer('platform', use_clickhouse=use_clickhouse)
+            slicer.add_group_by('metric')
+            slicer.add_split_by('organization')
+            parts = list(slicer.get_parts_queryset())
+            parts.sort(key=lambda part: part['organization'])
+            return [
+                sorted(slicer.get_data(part=[part['organization']]), key=lambda rec: rec['pk'])
+                for part in parts
+            ]
+
+        assert compute(True) == compute(False)
+
+    @pytest.mark.parametrize('included_tags', [['tag1'], ['tag2'], ['tag1', 'tag3']])
+    def test_tag_remainder(self, flexible_slicer_test_data_with_tags, included_tags):
+        def compute(use_clickhouse):
+            slicer = FlexibleDataSlicer(
+                primary_dimension='target', tag_roll_up=True, use_clickhouse=use_clickhouse
+            )
+            slicer.add_filter(
+                ForeignKeyDimensionFilter(
+                    'metric', flexible_slicer_test_data_with_tags['metrics'][0]
+                ),
+                add_group=True,
+            )
+            slicer.tag_filter = Q(name__in=included_tags)
+            return slicer.get_remainder()
+
+        assert compute(True) == compute(False)
+
+
 @pytest.mark.django_db
 class TestFlexibleDataSlicerOther:
+    def test_clickhouse_not_used_when_inactive(self, flexible_slicer_test_data, settings):
+        settings.CLICKHOUSE_QUERY_ACTIVE = False
+        slicer = FlexibleDataSlicer('platform', use_clickhouse=True)
+        slicer.add_group_by('metric')
+        assert not slicer.can_use_clickhouse_for_data()
+        # the data are computed in the database
+        assert len(slicer.get_data()) > 0
+
     def test_create_from_config(self):
         """
         Test that slicer created from config has the same params as the original slicer
@@ -10,8 +10,10 @@ from logs.logic.materialized_interest import (
     _find_superseeded_import_batches,
     _find_unprocessed_batches,
     fast_compare_existing_and_new_records,
+    remove_interest,
     smart_interest_sync,
     sync_interest_for_import_batch,
+    sync_interest_for_import_batches,
 )
 from logs.logic.materialized_reports import create_materialized_accesslogs
 from logs.models import (
@@ -203,6 +205,85 @@ class TestInterestCalculation:
         assert interest_rt.accesslog_set.count() == 3, 'now it should work'
         assert interest_rt.accesslog_set.aggregate(sum=Sum('value'))['sum'] == 7
 
+    def test_bulk_sync_same_as_by_batch(self, counter_records, organizations, report_type_nd):
+        """
+        Interest computed for many import batches at once is the same as when computed
+        one import batch at a time
+        """
+        organization = organizations[0]
+        platform = Platform.objects.create(
+            ext_id=1234, short_name='Platform1', name='Platform 1', provider='Provider 1'
+        )
+        data_old = [
+            ['Title1', '2018-01-01', '1v1', 1],
+            ['Title2', '2018-01-01', '1v2', 2],
+            ['Title3', '2018-02-01', '1v2', 4],
+        ]
+        data_new = [
+            ['Title1', '2018-01-01', '1v1', 8],
+            ['Title2', '2018-01-01', '1v2', 16],
+            ['Title3', '2018-01-01', '1v2', 32],
+        ]
+        crs_old = list(counter_records(data_old, metric='Hits', platform='Platform1'))
+        crs_new = list(counter_records(data_new, metric='Views', platform='Platform1'))
+        report_type_old = report_type_nd(1, short_name='old')
+        report_type_new = report_type_nd(1, short_name='new')
+        report_type_old.superseeded_by = report_type_new
+        report_type_old.save()
+        ibs_old, _stats = import_counter_records(report_type_old, organization, platform, crs_old)
+        ibs_new, _stats = import_counter_records(report_type_new, organization, platform, crs_new)
+        ibs = ibs_old + ibs_new
+        interest_rt = report_type_nd(1, short_name='interest')
+        PlatformInterestReport.objects.create(platform=platform, report_type=report_type_old)
+        PlatformInterestReport.objects.create(platform=platform, report_type=report_type_new)
+        hit_metric = Metric.objects.get(short_name='Hits')
+        ig = InterestGroup.objects.create(short_name='ig1', position=1)
+        ReportInterestMetric.objects.create(
+            report_type=report_type_old, metric=hit_metric, interest_group=ig
+        )
+        # the metric is remapped
+        rim = ReportInterestMetric.objects.create(
+            report_type=report_type_new,
+            metric=Metric.objects.get(short_name='Views'),
+            target_metric=hit_metric,
+            interest_group=ig,
+        )
+
+        def interest_rows():
+            return sorted(
+                interest_rt.accesslog_set.values_list(
+                    'import_batch_id',
+                    'organization_id',
+                    'metric_id',
+                    'platform_id',
+                    'target_id',
+                    'date',
+                    'dim1',
+                    'value',
+                )
+            )
+
+        for ib in ibs:
+            sync_interest_for_import_batch(ib, interest_rt)
+        by_batch = interest_rows()
+        assert len(by_batch) == 4
+        remove_interest()
+        assert interest_rows() == []
+
+        stats = sync_interest_for_import_batches([ib.pk for ib in ibs], interest_rt)
+        assert interest_rows() == by_batch
+        assert stats == {'new_logs': 4, 'existing': 0, 'removed': 0}
+        assert ImportBatch.objects.filter(interest_timestamp__isnull=True).count() == 0
+        # nothing changes when synced again
+        stats = sync_interest_for_import_batches([ib.pk for ib in ibs], interest_rt)
+        assert stats == {'new_logs': 0, 'existing': 4, 'removed': 0}
+        # change of interest group replaces the records
+        rim.interest_group = InterestGroup.objects.create(short_name='ig2', position=2)
+        rim.save()
+        stats = sync_interest_for_import_batches([ib.pk for ib in ibs], interest_rt)
+        assert stats == {'new_logs': 3, 'existing': 1, 'removed': 3}
+        assert interest_rt.accesslog_set.values('dim1').distinct().count() == 2
+
 
 @pytest.mark.django_db()
 class TestInterestRecomputationDetection:
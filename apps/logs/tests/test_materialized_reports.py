@@ -5,12 +5,17 @@ from django.utils.timezone import now
 from logs.logic.data_import import import_counter_records
 from logs.logic.materialized_interest import sync_interest_for_import_batch
 from logs.logic.materialized_reports import (
+    create_materialized_accesslogs,
+    create_materialized_accesslogs_for_importbatches,
     materialized_import_batch_queryset,
+    remove_materialized_accesslogs,
     sync_materialized_reports,
 )
 from logs.logic.queries import replace_report_type_with_materialized
 from logs.models import (
     AccessLog,
+    ImportBatch,
+    ImportBatchMaterialization,
     InterestGroup,
     Metric,
     ReportInterestMetric,
@@ -93,6 +98,22 @@ class TestMaterializedReport:
         assert mat_report.accesslog_set.count() == 1
         assert {rec['value'] for rec in mat_report.accesslog_set.values('value')} == {7}
 
+    def test_nothing_kept(self, organizations, report_type_nd, platform):
+        report_type = report_type_nd(1)
+        ib = ImportBatch.objects.create(
+            report_type=report_type, organization=organizations[0], platform=platform
+        )
+        keep_attrs = ['metric', 'organization', 'platform', 'target', 'date']
+        keep_attrs += [f'dim{i}' for i in range(1, 8)]
+        spec = ReportMaterializationSpec.objects.create(
+            base_report_type=report_type, **{f'keep_{attr}': False for attr in keep_attrs}
+        )
+        assert spec.split_attributes()[0] == []
+        mat_report = ReportType.objects.create(materialization_spec=spec, short_name='m', name='m')
+        # the generated SQL must be valid even without any kept columns
+        assert create_materialized_accesslogs_for_importbatches(mat_report, [ib]) == 0
+        assert ImportBatchMaterialization.objects.filter(report_type=mat_report).count() == 1
+
     @pytest.mark.parametrize(
         ['query_params', 'other_dims', 'result'],
         [
@@ -169,7 +190,6 @@ class TestMaterializedReport:
         rim.metric = Metric.objects.get(short_name='m2')
         rim.save()
         for ib in ibs:
-            ib.refresh_from_db()  # this is needed because materialization_data was added to the ib
             sync_interest_for_import_batch(ib, interest_rt)
         assert interest_rt.accesslog_set.count() == 2, '2 interest records for metric m2'
 
@@ -210,6 +230,35 @@ class TestMaterializedReport:
         mat_report.save()
         assert materialized_import_batch_queryset(mat_report).count() == 1
 
+    def test_materialization_records(
+        self, organizations, report_type_nd, platform, counter_records
+    ):
+        """
+        Tests that materialization of import batches is recorded and that only import batches
+        of the base report type are materialized
+        """
+        data1 = [['Title1', '2018-01-01', '1v1', 1], ['Title2', '2018-01-01', '1v2', 2]]
+        crs1 = list(counter_records(data1, metric='Hits', platform=platform.short_name))
+        report_type = report_type_nd(1)
+        other_report_type = report_type_nd(1, short_name='other')
+        ibs, _stats = import_counter_records(report_type, organizations[0], platform, crs1)
+        import_counter_records(other_report_type, organizations[0], platform, crs1)
+        spec = ReportMaterializationSpec.objects.create(
+            base_report_type=report_type, keep_target=False
+        )
+        mat_report = ReportType.objects.create(materialization_spec=spec, short_name='m', name='m')
+        assert materialized_import_batch_queryset(mat_report).count() == 1
+        assert create_materialized_accesslogs(mat_report) == 2
+        assert {
+            (imat.import_batch_id, imat.report_type_id)
+            for imat in ImportBatchMaterialization.objects.all()
+        } == {(ib.pk, mat_report.pk) for ib in ibs}
+        assert create_materialized_accesslogs(mat_report) == 0
+        # removal deletes the records as well
+        remove_materialized_accesslogs()
+        assert not ImportBatchMaterialization.objects.exists()
+        assert mat_report.accesslog_set.count() == 0
+
 
 @pytest.mark.django_db()
 class TestMaterializedReportManagementCommands:
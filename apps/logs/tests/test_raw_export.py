@@ -0,0 +1,98 @@
+import csv
+from io import BytesIO, StringIO
+
+import pytest
+from django.core.cache import cache
+from django.db.models import Sum
+
+from ..logic.export import ArrowExport, CSVExport
+from ..logic.export_utils import COLUMNAR_ARROW, COLUMNAR_PARQUET
+from ..models import AccessLog
+
+
+@pytest.mark.django_db
+class TestCSVExport:
+    def test_export(self, flexible_slicer_test_data):
+        organization = flexible_slicer_test_data['organizations'][0]
+        exporter = CSVExport({'organization_id': organization.pk})
+        exporter.chunk_size = 100
+        out = StringIO()
+        exporter.export_raw_accesslogs_to_stream_lowlevel(out, queryset=exporter.create_queryset())
+        out.seek(0)
+        rows = list(csv.DictReader(out))
+        queryset = AccessLog.objects.filter(organization=organization)
+        assert len(rows) == queryset.count()
+        assert list(rows[0].keys()) == [
+            'platform',
+            'metric',
+            'organization',
+            'target',
+            'report_type',
+            'date',
+            'isbn',
+            'issn',
+            'eissn',
+            'dim1name',
+            'dim2name',
+            'value',
+        ]
+        assert {row['organization'] for row in rows} == {'Organization 1'}
+        assert {row['dim1name'] for row in rows} == {'A', 'B', 'C'}
+        assert {row['dim2name'] for row in rows if row['report_type'] == 'rt1'} == {''}
+        assert {row['dim2name'] for row in rows if row['report_type'] == 'rt2'} == {
+            'XX',
+            'YY',
+            'ZZ',
+            'A',
+        }
+        assert (
+            sum(int(row['value']) for row in rows)
+            == queryset.aggregate(total=Sum('value'))['total']
+        )
+        assert cache.get(exporter.filename_base) == len(rows)
+
+
+@pytest.mark.django_db
+class TestArrowExport:
+    @pytest.mark.parametrize('fmt', [COLUMNAR_PARQUET, COLUMNAR_ARROW])
+    def test_export(self, flexible_slicer_test_data, fmt):
+        pa = pytest.importorskip('pyarrow')
+        pq = pytest.importorskip('pyarrow.parquet')
+        organization = flexible_slicer_test_data['organizations'][0]
+        exporter = ArrowExport({'organization_id': organization.pk}, fmt=fmt)
+        exporter.batch_size = 100
+        out = BytesIO()
+        exporter.export_raw_accesslogs_to_sink(out, queryset=exporter.create_queryset())
+        if fmt == COLUMNAR_PARQUET:
+            table = pq.read_table(BytesIO(out.getvalue()))
+        else:
+            table = pa.ipc.open_stream(out.getvalue()).read_all()
+        queryset = AccessLog.objects.filter(organization=organization)
+        assert table.num_rows == queryset.count()
+        assert table.column_names == [
+            'platform',
+            'metric',
+            'organization',
+            'target',
+            'report_type',
+            'date',
+            'isbn',
+            'issn',
+            'eissn',
+            'dim1name',
+            'dim2name',
+            'value',
+        ]
+        assert set(table.column('organization').to_pylist()) == {'Organization 1'}
+        assert set(table.column('dim1name').to_pylist()) == {'A', 'B', 'C'}
+        # dim2name is only present in one of the report types
+        assert set(table.column('dim2name').to_pylist()) == {'XX', 'YY', 'ZZ', 'A', None}
+        assert (
+            sum(table.column('value').to_pylist())
+            == queryset.aggregate(total=Sum('value'))['total']
+        )
+
+    def test_filename(self):
+        assert ArrowExport({}, fmt=COLUMNAR_ARROW).filename.endswith('.arrows')
+        with pytest.raises(ValueError):
+            ArrowExport({}, fmt='xml')
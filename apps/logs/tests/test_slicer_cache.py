@@ -0,0 +1,182 @@
+from unittest.mock import MagicMock
+
+import pytest
+from core.logic.serialization import b64json
+from django.core.cache import cache
+from django.urls import reverse
+from logs.logic.data_import import import_counter_records
+from logs.logic.reporting.cache import SlicerCache, invalidate_slicer_cache_for_import_batches
+from logs.logic.reporting.filters import ForeignKeyDimensionFilter
+from logs.logic.reporting.slicer import FlexibleDataSlicer
+from logs.models import ImportBatch
+from tags.logic.fake_data import TagForTitleFactory
+
+
+@pytest.fixture
+def slicer_cache_active(settings):
+    settings.SLICER_CACHE_TIMEOUT = 3600
+    cache.delete_pattern('slicer-*')
+    yield
+    cache.delete_pattern('slicer-*')
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('slicer_cache_active')
+class TestSlicerCache:
+    @classmethod
+    def make_slicer(cls, data, organizations=None) -> FlexibleDataSlicer:
+        slicer = FlexibleDataSlicer('platform')
+        slicer.add_group_by('metric')
+        slicer.add_filter(ForeignKeyDimensionFilter('report_type', data['report_types'][0]))
+        if organizations is not None:
+            slicer.add_extra_organization_filter({org.pk for org in organizations})
+        return slicer
+
+    def test_result_is_reused(self, flexible_slicer_test_data):
+        slicer = self.make_slicer(flexible_slicer_test_data)
+        compute = MagicMock(side_effect=slicer.get_data)
+        data = SlicerCache(slicer).get_or_compute('data', compute)
+        assert compute.call_count == 1
+        assert len(data) > 0
+        assert data.count() == len(data)
+        # a new slicer with the same config uses the cached data
+        slicer2 = self.make_slicer(flexible_slicer_test_data)
+        assert SlicerCache(slicer2).get_or_compute('data', compute) == data
+        assert compute.call_count == 1
+        # different kind or part is computed separately
+        SlicerCache(slicer2).get_or_compute('data', compute, part=[1])
+        assert compute.call_count == 2
+
+    def test_filter_order_does_not_matter(self, flexible_slicer_test_data):
+        rt1, rt2 = flexible_slicer_test_data['report_types'][:2]
+        org1, org2 = flexible_slicer_test_data['organizations'][:2]
+        slicer1 = FlexibleDataSlicer('platform')
+        slicer1.add_filter(ForeignKeyDimensionFilter('report_type', [rt1.pk, rt2.pk]))
+        slicer1.add_filter(ForeignKeyDimensionFilter('organization', [org1.pk, org2.pk]))
+        slicer2 = FlexibleDataSlicer('platform')
+        slicer2.add_filter(ForeignKeyDimensionFilter('organization', [org2.pk, org1.pk]))
+        slicer2.add_filter(ForeignKeyDimensionFilter('report_type', [rt2.pk, rt1.pk]))
+        assert SlicerCache(slicer1).cache_key('data') == SlicerCache(slicer2).cache_key('data')
+        slicer2.add_extra_organization_filter([org1.pk])
+        assert SlicerCache(slicer1).cache_key('data') != SlicerCache(slicer2).cache_key('data')
+
+    def test_invalidation_by_import_batch(
+        self, flexible_slicer_test_data, django_capture_on_commit_callbacks
+    ):
+        rt1, rt2 = flexible_slicer_test_data['report_types'][:2]
+        org1, org2 = flexible_slicer_test_data['organizations'][:2]
+        platform = flexible_slicer_test_data['platforms'][0]
+        compute = MagicMock(return_value=[{'pk': 1}])
+
+        def get_data():
+            slicer = self.make_slicer(flexible_slicer_test_data, organizations=[org1])
+            return SlicerCache(slicer).get_or_compute('data', compute)
+
+        get_data()
+        assert compute.call_count == 1
+        # other report type does not invalidate the data
+        with django_capture_on_commit_callbacks(execute=True):
+            ImportBatch.objects.create(report_type=rt2, organization=org1, platform=platform)
+        get_data()
+        assert compute.call_count == 1
+        # other organization does not invalidate the data either
+        with django_capture_on_commit_callbacks(execute=True):
+            ImportBatch.objects.create(report_type=rt1, organization=org2, platform=platform)
+        get_data()
+        assert compute.call_count == 1
+        # matching report type and organization does
+        with django_capture_on_commit_callbacks(execute=True):
+            ib = ImportBatch.objects.create(report_type=rt1, organization=org1, platform=platform)
+        get_data()
+        assert compute.call_count == 2
+        get_data()
+        assert compute.call_count == 2
+        # and so does deleting
+        with django_capture_on_commit_callbacks(execute=True):
+            ib.delete()
+        get_data()
+        assert compute.call_count == 3
+
+    def test_invalidation_by_bulk_changes(self, flexible_slicer_test_data):
+        rt1 = flexible_slicer_test_data['report_types'][0]
+        org1, org2 = flexible_slicer_test_data['organizations'][:2]
+        platform = flexible_slicer_test_data['platforms'][0]
+        ib1 = ImportBatch.objects.create(report_type=rt1, organization=org1, platform=platform)
+        ib2 = ImportBatch.objects.create(report_type=rt1, organization=org2, platform=platform)
+        compute = MagicMock(return_value=[{'pk': 1}])
+
+        def get_data():
+            slicer = self.make_slicer(flexible_slicer_test_data, organizations=[org1])
+            return SlicerCache(slicer).get_or_compute('data', compute)
+
+        get_data()
+        assert compute.call_count == 1
+        # access logs of other organization were changed
+        invalidate_slicer_cache_for_import_batches([ib2.pk])
+        get_data()
+        assert compute.call_count == 1
+        # access logs of the filtered organization were changed
+        invalidate_slicer_cache_for_import_batches([ib1.pk, ib2.pk])
+        get_data()
+        assert compute.call_count == 2
+
+    def test_invalidation_by_tags(
+        self, flexible_slicer_test_data_with_tags, django_capture_on_commit_callbacks, users
+    ):
+        compute = MagicMock(return_value={'_total': 10})
+
+        def get_remainder():
+            slicer = FlexibleDataSlicer('target', tag_roll_up=True)
+            slicer.add_group_by('metric')
+            return SlicerCache(slicer).get_or_compute('remainder', compute)
+
+        assert get_remainder() == {'_total': 10}
+        get_remainder()
+        assert compute.call_count == 1
+        with django_capture_on_commit_callbacks(execute=True):
+            tag = TagForTitleFactory.create(name='new tag', owner=users['su'])
+            tag.tag(flexible_slicer_test_data_with_tags['targets'][2], users['su'])
+        get_remainder()
+        assert compute.call_count == 2
+
+    def test_inactive(self, flexible_slicer_test_data, settings):
+        settings.SLICER_CACHE_TIMEOUT = 0
+        slicer = self.make_slicer(flexible_slicer_test_data)
+        compute = MagicMock(return_value=[])
+        SlicerCache(slicer).get_or_compute('data', compute)
+        SlicerCache(slicer).get_or_compute('data', compute)
+        assert compute.call_count == 2
+
+    def test_api_data_change(
+        self,
+        flexible_slicer_test_data,
+        admin_client,
+        report_type_nd,
+        counter_records_0d,
+        django_capture_on_commit_callbacks,
+    ):
+        """
+        Tests that the report returned by the API changes when new data are imported
+        """
+        report_type = report_type_nd(0)
+        params = {
+            'primary_dimension': 'organization',
+            'groups': b64json(['metric']),
+            'filters': b64json({'report_type': [report_type.pk]}),
+        }
+
+        def get_data():
+            resp = admin_client.get(reverse('flexible-slicer'), params)
+            assert resp.status_code == 200
+            return resp.json()
+
+        assert get_data()['count'] == 0
+        organization = flexible_slicer_test_data['organizations'][0]
+        platform = flexible_slicer_test_data['platforms'][0]
+        with django_capture_on_commit_callbacks(execute=True):
+            import_counter_records(report_type, organization, platform, counter_records_0d)
+        data = get_data()
+        assert data['count'] == 1
+        assert data['results'][0]['pk'] == organization.pk
+        # the new data are cached
+        assert get_data() == data
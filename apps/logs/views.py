@@ -29,8 +29,10 @@ from django.db.transaction import atomic
 from django.http import JsonResponse
 from django.urls import reverse
 from django.views import View
-from logs.logic.export import CSVExport
+from logs.logic.export import ArrowExport, CSVExport
 from logs.logic.queries import StatsComputer, extract_accesslog_attr_query_params
+from logs.logic.reporting.cache import SlicerCache
+from logs.logic.streaming import stats_data_streaming_response
 from logs.models import (
     AccessLog,
     Dimension,
@@ -62,7 +64,6 @@ from logs.serializers import (
 )
 from organizations.logic.queries import organization_filter_from_org_id
 from organizations.models import Organization
-from pandas import DataFrame
 from publications.models import Platform, Title
 from rest_framework import status
 from rest_framework.decorators import action
@@ -103,29 +104,22 @@ class Counter5DataView(APIView):
     def get(self, request, report_type_id):
         report_type = get_object_or_404(ReportType, pk=report_type_id)
         computer = StatsComputer(report_type, request.GET)
+        label_attrs = dict(view_type='chart_data_raw', report_type=computer.used_report_type.pk)
+        data_format = request.GET.get('format')
+        if data_format in ('csv', 'xlsx'):
+            # for the bare result, we do not add any extra information, just output the list
+            # as it is read from the database
+            report_access_total_counter.labels(**label_attrs).inc()
+            return stats_data_streaming_response(computer, request.user, data_format)
+
         start = monotonic()
         # special attribute signaling that this view is used on dashboard and thus we
         # want to cache the data for extra speed using recache
         dashboard_view = 'dashboard' in request.GET
         data = computer.get_data(request.user, recache=dashboard_view)
-        label_attrs = dict(view_type='chart_data_raw', report_type=computer.used_report_type.pk)
         report_access_total_counter.labels(**label_attrs).inc()
         report_access_time_summary.labels(**label_attrs).observe(monotonic() - start)
 
-        data_format = request.GET.get('format')
-        if data_format in ('csv', 'xlsx'):
-            # for the bare result, we do not add any extra information, just output the list
-            data = DataFrame(data)
-            new_keys = [computer.io_prim_dim_name]
-            if computer.io_sec_dim_name:
-                new_keys.append(computer.io_sec_dim_name)
-            # we set the queried dimensions as index so that the default integer index is not
-            # added to the result
-            data.set_index(new_keys, drop=True, inplace=True)
-            return Response(
-                data,
-                headers={'Content-Disposition': f'attachment; filename="export.{data_format}"'},
-            )
         # prepare the data to return
         reply = {'data': data}
         if computer.prim_dim_obj:
@@ -382,9 +376,17 @@ class RawDataDelayedExportView(APIView):
 
     def post(self, request):
         query_params = self.extract_query_filter_params(request)
-        exporter = CSVExport(query_params, zip_compress=True)
+        # `format` is used by DRF for content negotiation
+        fmt = request.GET.get('file_format')
+        if fmt in ArrowExport.file_extensions:
+            if not settings.ENABLE_COLUMNAR_EXPORT:
+                raise BadRequestException({'error': f'Format "{fmt}" is not available'})
+            exporter = ArrowExport(query_params, fmt=fmt)
+        else:
+            fmt = None
+            exporter = CSVExport(query_params, zip_compress=True)
         export_raw_data_task.delay(
-            query_params, exporter.filename_base, zip_compress=exporter.zip_compress
+            query_params, exporter.filename_base, zip_compress=exporter.zip_compress, fmt=fmt
         )
         return JsonResponse(
             {
@@ -881,7 +883,12 @@ class FlexibleSlicerView(FlexibleSlicerBaseView):
             part = request.query_params.get('part') if slicer.split_by else None
             if part:
                 part = parse_b64json(part)
-            data = slicer.get_data(part=part, lang=request.user.language)
+            data = SlicerCache(slicer).get_or_compute(
+                'data',
+                lambda: slicer.get_data(part=part, lang=request.user.language),
+                part=part,
+                lang=request.user.language,
+            )
         except SlicerConfigError as e:
             return Response(
                 {'error': {'message': str(e), 'code': e.code, 'details': e.details}},
@@ -899,7 +906,9 @@ class FlexibleSlicerRemainderView(FlexibleSlicerBaseView):
             part = request.query_params.get('part') if slicer.split_by else None
             if part:
                 part = parse_b64json(part)
-            data = slicer.get_remainder(part=part)
+            data = SlicerCache(slicer).get_or_compute(
+                'remainder', lambda: slicer.get_remainder(part=part), part=part
+            )
             return Response(data)
         except SlicerConfigError as e:
             return Response(
@@ -943,7 +952,7 @@ class FlexibleSlicerSplitParts(FlexibleSlicerBaseView):
 
     def get(self, request):
         slicer = self.create_slicer(request)
-        qs = slicer.get_parts_queryset()
+        qs = SlicerCache(slicer).get_or_compute('parts', slicer.get_parts_queryset)
         cropped = False
         count = 0
         if qs:
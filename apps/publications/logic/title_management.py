@@ -7,15 +7,28 @@ from typing import Generator, List, Set, Union
 
 from django.conf import settings
 from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection, transaction
 from django.db.models import Count
 from django.db.models.functions import Lower
 from logs.logic.clickhouse import resync_import_batch_with_clickhouse
 from logs.logic.data_import import TitleManager
+from logs.logic.reporting.cache import invalidate_slicer_cache_for_import_batches
 from logs.models import AccessLog, ImportBatch
-from publications.models import PlatformTitle, Title
+from publications.models import PlatformTitle, Title, TitleIdentifier
 
 logger = logging.getLogger(__name__)
 
+# identifiers as they should be in the `TitleIdentifier` table based on the `Title` table
+_EXPECTED_IDENTIFIERS_SQL = f"""
+    SELECT title.id AS title_id, ids.kind, ids.value
+    FROM {Title._meta.db_table} AS title
+        CROSS JOIN LATERAL (
+            VALUES ('isbn', title.isbn), ('issn', title.issn), ('eissn', title.eissn),
+                   ('doi', title.doi)
+        ) AS ids (kind, value)
+    WHERE ids.value <> ''
+"""
+
 
 def find_mergeable_titles(batch_size: int = 100) -> Generator[List[Title], None, None]:
     """
@@ -183,4 +196,43 @@ def replace_title(source: Title, dest: Union[Title, int]) -> Set[int]:
             )
         ),
     )
+    transaction.on_commit(lambda: invalidate_slicer_cache_for_import_batches(ibs_to_resync))
     return ibs_to_resync
+
+
+def sync_title_identifiers() -> dict:
+    """
+    Makes the `TitleIdentifier` table match the identifiers stored in `Title`.
+
+    Normally the table is kept in sync by a database trigger, so this is only needed
+    when the trigger was bypassed (for example when it was disabled during data restore).
+
+    :return: dict with the number of removed and added identifiers
+    """
+    table = TitleIdentifier._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH expected AS ({_EXPECTED_IDENTIFIERS_SQL})
+            DELETE FROM {table} AS ti WHERE NOT EXISTS (
+                SELECT 1 FROM expected
+                WHERE expected.title_id = ti.title_id
+                    AND expected.kind = ti.kind
+                    AND expected.value = ti.value
+            )
+            """
+        )
+        removed = cursor.rowcount
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (title_id, kind, value)
+            SELECT title_id, kind, value FROM ({_EXPECTED_IDENTIFIERS_SQL}) AS expected
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {table} AS ti
+                WHERE ti.title_id = expected.title_id AND ti.kind = expected.kind
+            )
+            """
+        )
+        added = cursor.rowcount
+    logger.info('Title identifiers synced: %d removed, %d added', removed, added)
+    return {'removed': removed, 'added': added}
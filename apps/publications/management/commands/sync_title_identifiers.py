@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from publications.logic.title_management import sync_title_identifiers
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Rebuild the title identifier lookup table (isbn, issn, eissn, doi -> title) from '
+        'the title data. Normally the table is kept in sync automatically by a database trigger.'
+    )
+
+    def handle(self, *args, **options):
+        stats = sync_title_identifiers()
+        self.stdout.write(f'Removed: {stats["removed"]}; Added: {stats["added"]}')
@@ -0,0 +1,95 @@
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+# keeps `publications_titleidentifier` in sync with identifiers stored in `publications_title`
+TRIGGER_SQL = """
+CREATE FUNCTION publications_title_sync_identifiers() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM publications_titleidentifier WHERE title_id = NEW.id;
+    END IF;
+    INSERT INTO publications_titleidentifier (title_id, kind, value)
+        SELECT NEW.id, ids.kind, ids.value
+        FROM (VALUES ('isbn', NEW.isbn), ('issn', NEW.issn), ('eissn', NEW.eissn), ('doi', NEW.doi))
+            AS ids (kind, value)
+        WHERE ids.value <> '';
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER publications_title_sync_identifiers
+    AFTER INSERT OR UPDATE OF isbn, issn, eissn, doi ON publications_title
+    FOR EACH ROW EXECUTE PROCEDURE publications_title_sync_identifiers();
+"""
+
+REVERSE_TRIGGER_SQL = """
+DROP TRIGGER publications_title_sync_identifiers ON publications_title;
+DROP FUNCTION publications_title_sync_identifiers();
+"""
+
+BACKFILL_SQL = """
+INSERT INTO publications_titleidentifier (title_id, kind, value)
+    SELECT title.id, ids.kind, ids.value
+    FROM publications_title AS title
+        CROSS JOIN LATERAL (
+            VALUES ('isbn', title.isbn), ('issn', title.issn), ('eissn', title.eissn),
+                   ('doi', title.doi)
+        ) AS ids (kind, value)
+    WHERE ids.value <> '';
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('publications', '0036_titleoverlapbatch')]
+
+    operations = [
+        migrations.CreateModel(
+            name='TitleIdentifier',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                (
+                    'kind',
+                    models.CharField(
+                        choices=[
+                            ('isbn', 'ISBN'),
+                            ('issn', 'ISSN'),
+                            ('eissn', 'eISSN'),
+                            ('doi', 'DOI'),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ('value', models.CharField(max_length=250)),
+                (
+                    'title',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='identifiers',
+                        to='publications.title',
+                    ),
+                ),
+            ],
+            options={'unique_together': {('title', 'kind')}},
+        ),
+        migrations.AddIndex(
+            model_name='titleidentifier',
+            index=models.Index(fields=['kind', 'value'], name='publications_tid_kind_value'),
+        ),
+        migrations.AddIndex(
+            model_name='title',
+            index=django.contrib.postgres.indexes.HashIndex(
+                django.db.models.functions.text.Lower('name'), name='publications_title_lname_hash'
+            ),
+        ),
+        migrations.RunSQL(TRIGGER_SQL, REVERSE_TRIGGER_SQL),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
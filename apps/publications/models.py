@@ -8,10 +8,12 @@ from typing import BinaryIO, Callable, Optional
 import magic
 from core.models import CreatedUpdatedMixin, DataSource
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import HashIndex
 from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.db import models
 from django.db.models import Q, UniqueConstraint
+from django.db.models.functions import Lower
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from organizations.models import Organization
@@ -161,6 +163,11 @@ class Title(models.Model):
         ordering = ('name', 'pub_type')
         verbose_name = _('Title/Database')
         unique_together = (('name', 'isbn', 'issn', 'eissn', 'doi', 'proprietary_ids'),)
+        indexes = (
+            # titles are matched case-insensitively by name during import; hash index is used
+            # because btree has a limit on the size of indexed values and names may be long
+            HashIndex(Lower('name'), name='publications_title_lname_hash'),
+        )
 
     def __str__(self):
         return self.name
@@ -187,6 +194,39 @@ class Title(models.Model):
         return self.PUB_TYPE_UNKNOWN
 
 
+class TitleIdentifier(models.Model):
+    """
+    Lookup table mapping the identifiers of a title (isbn, issn, ...) to the title.
+
+    It is kept in sync with the `Title` table by a database trigger (see migration
+    `0037_titleidentifier`), so it reflects also bulk updates and COPY. It may be rebuilt
+    from scratch using the `sync_title_identifiers` management command.
+    """
+
+    KIND_ISBN = 'isbn'
+    KIND_ISSN = 'issn'
+    KIND_EISSN = 'eissn'
+    KIND_DOI = 'doi'
+
+    KIND_CHOICES = (
+        (KIND_ISBN, 'ISBN'),
+        (KIND_ISSN, 'ISSN'),
+        (KIND_EISSN, 'eISSN'),
+        (KIND_DOI, 'DOI'),
+    )
+
+    title = models.ForeignKey(Title, on_delete=models.CASCADE, related_name='identifiers')
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    value = models.CharField(max_length=250)
+
+    class Meta:
+        unique_together = (('title', 'kind'),)
+        indexes = (models.Index(fields=('kind', 'value'), name='publications_tid_kind_value'),)
+
+    def __str__(self):
+        return f'{self.kind}: {self.value}'
+
+
 class PlatformTitle(models.Model):
 
     title = models.ForeignKey(Title, on_delete=models.CASCADE)
@@ -2,7 +2,7 @@ import pytest
 from django.core.management import call_command
 from logs.models import AccessLog, ImportBatch, Metric
 from organizations.tests.conftest import organization_random  # noqa - fixture
-from publications.models import Title
+from publications.models import Title, TitleIdentifier
 
 
 @pytest.mark.django_db
@@ -32,3 +32,29 @@ class TestRemoveUnusedTitles:
             assert Title.objects.get().pk == title1.pk
         else:
             assert Title.objects.count() == 3, 'no titles is deleted'
+
+
+@pytest.mark.django_db
+class TestSyncTitleIdentifiers:
+    def test_trigger(self):
+        title = Title.objects.create(name='A', issn='1111-2222', isbn='978-3-16-148410-0')
+        assert set(title.identifiers.values_list('kind', 'value')) == {
+            ('issn', '1111-2222'),
+            ('isbn', '978-3-16-148410-0'),
+        }
+        Title.objects.filter(pk=title.pk).update(isbn='', eissn='2222-1111')
+        assert set(title.identifiers.values_list('kind', 'value')) == {
+            ('issn', '1111-2222'),
+            ('eissn', '2222-1111'),
+        }
+
+    def test_command(self):
+        title = Title.objects.create(name='A', issn='1111-2222', doi='10.1000/182')
+        # simulate data which got out of sync
+        TitleIdentifier.objects.filter(kind='issn').delete()
+        TitleIdentifier.objects.create(title=title, kind='isbn', value='978-3-16-148410-0')
+        call_command('sync_title_identifiers')
+        assert set(title.identifiers.values_list('kind', 'value')) == {
+            ('issn', '1111-2222'),
+            ('doi', '10.1000/182'),
+        }
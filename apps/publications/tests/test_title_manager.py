@@ -2,7 +2,7 @@ from collections import Counter
 
 import pytest
 from django.db.models import Count
-from logs.logic.data_import import TitleManager, TitleRec
+from logs.logic.data_import import LRUCache, SharedTitleCache, TitleManager, TitleRec
 from logs.logic.validation import normalize_isbn, normalize_title
 from publications.models import Title
 
@@ -358,6 +358,61 @@ class TestTitleManager:
         assert pk2 is not None
         assert pk1 == pk2
 
+    def test_get_or_create_not_prefetched(self):
+        """
+        Titles for records which were not prefetched are looked up in the database by name
+        """
+        title = Title.objects.create(name='Title B', issn='1111-2222')
+        tm = TitleManager()
+        tm.prefetch_titles([TitleRec(name='Title A', pub_type=Title.PUB_TYPE_JOURNAL)])
+        record = TitleRec(name='TITLE b', pub_type=Title.PUB_TYPE_JOURNAL, issn='1111-2222')
+        assert tm.get_or_create(record) == title.pk
+        assert tm.stats['name lookup'] == 1
+        record2 = TitleRec(name='Title B', pub_type=Title.PUB_TYPE_JOURNAL, issn='1111-2222')
+        assert tm.get_or_create(record2) == title.pk
+        assert tm.stats['name lookup'] == 1, 'the name is not looked up again'
+        assert tm.stats['created'] == 0
+
+    def test_get_or_create_with_shared_cache(self, django_capture_on_commit_callbacks):
+        """
+        Titles resolved by one manager are reused by another one after commit
+        """
+        shared_cache = SharedTitleCache(max_size=10)
+        shared_cache.sync()
+        tm = TitleManager(shared_cache=shared_cache)
+        record = TitleRec(name='Title', pub_type=Title.PUB_TYPE_JOURNAL, issn='1111-2222')
+        tm.prefetch_titles([record])
+        with django_capture_on_commit_callbacks(execute=True):
+            pk = tm.get_or_create(record)
+            assert len(shared_cache.cache) == 0, 'not published before commit'
+            tm.publish_to_shared_cache()
+        assert len(shared_cache.cache) == 1
+
+        tm2 = TitleManager(shared_cache=shared_cache)
+        record2 = TitleRec(name='TITLE', pub_type=Title.PUB_TYPE_JOURNAL, issn='1111-2222')
+        tm2.prefetch_titles([record2])
+        assert tm2.name_to_records == {}, 'cached titles are not prefetched'
+        assert tm2.get_or_create(record2) == pk
+        assert tm2.stats['existing'] == 1
+        assert shared_cache.cache._hits == 1
+
+        # deleting the title invalidates the cache
+        with django_capture_on_commit_callbacks(execute=True):
+            Title.objects.filter(pk=pk).delete()
+        shared_cache.sync()
+        assert len(shared_cache.cache) == 0
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_size=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache['a'] == 1
+        cache['c'] = 3
+        assert 'a' in cache
+        assert 'b' not in cache, 'the least recently used item was evicted'
+        assert 'c' in cache
+        assert (cache._hits, cache._misses) == (2, 1)
+
     def test_get_or_create_with_two_winners(self):
         """
         Test a real-world situation where there are two matching candidates in the DB.
@@ -18,7 +18,7 @@ class CachedQueryAdmin(admin.ModelAdmin):
         'hit_count',
         'avg_query_duration_str',
         'last_query_duration_str',
-        'queryset_pickle_size',
+        'result_data_size',
     ]
 
     list_filter = ['django_version', 'origin']
@@ -26,8 +26,8 @@ class CachedQueryAdmin(admin.ModelAdmin):
     actions = ['force_renew', 'renew']
 
     @classmethod
-    def queryset_pickle_size(cls, obj: CachedQuery):
-        return len(obj.queryset_pickle)
+    def result_data_size(cls, obj: CachedQuery):
+        return len(obj.result_data)
 
     def current_django(self, obj: CachedQuery):
         return obj.django_version == django.get_version()
@@ -0,0 +1,120 @@
+"""
+Per-process tier in front of the `CachedQuery` table.
+
+Valid cached results are kept in memory of the process for a short time (`RECACHE_LOCAL_TTL`),
+so that popular queries may be answered without any database round trip. Cache hits are
+counted in memory as well and written to the database in batches.
+"""
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import F
+from django.utils.timezone import now
+
+from .serialization import load_results_payload
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEntry(NamedTuple):
+    cached_query_id: int
+    payload: dict
+    expires: datetime
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache of result payloads with a limited time to live
+    """
+
+    def __init__(self):
+        self._entries: 'OrderedDict[str, LocalEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return settings.RECACHE_LOCAL_TTL > 0 and settings.RECACHE_LOCAL_MAX_ENTRIES > 0
+
+    def get(self, query_hash: str) -> Optional[LocalEntry]:
+        with self._lock:
+            entry = self._entries.get(query_hash)
+            if entry is None:
+                return None
+            if entry.expires <= now():
+                del self._entries[query_hash]
+                return None
+            self._entries.move_to_end(query_hash)
+            return entry
+
+    def put(self, cached_query) -> None:
+        """
+        Stores the results of a valid `CachedQuery`. The entry expires at latest when
+        the cached query itself does.
+        """
+        if not self.active:
+            return
+        expires = min(
+            cached_query.valid_until, now() + timedelta(seconds=settings.RECACHE_LOCAL_TTL)
+        )
+        entry = LocalEntry(
+            cached_query_id=cached_query.pk,
+            payload=load_results_payload(cached_query.result_data),
+            expires=expires,
+        )
+        with self._lock:
+            self._entries[cached_query.query_hash] = entry
+            self._entries.move_to_end(cached_query.query_hash)
+            while len(self._entries) > settings.RECACHE_LOCAL_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def discard(self, query_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(query_hash, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class HitCounter:
+    """
+    Collects cache hits and writes them to `CachedQuery` objects at most once per
+    `RECACHE_HIT_FLUSH_INTERVAL` seconds
+    """
+
+    def __init__(self):
+        self._hits: Dict[int, int] = defaultdict(int)
+        self._last_hit: Dict[int, datetime] = {}
+        self._last_flush = monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, cached_query_id: int) -> None:
+        with self._lock:
+            self._hits[cached_query_id] += 1
+            self._last_hit[cached_query_id] = now()
+            due = monotonic() - self._last_flush >= settings.RECACHE_HIT_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        from .models import CachedQuery
+
+        with self._lock:
+            hits, self._hits = self._hits, defaultdict(int)
+            last_hit, self._last_hit = self._last_hit, {}
+            self._last_flush = monotonic()
+        for pk, count in hits.items():
+            CachedQuery.objects.filter(pk=pk).update(
+                hit_count=F('hit_count') + count, last_queried=last_hit[pk]
+            )
+        if hits:
+            logger.debug('Flushed hits of %d cached queries', len(hits))
+
+
+local_cache = LocalCache()
+hit_counter = HitCounter()
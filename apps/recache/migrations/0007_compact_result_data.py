@@ -0,0 +1,45 @@
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('recache', '0006_query_hash_unique_with_django_version')]
+
+    operations = [
+        # the old pickles cannot be converted without evaluating them, so the caches are simply
+        # removed and will be recreated when next used
+        migrations.RunSQL('DELETE FROM recache_cachedquery;', migrations.RunSQL.noop),
+        migrations.RemoveField(model_name='cachedquery', name='queryset_pickle'),
+        migrations.AddField(
+            model_name='cachedquery',
+            name='query_pickle',
+            field=models.BinaryField(
+                default=b'', help_text='Pickle of the query used when the data are renewed'
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='cachedquery',
+            name='result_data',
+            field=models.BinaryField(
+                default=b'', help_text='Compressed values of the rows of the result'
+            ),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='cachedquery',
+            name='django_version',
+            field=models.CharField(
+                help_text='Version of Django that created the query pickle', max_length=16
+            ),
+        ),
+        migrations.AlterField(
+            model_name='cachedquery',
+            name='last_updated',
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, help_text='Last time result_data was updated'
+            ),
+        ),
+    ]
@@ -1,4 +1,3 @@
-import pickle
 from datetime import timedelta
 from hashlib import blake2b
 from statistics import mean
@@ -8,11 +7,15 @@ import django
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.postgres.fields import ArrayField
 from django.db import IntegrityError, models
-from django.db.models import DateTimeField, ExpressionWrapper, F
+from django.db.models import DateTimeField, ExpressionWrapper, F, FloatField
+from django.db.models.expressions import RawSQL
 from django.db.transaction import atomic
 from django.utils.functional import cached_property
 from django.utils.timezone import now
 
+from .local import hit_counter
+from .serialization import CachedResults, deserialize_query, serialize_query, serialize_results
+
 BLAKE_HASH_SIZE = 16
 DEFAULT_TIMEOUT = timedelta(seconds=60 * 60)  # 1 hour
 # queries with empty results which take less than EMPTY_RESULT_DURATION_THRESHOLD seconds
@@ -41,13 +44,13 @@ class CachedQueryQuerySet(models.QuerySet):
         origin='',
     ):
         qs_hash = CachedQuery.compute_queryset_hash(queryset)
-        queryset_pickle = pickle.dumps(queryset)
 
         return self.create(
             model=ContentType.objects.get_for_model(queryset.model),
             query_hash=qs_hash,
             query_string=str(queryset.query),
-            queryset_pickle=queryset_pickle,
+            query_pickle=serialize_query(queryset),
+            result_data=serialize_results(queryset),
             django_version=django.get_version(),
             timeout=timeout,
             lifetime=lifetime,
@@ -67,6 +70,32 @@ class CachedQueryQuerySet(models.QuerySet):
             )
         ).filter(valid_until_db__lt=now())
 
+    def due_for_renewal(self, ahead: timedelta = timedelta(0)):
+        """
+        Returns objects that will be past timeout in `ahead` - renewing them in advance prevents
+        users from waiting for the renewal
+        """
+        return self.annotate(
+            valid_until_db=ExpressionWrapper(
+                F('last_updated') + F('timeout'), output_field=DateTimeField()
+            )
+        ).filter(valid_until_db__lt=now() + ahead)
+
+    def by_renewal_priority(self, ahead: timedelta = timedelta(0)):
+        """
+        Orders the objects so that those which are used often, take long to compute and are
+        stale for the longest time come first
+        """
+        return self.annotate(
+            renewal_priority=RawSQL(
+                '(hit_count + 1) '
+                '* COALESCE((SELECT avg(duration) FROM unnest(query_durations) AS duration), 1.0) '
+                '* GREATEST(EXTRACT(EPOCH FROM %s - (last_updated + timeout)), 1.0)',
+                (now() + ahead,),
+                output_field=FloatField(),
+            )
+        ).order_by('-renewal_priority', 'pk')
+
     def past_lifetime(self):
         """
         Returns objects that are past lifetime (`last_queried` + `lifetime` is in the past) and
@@ -94,14 +123,15 @@ class CachedQuery(models.Model):
         max_length=BLAKE_HASH_SIZE * 2, help_text='Hash of the query string'
     )
     query_string = models.TextField()
-    queryset_pickle = models.BinaryField(help_text='Pickle of the evaluated queryset with results')
+    query_pickle = models.BinaryField(
+        help_text='Pickle of the query used when the data are renewed'
+    )
+    result_data = models.BinaryField(help_text='Compressed values of the rows of the result')
     django_version = models.CharField(
-        max_length=16, help_text='Version of Django that created the last pickle'
+        max_length=16, help_text='Version of Django that created the query pickle'
     )
     created = models.DateTimeField(auto_now_add=True)
-    last_updated = models.DateTimeField(
-        default=now, help_text='Last time queryset_pickle was updated'
-    )
+    last_updated = models.DateTimeField(default=now, help_text='Last time result_data was updated')
     last_queried = models.DateTimeField(
         default=now, help_text='Last time someone queried this data - read the queryset'
     )
@@ -170,7 +200,8 @@ class CachedQuery(models.Model):
             raise
 
         start = monotonic()
-        self.queryset_pickle = pickle.dumps(queryset)
+        self.result_data = serialize_results(queryset)
+        self.query_pickle = serialize_query(queryset)
         self.last_updated = now()
         self.query_durations.append(monotonic() - start)
         orig_django_version = self.django_version
@@ -190,21 +221,19 @@ class CachedQuery(models.Model):
         """
         Returns a new, unevaluated queryset based on the stored data
         """
-        # .all() creates a fresh copy of the queryset
-        return self.get_cached_queryset(record_hit=False).all()
+        return deserialize_query(self.model.model_class(), self.query_pickle)
 
-    def get_cached_queryset(self, record_hit=True):
+    def get_cached_queryset(self, record_hit=True) -> CachedResults:
         """
-        Returns the cached queryset including all results
+        Returns the cached results. The returned object behaves like an evaluated queryset
+        in that it may be iterated, indexed and counted.
 
         :arg record_hit: When true, the `hit_count` field will be increased and `last_queried`
-                         updated
+                         updated - hits are written in batches by `hit_counter`
         """
         if record_hit:
-            self.last_queried = now()
-            self.hit_count = F('hit_count') + 1
-            self.save(update_fields=('last_queried', 'hit_count'))
-        return pickle.loads(self.queryset_pickle)
+            hit_counter.record(self.pk)
+        return CachedResults(self.model.model_class(), self.result_data)
 
     @cached_property
     def avg_query_duration(self):
@@ -0,0 +1,91 @@
+"""
+Renewal of cached queries in the background.
+
+Cached queries are renewed shortly before they time out, so that users almost never have to
+wait for a renewal. Several workers may renew the queries at the same time, each of them
+takes the most important due query which is not being renewed by someone else.
+"""
+import logging
+from datetime import timedelta
+from time import monotonic
+
+import django
+from core.prometheus import (
+    recache_renewal_delay_summary,
+    recache_renewal_queue_depth,
+    recache_renewal_time_summary,
+)
+from django.conf import settings
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from .models import CachedQuery, RenewalError
+
+logger = logging.getLogger(__name__)
+
+
+def renewal_ahead() -> timedelta:
+    return timedelta(seconds=settings.RECACHE_RENEW_AHEAD)
+
+
+def update_renewal_queue_depth() -> int:
+    depth = CachedQuery.objects.due_for_renewal(renewal_ahead()).count()
+    recache_renewal_queue_depth.set(depth)
+    return depth
+
+
+def renew_with_metrics(cq: CachedQuery) -> None:
+    """
+    Renews the cached query and records the duration and delay of the renewal.
+    Queries which cannot be renewed because they come from a different Django version are
+    deleted.
+    """
+    delay = max((now() - cq.valid_until).total_seconds(), 0)
+    start = monotonic()
+    try:
+        cq.force_renew(catch_refresh_errors=cq.django_version != django.get_version())
+    except RenewalError as exc:
+        logger.warning('Renewal error (%s), deleting cache: %s', exc, cq)
+        cq.delete()
+        return
+    duration = monotonic() - start
+    recache_renewal_time_summary.labels(cq.origin).observe(duration)
+    recache_renewal_delay_summary.labels(cq.origin).observe(delay)
+    logger.debug('Renewed cached query "%s" in %.2f s', cq, duration)
+
+
+def renew_due_cached_queries() -> int:
+    """
+    Renews due cached queries one by one in the order of their priority until there is nothing
+    left to renew. Each query is renewed in its own transaction and claimed using
+    `select_for_update(skip_locked=True)`, so several instances of this function may run
+    at the same time.
+
+    :return: number of renewed queries
+    """
+    renewed = 0
+    # failed queries stay due and so do queries with a timeout shorter than the renewal
+    # look-ahead even after they are renewed, so each query is processed at most once per run
+    processed = set()
+    while True:
+        with atomic():
+            cq = (
+                CachedQuery.objects.select_for_update(skip_locked=True)
+                .due_for_renewal(renewal_ahead())
+                .exclude(pk__in=processed)
+                .by_renewal_priority(renewal_ahead())
+                .first()
+            )
+            if not cq:
+                break
+            processed.add(cq.pk)
+            try:
+                # the savepoint keeps the transaction usable if the renewal fails
+                with atomic():
+                    renew_with_metrics(cq)
+            except Exception as exc:
+                logger.error('Could not renew cached query %s: %s', cq, exc)
+            else:
+                renewed += 1
+    update_renewal_queue_depth()
+    return renewed
@@ -0,0 +1,155 @@
+"""
+Compact storage of evaluated querysets.
+
+Instead of pickling whole querysets (including the query object and model instances), only
+the plain values of the result rows are stored - as a list of column names and a list of
+tuples, pickled and compressed using lz4. The query itself is stored separately and is only
+loaded when the data need to be renewed.
+"""
+import pickle
+from typing import Iterator, List, Tuple, Union
+
+import lz4.frame
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import QuerySet
+from django.db.models.query import (
+    FlatValuesListIterable,
+    ModelIterable,
+    NamedValuesListIterable,
+    ValuesIterable,
+    ValuesListIterable,
+)
+
+
+def serialize_query(queryset: QuerySet) -> bytes:
+    """
+    Returns a pickle of the information needed to recreate an unevaluated copy of `queryset`
+    """
+    return pickle.dumps(
+        {
+            'query': queryset.query,
+            'iterable_class': queryset._iterable_class,
+            'fields': queryset._fields,
+        },
+        pickle.HIGHEST_PROTOCOL,
+    )
+
+
+def deserialize_query(model, data: bytes) -> QuerySet:
+    """
+    Recreates an unevaluated queryset stored using `serialize_query`
+    """
+    query_data = pickle.loads(data)
+    queryset = model._default_manager.all()
+    queryset.query = query_data['query']
+    queryset._iterable_class = query_data['iterable_class']
+    queryset._fields = query_data['fields']
+    return queryset
+
+
+def _model_columns(queryset: QuerySet, first) -> Tuple[List[str], List[str]]:
+    # deferred fields are not present in the instance __dict__
+    fields = [
+        field.attname
+        for field in queryset.model._meta.concrete_fields
+        if field.attname in first.__dict__
+    ]
+    return fields, list(queryset.query.annotation_select)
+
+
+def serialize_results(queryset: QuerySet) -> bytes:
+    """
+    Evaluates `queryset` and returns compressed plain values of the resulting rows
+    """
+    iterable_class = queryset._iterable_class
+    records = list(queryset)
+    fields, annotations = [], []
+    if iterable_class is ModelIterable:
+        if records:
+            fields, annotations = _model_columns(queryset, records[0])
+        rows = [tuple(getattr(rec, name) for name in fields + annotations) for rec in records]
+    elif iterable_class is ValuesIterable:
+        if records:
+            fields = list(records[0])
+        rows = [tuple(rec.values()) for rec in records]
+    elif iterable_class is FlatValuesListIterable:
+        rows = [(rec,) for rec in records]
+    else:
+        if records and iterable_class is NamedValuesListIterable:
+            fields = list(records[0]._fields)
+        rows = [tuple(rec) for rec in records]
+    payload = {
+        'iterable_class': iterable_class.__name__,
+        'fields': fields,
+        'annotations': annotations,
+        'rows': rows,
+    }
+    return lz4.frame.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+
+
+def load_results_payload(data: bytes) -> dict:
+    """
+    Decompresses data created by `serialize_results`
+    """
+    return pickle.loads(lz4.frame.decompress(data))
+
+
+class CachedResults(list):
+    """
+    List of records restored from data created by `serialize_results`.
+
+    The records have the same form as those the original queryset would produce - model
+    instances, dicts, tuples or plain values. It is a real list, so that it is serialized as
+    one, e.g. by the JSON encoder of DRF.
+
+    `data` may also be a payload already loaded by `load_results_payload` - new records are
+    created from it for each instance, so it may be shared.
+    """
+
+    def __init__(self, model, data: Union[bytes, dict], using: str = DEFAULT_DB_ALIAS):
+        self.model = model
+        self.using = using
+        payload = data if isinstance(data, dict) else load_results_payload(data)
+        super().__init__(self._make_records(payload))
+
+    def _make_records(self, payload: dict) -> Iterator:
+        rows = payload['rows']
+        fields = payload['fields']
+        iterable_class = payload['iterable_class']
+        if iterable_class == ModelIterable.__name__:
+            field_count = len(fields)
+            annotations = payload['annotations']
+            for row in rows:
+                obj = self.model.from_db(self.using, fields, row[:field_count])
+                for name, value in zip(annotations, row[field_count:]):
+                    setattr(obj, name, value)
+                yield obj
+        elif iterable_class == ValuesIterable.__name__:
+            for row in rows:
+                yield dict(zip(fields, row))
+        elif iterable_class == FlatValuesListIterable.__name__:
+            for row in rows:
+                yield row[0]
+        elif iterable_class == NamedValuesListIterable.__name__:
+            row_class = NamedValuesListIterable.create_namedtuple_class(*fields)
+            for row in rows:
+                yield row_class(*row)
+        elif iterable_class == ValuesListIterable.__name__:
+            yield from rows
+        else:
+            raise ValueError(f'Unsupported iterable class: {iterable_class}')
+
+    def __repr__(self):
+        return f'<CachedResults of {self.model.__name__}>'
+
+    def count(self, *args) -> int:
+        """
+        Mimics `QuerySet.count` so that the results may be used in place of a queryset.
+        `list.count` is used when a value to count is given.
+        """
+        if args:
+            return super().count(*args)
+        return len(self)
+
+    def exists(self) -> bool:
+        return bool(self)
@@ -4,7 +4,10 @@ from time import monotonic
 import celery
 import django
 from core.logic.error_reporting import email_if_fails
+from core.task_support import cache_based_semaphore
+from django.conf import settings
 from recache.models import CachedQuery, RenewalError
+from recache.renewal import renew_due_cached_queries, update_renewal_queue_depth
 
 logger = logging.getLogger(__name__)
 
@@ -31,26 +34,32 @@ def renew_cached_query_task(pk: int):
 
 @celery.shared_task
 @email_if_fails
-def find_and_renew_first_due_cached_query_task():
+def renew_due_cached_queries_task():
     """
-    Finds the first `CachedQuery` that needs renewing, renews it and calls itself to process more
-    caches
+    Starts `RECACHE_RENEWAL_WORKERS` workers which renew cached queries that are due
     """
-    cq = CachedQuery.objects.past_timeout().first()
-    if not cq:
-        logger.debug('No CachedQuery for renewal found')
-        return
-    start = monotonic()
-    try:
-        cq.renew()
-    except RenewalError as exc:
-        logger.warning('Renewal error (%s), deleting cache: %s', exc, cq)
-        cq.delete()
-    else:
-        logger.debug('Renewed cached query "%s" in %.2f s', cq, monotonic() - start)
-    # call self (until no candidate is found)
-    logger.debug('Looking for more due cached queries')
-    find_and_renew_first_due_cached_query_task.apply_async()
+    depth = update_renewal_queue_depth()
+    logger.debug('Cached queries due for renewal: %d', depth)
+    if depth:
+        for _i in range(settings.RECACHE_RENEWAL_WORKERS):
+            renew_cached_queries_worker_task.delay()
+
+
+@celery.shared_task
+@email_if_fails
+def renew_cached_queries_worker_task():
+    """
+    One worker of the concurrent renewal of cached queries
+    """
+    with cache_based_semaphore(
+        'renew_cached_queries_worker', settings.RECACHE_RENEWAL_WORKERS
+    ) as acquired:
+        if not acquired:
+            logger.debug('All cached query renewal workers are already running')
+            return
+        start = monotonic()
+        renewed = renew_due_cached_queries()
+        logger.info('Renewed %d cached queries in %.2f s', renewed, monotonic() - start)
 
 
 @celery.shared_task
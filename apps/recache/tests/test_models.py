@@ -107,6 +107,38 @@ class TestCachedQuery:
         data2 = list(cq.get_cached_queryset())
         assert data == data2
 
+    @pytest.mark.parametrize(
+        ['make_queryset'],
+        [
+            (lambda: User.objects.order_by('pk').values_list('pk', flat=True),),
+            (lambda: User.objects.order_by('pk').values_list('pk', 'username'),),
+            (lambda: User.objects.order_by('pk').values_list('pk', 'username', named=True),),
+            (lambda: User.objects.order_by('pk').values('pk', 'username'),),
+            (lambda: User.objects.order_by('pk').only('username')[:2],),
+        ],
+    )
+    def test_cached_results_have_queryset_form(self, make_queryset):
+        UserFactory.create_batch(3)
+        queryset = make_queryset()
+        data = list(queryset)
+        cq = CachedQuery.objects.create_from_queryset(queryset)
+        cq.refresh_from_db()
+        cached = cq.get_cached_queryset()
+        assert len(cached) == len(data)
+        assert list(cached) == data
+        assert cached[0] == data[0]
+        assert list(cq.get_fresh_queryset()) == data
+
+    def test_cached_model_instances_keep_annotations(self):
+        UserFactory.create_batch(2)
+        queryset = User.objects.annotate(group_count=Count('groups')).order_by('pk')
+        cq = CachedQuery.objects.create_from_queryset(queryset)
+        cq.refresh_from_db()
+        users = list(cq.get_cached_queryset())
+        assert [user.pk for user in users] == [user.pk for user in queryset]
+        assert all(user.group_count == 0 for user in users)
+        assert users[0].username == queryset[0].username
+
     def test_renew_with_different_django_version(self):
         """
         Test that when a cached query for older django version is renewed the `django_version`
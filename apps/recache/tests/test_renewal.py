@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+from recache.models import DEFAULT_TIMEOUT, CachedQuery
+from recache.renewal import renew_due_cached_queries
+
+from test_fixtures.entities.users import UserFactory
+
+User = get_user_model()
+
+
+@pytest.fixture
+def cached_queries():
+    UserFactory.create_batch(2)
+    cq1 = CachedQuery.objects.create_from_queryset(User.objects.all())
+    cq2 = CachedQuery.objects.create_from_queryset(User.objects.filter(is_active=True))
+    cq3 = CachedQuery.objects.create_from_queryset(User.objects.filter(is_superuser=False))
+    return cq1, cq2, cq3
+
+
+@pytest.mark.django_db
+class TestCachedQueryRenewal:
+    def test_due_for_renewal(self, cached_queries):
+        cq1, cq2, _cq3 = cached_queries
+        assert CachedQuery.objects.due_for_renewal().count() == 0
+        cq1.last_updated -= 2 * DEFAULT_TIMEOUT
+        cq1.save()
+        # cq2 times out in 2 minutes
+        cq2.last_updated -= DEFAULT_TIMEOUT - timedelta(minutes=2)
+        cq2.save()
+        assert set(CachedQuery.objects.due_for_renewal()) == {cq1}
+        assert set(CachedQuery.objects.due_for_renewal(timedelta(minutes=5))) == {cq1, cq2}
+
+    def test_renewal_priority(self, cached_queries):
+        cq1, cq2, cq3 = cached_queries
+        for cq in cached_queries:
+            cq.last_updated -= 2 * DEFAULT_TIMEOUT
+        cq2.hit_count = 100
+        cq3.query_durations = [0.25]
+        cq3.last_updated -= DEFAULT_TIMEOUT
+        for cq in cached_queries:
+            cq.save()
+        # cq2 is used much more often than the others, cq3 was stale for twice as long as cq1,
+        # but takes only a quarter of the time of queries without recorded duration
+        assert list(CachedQuery.objects.by_renewal_priority()) == [cq2, cq1, cq3]
+
+    def test_renew_due_cached_queries(self, cached_queries, settings):
+        settings.RECACHE_RENEW_AHEAD = 300
+        cq1, cq2, cq3 = cached_queries
+        cq1.last_updated -= 2 * DEFAULT_TIMEOUT
+        cq1.save()
+        cq2.last_updated -= DEFAULT_TIMEOUT - timedelta(minutes=2)
+        cq2.save()
+        UserFactory.create_batch(1)
+        assert renew_due_cached_queries() == 2
+        for cq in cached_queries:
+            cq.refresh_from_db()
+        assert cq1.get_cached_queryset(record_hit=False).count() == 3
+        assert cq2.get_cached_queryset(record_hit=False).count() == 3
+        assert cq3.get_cached_queryset(record_hit=False).count() == 2, 'was not due'
+        assert CachedQuery.objects.due_for_renewal(timedelta(seconds=300)).count() == 0
+
+    def test_failed_renewal_is_not_repeated(self, cached_queries):
+        cq1 = cached_queries[0]
+        cq1.last_updated -= 2 * DEFAULT_TIMEOUT
+        cq1.save()
+        with patch.object(CachedQuery, 'force_renew', side_effect=ValueError('boom')) as renew:
+            assert renew_due_cached_queries() == 0
+            renew.assert_called_once()
+
+    def test_short_timeout_is_renewed_once(self, settings):
+        settings.RECACHE_RENEW_AHEAD = 300
+        # the query is due for renewal right after it is renewed
+        cq = CachedQuery.objects.create_from_queryset(
+            User.objects.all(), timeout=timedelta(minutes=1)
+        )
+        assert renew_due_cached_queries() == 1
+        assert CachedQuery.objects.due_for_renewal(timedelta(seconds=300)).get() == cq
@@ -2,6 +2,7 @@ from unittest.mock import patch
 
 import pytest
 from django.contrib.auth import get_user_model
+from recache.local import hit_counter, local_cache
 from recache.models import CachedQuery
 from recache.util import recache_queryset
 
@@ -59,7 +60,7 @@ class TestRecacheQueryset:
         cq = CachedQuery.objects.get()
         cq.last_updated -= 1.5 * cq.timeout
         cq.save()
-        with patch('recache.util.find_and_renew_first_due_cached_query_task') as renewal_task:
+        with patch('recache.util.renew_due_cached_queries_task') as renewal_task:
             qs = recache_queryset(User.objects.all())
             renewal_task.apply_async.assert_called()
         assert CachedQuery.objects.count() == 1, 'still only one cache object'
@@ -82,7 +83,7 @@ class TestRecacheQueryset:
         cq = CachedQuery.objects.get()
         cq.last_updated -= 3 * cq.timeout
         cq.save()
-        with patch('recache.util.find_and_renew_first_due_cached_query_task') as renewal_task:
+        with patch('recache.util.renew_due_cached_queries_task') as renewal_task:
             qs = recache_queryset(User.objects.all())
             renewal_task.apply_async.assert_not_called()
         assert CachedQuery.objects.count() == 1, 'still only one cache object'
@@ -104,7 +105,7 @@ class TestRecacheQueryset:
         cq = CachedQuery.objects.get()
         cq.django_version = '2.2.foobar'
         cq.save()
-        with patch('recache.util.find_and_renew_first_due_cached_query_task') as renewal_task:
+        with patch('recache.util.renew_due_cached_queries_task') as renewal_task:
             qs = recache_queryset(User.objects.all())
             renewal_task.apply_async.assert_not_called()
         assert CachedQuery.objects.count() == 2, 'new cache object is created'
@@ -120,3 +121,55 @@ class TestRecacheQueryset:
         assert CachedQuery.objects.count() == 0
         recache_queryset(User.objects.all())
         assert CachedQuery.objects.count() == 0
+
+
+@pytest.fixture
+def local_recache(settings):
+    settings.RECACHE_LOCAL_TTL = 60
+    settings.RECACHE_HIT_FLUSH_INTERVAL = 3600
+    local_cache.clear()
+    hit_counter.flush()
+    yield
+    local_cache.clear()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('local_recache')
+class TestRecacheLocalCache:
+    def test_valid_result_is_served_from_memory(self, django_assert_num_queries):
+        UserFactory.create_batch(2)
+        recache_queryset(User.objects.all())
+        # the first hit loads the data from the db and stores them locally
+        assert recache_queryset(User.objects.all()).count() == 2
+        UserFactory.create_batch(1)
+        with django_assert_num_queries(0):
+            qs = recache_queryset(User.objects.all())
+            assert len(qs) == 2, 'old data from the local cache'
+        cq = CachedQuery.objects.get()
+        assert cq.hit_count == 0, 'hits are not written yet'
+        hit_counter.flush()
+        cq.refresh_from_db()
+        assert cq.hit_count == 2
+
+    def test_records_are_not_shared(self):
+        UserFactory.create_batch(2)
+        queryset = User.objects.values('pk', 'username')
+        recache_queryset(queryset)
+        data1 = recache_queryset(queryset)
+        data1[0]['username'] = 'changed'
+        data2 = recache_queryset(queryset)
+        assert data2[0]['username'] != 'changed'
+
+    def test_expired_cached_query_is_not_used(self):
+        UserFactory.create_batch(1)
+        recache_queryset(User.objects.all())
+        recache_queryset(User.objects.all())
+        cq = CachedQuery.objects.get()
+        # the local entry cannot outlive the cached query
+        entry = local_cache.get(cq.query_hash)
+        assert entry.expires <= cq.valid_until
+        cq.last_updated -= 3 * cq.timeout
+        cq.save()
+        local_cache.discard(cq.query_hash)
+        UserFactory.create_batch(1)
+        assert recache_queryset(User.objects.all()).count() == 2
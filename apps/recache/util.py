@@ -6,13 +6,14 @@ import django
 from django.db import IntegrityError
 from django.db.transaction import atomic
 
+from .local import hit_counter, local_cache
 from .models import DEFAULT_LIFETIME, DEFAULT_TIMEOUT, EMPTY_RESULT_DURATION_THRESHOLD, CachedQuery
-from .tasks import find_and_renew_first_due_cached_query_task
+from .serialization import CachedResults
+from .tasks import renew_due_cached_queries_task
 
 logger = logging.getLogger(__name__)
 
 
-@atomic
 def recache_queryset(
     queryset,
     timeout: timedelta = DEFAULT_TIMEOUT,
@@ -29,10 +30,31 @@ def recache_queryset(
       - it is too old -> renew and return the new data
     - queryset is not cached
       - create a new cache
+
+    Valid results are also kept in memory of the process (see `recache.local`) and in such
+    case the database is not touched at all. Valid results found in the database are returned
+    without locking the `CachedQuery` row - the lock is only needed for its renewal or removal.
     """
     logger.debug('Recaching queryset')
+    qs_hash = CachedQuery.compute_queryset_hash(queryset)
+    if entry := local_cache.get(qs_hash):
+        logger.debug('Returning valid cached version from local cache')
+        hit_counter.record(entry.cached_query_id)
+        return CachedResults(queryset.model, entry.payload)
+    return _recache_queryset_db(queryset, qs_hash, timeout, lifetime, origin)
+
+
+@atomic
+def _recache_queryset_db(queryset, qs_hash: str, timeout, lifetime, origin):
+    cq = CachedQuery.objects.filter(query_hash=qs_hash, django_version=django.get_version()).first()
+    if cq and cq.is_valid:
+        logger.debug('Returning valid cached version')
+        local_cache.put(cq)
+        return cq.get_cached_queryset()
     try:
-        cq: CachedQuery = CachedQuery.objects.select_for_update().get_for_queryset(queryset)
+        cq: CachedQuery = CachedQuery.objects.select_for_update().get(
+            query_hash=qs_hash, django_version=django.get_version()
+        )
         logger.debug('Found existing version: %s (last update: %s)', cq, cq.last_updated)
         if cq.django_version != django.get_version():
             logger.debug(
@@ -41,16 +63,19 @@ def recache_queryset(
                 django.get_version(),
             )
             # delete should be thread safe because select_for_update() above locked the db row
+            local_cache.discard(qs_hash)
             cq.delete()
             safe_create_cached_query(queryset, timeout, lifetime, origin)
             return queryset
         if cq.is_valid:
+            # renewed in the meantime
             logger.debug('Returning valid cached version')
+            local_cache.put(cq)
             return cq.get_cached_queryset()
         if not cq.is_too_old:
             logger.debug('Cache slightly stale - returning cached version and scheduling renewal')
             qs = cq.get_cached_queryset()
-            find_and_renew_first_due_cached_query_task.apply_async()
+            renew_due_cached_queries_task.apply_async()
             return qs
         # it is too old, we need to re-evaluate before returning data
         logger.debug('Stale cache - renewing cache, scheduling next renew and returning new data')
@@ -101,15 +101,49 @@ class HarvestAdmin(admin.ModelAdmin):
         return False
 
 
+class CooldownDecisionInline(admin.TabularInline):
+    model = models.CooldownDecision
+    fields = readonly_fields = (
+        'timestamp',
+        'old_cooldown',
+        'new_cooldown',
+        'reason',
+        'attempt',
+        'learned_duration',
+        'learned_error_rate',
+        'learned_throttle_rate',
+    )
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(models.Scheduler)
 class SchedulerAdmin(admin.ModelAdmin):
+    inlines = (CooldownDecisionInline,)
     search_fields = ('url',)
-    readonly_fields = ('current_intention',)
+    readonly_fields = (
+        'current_intention',
+        'learned_duration',
+        'learned_error_rate',
+        'learned_throttle_rate',
+    )
+    list_filter = ('adaptive',)
 
     list_display = (
         'url',
         'when_ready',
         'cooldown',
+        'adaptive',
+        'learned_duration',
+        'learned_error_rate',
+        'learned_throttle_rate',
         'too_many_requests_delay',
         'service_not_available_delay',
         'service_busy_delay',
@@ -0,0 +1,78 @@
+"""
+Materialized counters of harvests.
+
+The numbers of planned, working and finished intentions shown in harvest lists are stored
+in `Harvest` objects, so that the lists do not have to aggregate all the intentions and
+attempts on each request. Harvests whose intentions, their attempts or the schedulers
+processing them change are marked as outdated and their counters are recomputed once
+the transaction is committed. Changes made by bulk operations do not send any signals,
+so the counters are also reconciled periodically.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from django.db import transaction
+
+_pending = threading.local()
+
+
+def refresh_harvest_stats(harvest_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recomputes counters of the given harvests, all harvests when `harvest_ids` is None
+
+    :returns: number of harvests whose counters were out of date
+    """
+    from ..models import Harvest
+
+    harvests = Harvest.objects.all()
+    if harvest_ids is not None:
+        harvests = harvests.filter(pk__in=list(harvest_ids))
+    return harvests.refresh_stats()
+
+
+def _refresh_outdated_harvest_stats():
+    harvest_ids, _pending.outdated = getattr(_pending, 'outdated', set()), set()
+    if harvest_ids:
+        refresh_harvest_stats(harvest_ids)
+
+
+def harvest_stats_changed(*harvest_ids: Optional[int]):
+    """
+    Marks counters of harvests as outdated. They are refreshed after the current transaction
+    is committed, all outdated harvests at once, so that the harvests are not locked
+    by the transaction and each change does not aggregate all intentions of the harvest.
+    Within a `deferred_harvest_stats` block, the harvests are marked at its end.
+    """
+    harvest_ids = {pk for pk in harvest_ids if pk}
+    if not harvest_ids:
+        return
+    deferred = getattr(_pending, 'deferred', None)
+    if deferred is not None:
+        deferred.update(harvest_ids)
+        return
+    if getattr(_pending, 'outdated', None) is None:
+        _pending.outdated = set()
+    _pending.outdated.update(harvest_ids)
+    # the callback is registered each time, because callbacks of rolled back transactions
+    # are discarded - the callbacks which run after the first one have nothing to refresh
+    transaction.on_commit(_refresh_outdated_harvest_stats)
+
+
+@contextmanager
+def deferred_harvest_stats():
+    """
+    Harvests whose counters change within the block are marked as outdated only once
+    at its end. This matters outside of transactions where the counters are refreshed
+    right away.
+    """
+    if getattr(_pending, 'deferred', None) is not None:
+        # nested block - the outer one will mark the harvests
+        yield
+        return
+    _pending.deferred = set()
+    try:
+        yield
+    finally:
+        harvest_ids, _pending.deferred = _pending.deferred, None
+    harvest_stats_changed(*harvest_ids)
@@ -0,0 +1,129 @@
+"""
+Harvesting of SUSHI data for many scheduler URLs at once by one worker.
+
+An asyncio event loop decides which scheduler should run next and waits for cooldowns, so
+that a harvesting worker is not blocked by one slow provider. The SUSHI clients themselves
+are blocking, so the database steps and the downloads run in a pool of threads. Downloads are
+done outside of any transaction - the intention is first assigned to its scheduler, which keeps
+other intentions of the same URL from being processed, and the downloaded data are stored
+once the download is finished. The per-URL semantics are the same as with `Scheduler.run_next`.
+"""
+import asyncio
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.db import connections
+from django.utils import timezone
+
+from ..models import FetchIntention, RunResponse, Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Harvester:
+    """
+    Runs scheduler queues of all URLs which are ready until there is no work left or
+    `run_time` seconds have passed. At most `concurrency` downloads run at the same time.
+    """
+
+    def __init__(
+        self,
+        celery_task_id: Optional[str] = None,
+        concurrency: int = 10,
+        run_time: float = 600,
+        poll_interval: float = 10,
+    ):
+        self.celery_task_id = celery_task_id
+        self.concurrency = concurrency
+        self.run_time = run_time
+        self.poll_interval = poll_interval
+        self.stats = Counter()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._deadline = 0.0
+
+    def run(self) -> Counter:
+        """
+        :return: number of scheduler runs by their `RunResponse`
+        """
+        asyncio.run(self._main())
+        return self.stats
+
+    async def _main(self):
+        loop = asyncio.get_running_loop()
+        self._deadline = loop.time() + self.run_time
+        running: Dict[str, asyncio.Task] = {}
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='harvester') as executor:
+            self._executor = executor
+            while loop.time() < self._deadline:
+                for url in await self._in_thread(self.ready_urls):
+                    if url not in running:
+                        running[url] = asyncio.create_task(self._harvest_url(url))
+                if not running:
+                    break
+                done, _pending = await asyncio.wait(
+                    running.values(),
+                    timeout=self.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                running = {url: task for url, task in running.items() if task not in done}
+            if running:
+                await asyncio.wait(running.values())
+
+    async def _in_thread(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._close_connections_after, func, *args
+        )
+
+    @staticmethod
+    def _close_connections_after(func, *args):
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    async def _harvest_url(self, url: str):
+        """
+        Processes intentions of one URL one after another respecting the scheduler cooldown
+        """
+        loop = asyncio.get_running_loop()
+        while loop.time() < self._deadline:
+            try:
+                scheduler, res, intention = await self._in_thread(self.claim, url)
+                if intention:
+                    # the scheduler is locked by the intention, we may download without
+                    # holding any transaction
+                    downloaded = await self._in_thread(intention.download)
+                    res = await self._in_thread(
+                        scheduler.finish_intention, intention, self.celery_task_id, downloaded
+                    )
+            except Exception as exc:
+                # the scheduler will be unlocked by `Scheduler.unlock_stucked_schedulers`
+                logger.exception('Harvesting of "%s" failed: %s', url, exc)
+                self.stats['error'] += 1
+                return
+            self.stats[res.name] += 1
+            if res == RunResponse.PROCESSED:
+                continue
+            elif res == RunResponse.COOLDOWN:
+                wait = (scheduler.when_ready - timezone.now()).total_seconds()
+                await asyncio.sleep(max(min(wait, self._deadline - loop.time()), 0))
+            else:
+                # idle, busy (processed by someone else) or broken
+                return
+
+    def claim(self, url: str) -> Tuple[Scheduler, Optional[RunResponse], Optional[FetchIntention]]:
+        scheduler, created = Scheduler.objects.get_or_create(url=url)
+        if created:
+            logger.info("Creating scheduler with url %s", url)
+        res, intention = scheduler.claim_next(self.celery_task_id)
+        if intention:
+            # load related objects needed for the download in this thread
+            intention.credentials
+            intention.counter_report
+        return scheduler, res, intention
+
+    @staticmethod
+    def ready_urls() -> List[str]:
+        return [scheduler.url for scheduler in FetchIntention.objects.schedulers_to_trigger()]
@@ -0,0 +1,118 @@
+"""
+Adaptive cooldown of schedulers.
+
+Each processed attempt updates moving averages of the download time, error rate and throttling
+rate of the scheduler of its URL. Throttling means that the provider answered with HTTP 429
+or with one of the 'service busy', 'preparing data' or 'too many requests' SUSHI exceptions.
+The cooldown between two downloads from the URL is then derived from them - it doubles each
+time the provider throttles us and slowly shrinks when it does not, but it never drops below
+the time the provider needs to answer one request.
+"""
+import math
+import typing
+
+from celus_nigiri.error_codes import ErrorCode
+from sushi.models import AttemptStatus, SushiFetchAttempt
+
+if typing.TYPE_CHECKING:
+    from ..models import Scheduler
+
+SMOOTHING = 0.2  # weight of the last attempt in the moving averages
+MIN_COOLDOWN = 1  # in seconds
+MAX_COOLDOWN = 15 * 60  # in seconds
+BACKOFF_FACTOR = 2
+RECOVERY_FACTOR = 0.8
+# the cooldown is shortened only when the provider behaves well recently
+RECOVERY_MAX_THROTTLE_RATE = 0.05
+RECOVERY_MAX_ERROR_RATE = 0.2
+# number of decisions kept for each scheduler
+DECISION_LOG_SIZE = 50
+
+THROTTLING_ERROR_CODES = {
+    str(code.value)
+    for code in (ErrorCode.SERVICE_BUSY, ErrorCode.PREPARING_DATA, ErrorCode.TOO_MANY_REQUESTS)
+}
+
+
+def is_throttled(attempt: SushiFetchAttempt) -> bool:
+    return attempt.http_status_code == 429 or attempt.error_code in THROTTLING_ERROR_CODES
+
+
+def is_failed(attempt: SushiFetchAttempt) -> bool:
+    return attempt.status in (
+        AttemptStatus.DOWNLOAD_FAILED,
+        AttemptStatus.PARSING_FAILED,
+    ) or attempt.error_code == str(ErrorCode.SERVICE_NOT_AVAILABLE.value)
+
+
+def moving_average(average: typing.Optional[float], value: float) -> float:
+    if average is None:
+        return value
+    return average + SMOOTHING * (value - average)
+
+
+def next_cooldown(scheduler: 'Scheduler', throttled: bool) -> typing.Tuple[int, str]:
+    """
+    :returns: new cooldown of the scheduler and the reason for it
+    """
+    cooldown = scheduler.cooldown
+    reason = ''
+    if throttled:
+        cooldown = max(math.ceil(cooldown * BACKOFF_FACTOR), cooldown + 1)
+        reason = 'throttled by the provider'
+    elif (scheduler.learned_throttle_rate or 0) <= RECOVERY_MAX_THROTTLE_RATE and (
+        scheduler.learned_error_rate or 0
+    ) <= RECOVERY_MAX_ERROR_RATE:
+        cooldown = int(cooldown * RECOVERY_FACTOR)
+        reason = 'no recent throttling'
+
+    # there should be at least as long pause between requests as the provider needs
+    # to answer one request
+    floor = min(max(math.ceil(scheduler.learned_duration or 0), MIN_COOLDOWN), MAX_COOLDOWN)
+    if cooldown < floor:
+        cooldown = floor
+        if not throttled:
+            reason = 'slow responses'
+    return min(cooldown, MAX_COOLDOWN), reason
+
+
+def observe_attempt(scheduler: 'Scheduler', attempt: SushiFetchAttempt):
+    """
+    Updates the learned parameters of `scheduler` by the result of `attempt` and adapts
+    the cooldown of the scheduler if it is adaptive. Changes of the cooldown are logged in
+    `CooldownDecision` objects, the scheduler itself is not saved.
+    """
+    throttled = is_throttled(attempt)
+    duration = attempt.processing_info.get('download_duration')
+    if duration is not None:
+        scheduler.learned_duration = moving_average(scheduler.learned_duration, duration)
+    scheduler.learned_error_rate = moving_average(
+        scheduler.learned_error_rate, float(is_failed(attempt))
+    )
+    scheduler.learned_throttle_rate = moving_average(
+        scheduler.learned_throttle_rate, float(throttled)
+    )
+
+    if not scheduler.adaptive:
+        return
+
+    cooldown, reason = next_cooldown(scheduler, throttled)
+    if cooldown == scheduler.cooldown:
+        return
+
+    scheduler.cooldown_decisions.create(
+        old_cooldown=scheduler.cooldown,
+        new_cooldown=cooldown,
+        reason=reason,
+        attempt=attempt,
+        learned_duration=scheduler.learned_duration,
+        learned_error_rate=scheduler.learned_error_rate,
+        learned_throttle_rate=scheduler.learned_throttle_rate,
+    )
+    scheduler.cooldown = cooldown
+    # keep only the latest decisions
+    obsolete = scheduler.cooldown_decisions.order_by('-pk').values_list('pk', flat=True)[
+        DECISION_LOG_SIZE:
+    ]
+    if obsolete_pks := list(obsolete):
+        scheduler.cooldown_decisions.filter(pk__in=obsolete_pks).delete()
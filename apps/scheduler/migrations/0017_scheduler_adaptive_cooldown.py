@@ -0,0 +1,80 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sushi', '0055_fill_missing_extracted_data'),
+        ('scheduler', '0016_fix_fi_queues'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduler',
+            name='adaptive',
+            field=models.BooleanField(
+                default=False, help_text='Cooldown is adapted to the behavior of the provider'
+            ),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='learned_duration',
+            field=models.FloatField(
+                blank=True, help_text='Moving average of download time in seconds', null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='learned_error_rate',
+            field=models.FloatField(
+                blank=True, help_text='Moving average of the ratio of failed downloads', null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name='scheduler',
+            name='learned_throttle_rate',
+            field=models.FloatField(
+                blank=True,
+                help_text='Moving average of the ratio of downloads refused by throttling '
+                '(HTTP 429, SUSHI exceptions 1010, 1011 and 1020)',
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name='CooldownDecision',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('old_cooldown', models.PositiveSmallIntegerField()),
+                ('new_cooldown', models.PositiveSmallIntegerField()),
+                ('reason', models.CharField(max_length=100)),
+                ('learned_duration', models.FloatField(blank=True, null=True)),
+                ('learned_error_rate', models.FloatField(blank=True, null=True)),
+                ('learned_throttle_rate', models.FloatField(blank=True, null=True)),
+                (
+                    'attempt',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to='sushi.sushifetchattempt',
+                    ),
+                ),
+                (
+                    'scheduler',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='cooldown_decisions',
+                        to='scheduler.scheduler',
+                    ),
+                ),
+            ],
+            options={'ordering': ('-timestamp',)},
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_harvest_stats(apps, schema_editor):
+    Harvest = apps.get_model('scheduler', 'Harvest')
+    harvests = Harvest.objects.annotate(
+        planned=Count(
+            'intentions__pk',
+            distinct=True,
+            filter=(
+                Q(intentions__when_processed__isnull=True)
+                & Q(intentions__duplicate_of__isnull=True)
+            )
+            | Q(intentions__attempt__status='importing'),
+        ),
+        working=Count(
+            'intentions__pk',
+            distinct=True,
+            filter=Q(intentions__current_scheduler__isnull=False)
+            | Q(intentions__attempt__status='importing'),
+        ),
+        total=Count('intentions__queue_id', distinct=True),
+        attempt_count=Count('intentions__attempt__pk', distinct=True),
+    )
+    to_update = []
+    for harvest in harvests.iterator():
+        harvest.stats_planned = harvest.planned
+        harvest.stats_working = harvest.working
+        harvest.stats_total = harvest.total
+        harvest.stats_attempt_count = harvest.attempt_count
+        to_update.append(harvest)
+    Harvest.objects.bulk_update(
+        to_update,
+        ['stats_planned', 'stats_working', 'stats_total', 'stats_attempt_count'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('scheduler', '0017_scheduler_adaptive_cooldown')]
+
+    operations = [
+        migrations.AddField(
+            model_name='harvest',
+            name='stats_attempt_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='harvest', name='stats_planned', field=models.PositiveIntegerField(default=0)
+        ),
+        migrations.AddField(
+            model_name='harvest', name='stats_total', field=models.PositiveIntegerField(default=0)
+        ),
+        migrations.AddField(
+            model_name='harvest', name='stats_working', field=models.PositiveIntegerField(default=0)
+        ),
+        migrations.RunPython(fill_harvest_stats, migrations.RunPython.noop),
+    ]
@@ -31,6 +31,9 @@ from sushi.models import (
     SushiFetchAttempt,
 )
 
+from .logic.harvest_stats import deferred_harvest_stats, harvest_stats_changed
+from .logic.rate_control import observe_attempt
+
 logger = logging.getLogger(__name__)
 
 
@@ -90,6 +93,22 @@ class Scheduler(models.Model):
     current_celery_task_id = models.UUIDField(null=True, blank=True)
     current_start = models.DateTimeField(null=True, blank=True)
 
+    adaptive = models.BooleanField(
+        default=False, help_text="Cooldown is adapted to the behavior of the provider"
+    )
+    learned_duration = models.FloatField(
+        null=True, blank=True, help_text="Moving average of download time in seconds"
+    )
+    learned_error_rate = models.FloatField(
+        null=True, blank=True, help_text="Moving average of the ratio of failed downloads"
+    )
+    learned_throttle_rate = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Moving average of the ratio of downloads refused by throttling "
+        "(HTTP 429, SUSHI exceptions 1010, 1011 and 1020)",
+    )
+
     def __repr__(self):
         return f'Scheduler #{self.pk} for "{self.url}"'
 
@@ -112,13 +131,27 @@ class Scheduler(models.Model):
         This function can take a while so it should be run only in celery.
         And should not be run within transaction.
         """
+        res, intention = self.claim_next(celery_task_id)
+        if not intention:
+            return res
+        return self.finish_intention(intention, celery_task_id)
+
+    def claim_next(
+        self, celery_task_id: typing.Optional[str] = None
+    ) -> typing.Tuple[typing.Optional[RunResponse], typing.Optional['FetchIntention']]:
+        """
+        Assigns the next intention to this scheduler, so that no other intention of the URL
+        is processed until `finish_intention` is called.
+
+        :returns: (None, intention) when an intention was assigned, (response, None) otherwise
+        """
         # Check whether scheduler is in cooldown period
         if self.last_time:
             last_plus_cooldown = self.last_time + timedelta(seconds=self.cooldown)
             if last_plus_cooldown > timezone.now():
                 self.when_ready = last_plus_cooldown
                 self.save()
-                return RunResponse.COOLDOWN
+                return RunResponse.COOLDOWN, None
 
         # Locking scheduler
         with transaction.atomic():
@@ -129,7 +162,7 @@ class Scheduler(models.Model):
                 )
             except (Scheduler.DoesNotExist, DatabaseError):
                 # Locked - currently processing data
-                return RunResponse.BUSY
+                return RunResponse.BUSY, None
 
             with transaction.atomic():
                 # Takes the first intention
@@ -159,7 +192,7 @@ class Scheduler(models.Model):
                 )
 
                 if not intention:
-                    return RunResponse.IDLE
+                    return RunResponse.IDLE, None
 
                 # Check whether scheduler is ready or has sufficient priority
                 if self.when_ready <= timezone.now() or intention.priority_now:
@@ -172,14 +205,29 @@ class Scheduler(models.Model):
                     self.current_start = timezone.now()
                     self.save()
                 else:
-                    return RunResponse.IDLE
+                    return RunResponse.IDLE, None
 
-        # processing fetch intention
-        with transaction.atomic(savepoint=True):
+        return None, intention
+
+    def finish_intention(
+        self,
+        intention: 'FetchIntention',
+        celery_task_id: typing.Optional[str] = None,
+        downloaded: typing.Optional[dict] = None,
+    ) -> RunResponse:
+        """
+        Processes the intention assigned by `claim_next` and unlocks the scheduler.
+
+        :param downloaded: result of `intention.download()` - when given, the data are not
+                           downloaded within the transaction. When the download was skipped
+                           because the intention should not be fetched, `process` returns
+                           right after its `check_processable` step.
+        """
+        with transaction.atomic(savepoint=True), deferred_harvest_stats():
 
             # It may take so time to process the intetion
             # (download the data)
-            process_response = intention.process()
+            process_response = intention.process(downloaded=downloaded)
 
             # lock scheduler
             Scheduler.objects.select_for_update().get(pk=self.pk)
@@ -201,6 +249,8 @@ class Scheduler(models.Model):
                 # Credentials are broken
                 res = RunResponse.BROKEN
             else:
+                if process_response == ProcessResponse.SUCCESS and settings.SCHEDULER_ADAPTIVE:
+                    observe_attempt(self, intention.attempt)
                 # Update cooldown delay
                 self.when_ready = timezone.now() + timedelta(seconds=self.cooldown)
                 res = RunResponse.PROCESSED
@@ -211,6 +261,13 @@ class Scheduler(models.Model):
         return res
 
     def unassign_intention(self):
+        if self.current_intention_id:
+            # the intention is no longer being worked on
+            harvest_stats_changed(
+                FetchIntention.objects.filter(pk=self.current_intention_id)
+                .values_list('harvest_id', flat=True)
+                .first()
+            )
         self.current_intention = None
         self.current_celery_task_id = None
         self.current_start = None
@@ -218,7 +275,7 @@ class Scheduler(models.Model):
 
     @classmethod
     def unlock_stucked_schedulers(cls):
-        with transaction.atomic():
+        with transaction.atomic(), deferred_harvest_stats():
 
             def update_intention(scheduler: 'Scheduler'):
                 # Remove scheduler for unprocessed intention
@@ -255,6 +312,30 @@ class Scheduler(models.Model):
                 logger.info("Scheduler %s was unlocked (timeout)", scheduler)
 
 
+class CooldownDecision(models.Model):
+    """Change of scheduler cooldown made by the adaptive rate control"""
+
+    scheduler = models.ForeignKey(
+        Scheduler, on_delete=models.CASCADE, related_name='cooldown_decisions'
+    )
+    timestamp = models.DateTimeField(auto_now_add=True)
+    old_cooldown = models.PositiveSmallIntegerField()
+    new_cooldown = models.PositiveSmallIntegerField()
+    reason = models.CharField(max_length=100)
+    attempt = models.ForeignKey(
+        'sushi.SushiFetchAttempt', null=True, blank=True, on_delete=models.SET_NULL
+    )
+    learned_duration = models.FloatField(null=True, blank=True)
+    learned_error_rate = models.FloatField(null=True, blank=True)
+    learned_throttle_rate = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('-timestamp',)
+
+    def __str__(self):
+        return f'{self.old_cooldown} s -> {self.new_cooldown} s ({self.reason})'
+
+
 class FetchIntentionQuerySet(models.QuerySet):
     def annotate_credentials_state(self) -> models.QuerySet:
         return self.annotate(
@@ -297,22 +378,47 @@ class FetchIntentionQuerySet(models.QuerySet):
         return res
 
     def schedulers_to_trigger(self) -> typing.List[Scheduler]:
-        res: typing.Set[Scheduler] = set()
-        for fi in self.filter(
-            not_before__lt=timezone.now(),
-            scheduler__isnull=True,
-            duplicate_of__isnull=True,
-            when_processed__isnull=True,
-        ):
-            (scheduler, _) = Scheduler.objects.get_or_create(url=fi.credentials.url)
-            if (
-                scheduler.current_celery_task_id is None
-                and scheduler.current_intention is None
-                and (scheduler.when_ready < timezone.now() or fi.priority_now)
-            ):
-                res.add(scheduler)
-
-        return list(res)
+        """
+        Returns idle schedulers which are ready and have some intentions to process.
+        Schedulers which are not ready yet are also returned if they have an intention with
+        PRIORITY_NOW. Missing schedulers for URLs of pending intentions are created.
+        """
+        now = timezone.now()
+        # one row per URL with the highest priority of its pending intentions
+        url_priorities = dict(
+            self.filter(
+                not_before__lt=now,
+                scheduler__isnull=True,
+                duplicate_of__isnull=True,
+                when_processed__isnull=True,
+            )
+            .order_by()
+            .values('credentials__url')
+            .annotate(max_priority=Max('priority'))
+            .values_list('credentials__url', 'max_priority')
+        )
+        if not url_priorities:
+            return []
+        existing_urls = set(
+            Scheduler.objects.filter(url__in=url_priorities.keys()).values_list('url', flat=True)
+        )
+        # conflicts may only happen when a scheduler is created in parallel
+        Scheduler.objects.bulk_create(
+            [Scheduler(url=url) for url in url_priorities if url not in existing_urls],
+            ignore_conflicts=True,
+        )
+        priority_urls = [
+            url
+            for url, priority in url_priorities.items()
+            if priority >= FetchIntention.PRIORITY_NOW
+        ]
+        return list(
+            Scheduler.objects.filter(
+                url__in=url_priorities.keys(),
+                current_celery_task_id__isnull=True,
+                current_intention__isnull=True,
+            ).filter(Q(when_ready__lt=now) | Q(url__in=priority_urls))
+        )
 
     def latest_intentions(self) -> models.QuerySet:
         """Only latest intentions, retried intentions are skipped"""
@@ -472,10 +578,10 @@ class FetchIntention(models.Model):
 
         return None
 
-    def process(self) -> ProcessResponse:
-        """Should be run only from celery
+    def check_processable(self) -> typing.Optional[ProcessResponse]:
+        """Checks whether the data of this intention should be fetched
 
-        :returns: None if processed, False if credentials are broken, True on success
+        :returns: response of `process` for intentions which should not be fetched, None otherwise
         """
         if not self.scheduler:
             raise ValueError("Trying to process intetion without configured scheduler")
@@ -489,10 +595,38 @@ class FetchIntention(models.Model):
         if self.duplicate_of:
             return ProcessResponse.DUPLICATE
 
-        # fetch attempt
-        attempt: SushiFetchAttempt = self.credentials.fetch_report(
+        return None
+
+    def download(self) -> typing.Optional[dict]:
+        """Downloads data for this intention without touching the database
+
+        :returns: attempt params which should be passed to `process` or None when the intention
+                  should not be fetched (see `check_processable`)
+        """
+        if self.check_processable():
+            return None
+        return self.credentials.download_report(
             self.counter_report, self.start_date, self.end_date, use_url_lock=False
         )
+
+    def process(self, downloaded: typing.Optional[dict] = None) -> ProcessResponse:
+        """Should be run only from celery
+
+        :param downloaded: result of `download` obtained earlier, the data are downloaded
+                           during processing when not given
+        :returns: None if processed, False if credentials are broken, True on success
+        """
+        if response := self.check_processable():
+            return response
+
+        # fetch attempt
+        attempt: SushiFetchAttempt
+        if downloaded is None:
+            attempt = self.credentials.fetch_report(
+                self.counter_report, self.start_date, self.end_date, use_url_lock=False
+            )
+        else:
+            attempt = self.credentials.store_report(downloaded)
         attempt.triggered_by = self.harvest.last_updated_by
         attempt.save()
 
@@ -508,13 +642,16 @@ class FetchIntention(models.Model):
         if attempt.can_import_data:
             # Mark planned fetch intention with the same requirements as
             # processed
-            FetchIntention.objects.filter(
+            duplicates = FetchIntention.objects.filter(
                 when_processed__isnull=True,
                 credentials=self.credentials,
                 counter_report=self.counter_report,
                 start_date=self.start_date,
                 end_date=self.end_date,
-            ).update(duplicate_of=self)
+            )
+            # duplicates may be part of other harvests
+            harvest_stats_changed(*duplicates.values_list('harvest_id', flat=True).distinct())
+            duplicates.update(duplicate_of=self)
 
             # Plan data synchronization
             transaction.on_commit(lambda: import_one_sushi_attempt_task.delay(attempt.pk))
@@ -740,13 +877,14 @@ class HarvestQuerySet(models.QuerySet):
         Note that by default SET_NULL is used when FetchIntention is deleted
         So no data are deleted here.
         """
-        # Remove ImportBatches -> should remove all AccessLogs
-        ib_stats = ImportBatch.objects.filter(
-            sushifetchattempt__fetchintention__harvest__in=self
-        ).delete()
-        # Remove FetchAttempts
-        fa_stats = SushiFetchAttempt.objects.filter(fetchintention__harvest__in=self).delete()
-        harvests_stats = self.delete()
+        with deferred_harvest_stats():
+            # Remove ImportBatches -> should remove all AccessLogs
+            ib_stats = ImportBatch.objects.filter(
+                sushifetchattempt__fetchintention__harvest__in=self
+            ).delete()
+            # Remove FetchAttempts
+            fa_stats = SushiFetchAttempt.objects.filter(fetchintention__harvest__in=self).delete()
+            harvests_stats = self.delete()
         return {
             "import_batches_deleted": ib_stats,
             "fetch_attemtps_deleted": fa_stats,
@@ -754,6 +892,16 @@ class HarvestQuerySet(models.QuerySet):
         }
 
     def annotate_stats(self):
+        """Annotates the materialized counters under the names used by `annotate_computed_stats`"""
+        return self.annotate(
+            planned=F('stats_planned'),
+            working=F('stats_working'),
+            total=F('stats_total'),
+            finished=F('stats_total') - F('stats_planned'),
+            attempt_count=F('stats_attempt_count'),
+        )
+
+    def annotate_computed_stats(self):
         return self.annotate(
             planned=models.Count(
                 'intentions__pk',
@@ -779,6 +927,47 @@ class HarvestQuerySet(models.QuerySet):
             attempt_count=Coalesce(models.Count('intentions__attempt__pk', distinct=True), 0),
         )
 
+    def refresh_stats(self, batch_size: int = 1000) -> int:
+        """
+        Recomputes the materialized counters of harvests. The harvests are locked in batches
+        before the counters are computed, so that concurrent refreshes cannot overwrite fresh
+        counters with ones computed from outdated data.
+
+        :returns: number of harvests whose counters were out of date
+        """
+        changed_count = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                # locking in the order of pks prevents deadlocks of concurrent refreshes
+                locked_pks = list(
+                    self.select_for_update()
+                    .filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not locked_pks:
+                    break
+                changed = []
+                for harvest in (
+                    Harvest.objects.filter(pk__in=locked_pks)
+                    .annotate_computed_stats()
+                    .only('pk', *Harvest.STATS_FIELDS.values())
+                ):
+                    if any(
+                        getattr(harvest, field) != getattr(harvest, name)
+                        for name, field in Harvest.STATS_FIELDS.items()
+                    ):
+                        for name, field in Harvest.STATS_FIELDS.items():
+                            setattr(harvest, field, getattr(harvest, name))
+                        changed.append(harvest)
+                Harvest.objects.bulk_update(changed, Harvest.STATS_FIELDS.values())
+                changed_count += len(changed)
+            if len(locked_pks) < batch_size:
+                break
+            last_pk = locked_pks[-1]
+        return changed_count
+
 
 class FetchIntentionQueue(models.Model):
     id = models.IntegerField(primary_key=True)
@@ -797,6 +986,19 @@ class Harvest(CreatedUpdatedMixin):
 
     objects = HarvestQuerySet.as_manager()
     stats_attrs = ("planned", "total", "attempt_count", "finished", "working")
+    # computed stats and fields where they are materialized
+    STATS_FIELDS = {
+        "planned": "stats_planned",
+        "working": "stats_working",
+        "total": "stats_total",
+        "attempt_count": "stats_attempt_count",
+    }
+
+    # maintained by `scheduler.logic.harvest_stats`
+    stats_planned = models.PositiveIntegerField(default=0)
+    stats_working = models.PositiveIntegerField(default=0)
+    stats_total = models.PositiveIntegerField(default=0)
+    stats_attempt_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f'Harvest #{self.pk}'
@@ -898,6 +1100,7 @@ class Harvest(CreatedUpdatedMixin):
         for fi, queue in fi_to_queue:
             fi.queue = queue
         FetchIntention.objects.bulk_update([rec[0] for rec in fi_to_queue], ['queue'])
+        harvest_stats_changed(harvest.pk)
 
         if priority >= FetchIntention.PRIORITY_NOW:
             from .tasks import trigger_scheduler
@@ -939,37 +1142,6 @@ class Automatic(models.Model):
             UniqueConstraint(fields=['month', 'organization'], name='unique_month_organization'),
         )
 
-    @staticmethod
-    def _cmp_intentions(
-        new: typing.List[FetchIntention], existing: typing.List[FetchIntention]
-    ) -> typing.Tuple[typing.List[FetchIntention], typing.List[FetchIntention]]:
-        """
-        Compares intentions from existing to those which are
-        supposed to be created
-
-        :returns: intentions which need to be added, deleted and stats
-        """
-        new_map = {
-            (e.start_date, e.end_date, e.counter_report.pk, e.credentials.pk): e for e in new
-        }
-        existing_map = {
-            (e.start_date, e.end_date, e.counter_report.pk, e.credentials.pk): e for e in existing
-        }
-
-        # remove those which were e.g. disabled (no in new list)
-        to_delete: typing.List[FetchIntention] = []
-        for ekey, intention in existing_map.items():
-            if ekey not in new_map and not intention.when_processed:
-                to_delete.append(intention)
-
-        # add those which are not in list
-        to_add: typing.List[FetchIntention] = []
-        for nkey, intention in new_map.items():
-            if nkey not in existing_map:
-                to_add.append(intention)
-
-        return (to_add, to_delete)
-
     @classmethod
     def trigger_time(cls, month: date):
         return (
@@ -983,69 +1155,112 @@ class Automatic(models.Model):
     @classmethod
     @transaction.atomic
     def update_for_month(cls, month: date) -> Counter:
-        """Updates automatic updates for selected month"""
+        """
+        Updates automatic updates for selected month
+
+        The desired intentions (one for each enabled, verified and not broken credentials
+        and report type pair) are compared with the existing ones organization by organization
+        in memory, so that only a few bulk queries are needed regardless of the number
+        of credentials.
+        """
         counter = Counter({"added": 0, "deleted": 0})
 
         month = month_start(month)
         month_last = month_end(month)
 
-        new_intentions: typing.List[FetchIntention] = []
-        for cr2c in CounterReportsToCredentials.objects.filter(
-            credentials__enabled=True, broken__isnull=True, credentials__broken__isnull=True
-        ):
+        # (credentials_id, counter_report_id) pairs which should be planned per organization
+        desired: typing.Dict[int, typing.Set[typing.Tuple[int, int]]] = {}
+        for org_id, creds_id, report_id in (
+            CounterReportsToCredentials.objects.filter(
+                credentials__enabled=True, broken__isnull=True, credentials__broken__isnull=True
+            )
             # only verified credentials can be automatically planned
-            if not cr2c.credentials.is_verified:
-                continue
+            .filter(
+                models.Exists(
+                    SushiFetchAttempt.objects.filter(
+                        credentials_id=models.OuterRef('credentials_id'),
+                        status__in=[AttemptStatus.NO_DATA, AttemptStatus.SUCCESS],
+                        credentials_version_hash=models.OuterRef('credentials__version_hash'),
+                    )
+                )
+            ).values_list('credentials__organization_id', 'credentials_id', 'counter_report_id')
+        ):
+            desired.setdefault(org_id, set()).add((creds_id, report_id))
+
+        org_to_harvest = dict(
+            Automatic.objects.filter(month=month).values_list('organization_id', 'harvest_id')
+        )
+
+        # existing intentions of organizations which are already planned
+        existing: typing.Dict[int, typing.Set[typing.Tuple[int, int]]] = {}
+        deletable: typing.List[int] = []
+        for pk, org_id, creds_id, report_id, when_processed in FetchIntention.objects.filter(
+            start_date=month,
+            end_date=month_last,
+            credentials__organization_id__in=list(org_to_harvest),
+        ).values_list(
+            'pk',
+            'credentials__organization_id',
+            'credentials_id',
+            'counter_report_id',
+            'when_processed',
+        ):
+            existing.setdefault(org_id, set()).add((creds_id, report_id))
+            # remove those which were e.g. disabled
+            if not when_processed and (creds_id, report_id) not in desired.get(org_id, ()):
+                deletable.append(pk)
+
+        # deleted intentions are counted by signals
+        with deferred_harvest_stats():
+            if deletable:
+                # intentions which are just being processed are kept
+                to_delete = list(
+                    FetchIntention.objects.select_for_update(skip_locked=True)
+                    .filter(pk__in=deletable, when_processed__isnull=True)
+                    .values_list('pk', flat=True)
+                )
+                FetchIntention.objects.filter(pk__in=to_delete).delete()
+                counter["deleted"] = len(to_delete)
+
+            # create harvests for organizations which are not planned yet
+            new_orgs = [org_id for org_id in desired if org_id not in org_to_harvest]
+            harvests = Harvest.objects.bulk_create(Harvest() for _ in new_orgs)
+            Automatic.objects.bulk_create(
+                Automatic(month=month, organization_id=org_id, harvest=harvest)
+                for org_id, harvest in zip(new_orgs, harvests)
+            )
+            # planning updates existing harvests
+            Harvest.objects.filter(pk__in=list(org_to_harvest.values())).update(
+                last_updated=timezone.now(), last_updated_by=None
+            )
+            org_to_harvest.update(
+                (org_id, harvest.pk) for org_id, harvest in zip(new_orgs, harvests)
+            )
 
-            new_intentions.append(
+            not_before = cls.trigger_time(month_last)
+            to_add = [
                 FetchIntention(
-                    not_before=cls.trigger_time(month_last),
+                    not_before=not_before,
                     priority=FetchIntention.PRIORITY_NORMAL,
-                    credentials=cr2c.credentials,
-                    counter_report=cr2c.counter_report,
+                    credentials_id=creds_id,
+                    counter_report_id=report_id,
                     start_date=month,
                     end_date=month_last,
+                    harvest_id=org_to_harvest[org_id],
                 )
+                for org_id, pairs in desired.items()
+                for creds_id, report_id in pairs - existing.get(org_id, set())
+            ]
+            FetchIntention.objects.bulk_create(to_add, batch_size=1000)
+            # There is no signal if bulk_create is used, each intention starts its own queue
+            new_pks = [fi.pk for fi in to_add]
+            FetchIntentionQueue.objects.bulk_create(
+                (FetchIntentionQueue(id=pk, start_id=pk, end_id=pk) for pk in new_pks),
+                batch_size=1000,
             )
-
-        # group by organization
-        organization_to_intentions = {
-            e.organization: []
-            for e in Automatic.objects.filter(month=month)  # prefill with already planned
-        }
-
-        for intention in new_intentions:
-            org_intentions = organization_to_intentions.get(intention.credentials.organization, [])
-            org_intentions.append(intention)
-            organization_to_intentions[intention.credentials.organization] = org_intentions
-
-        # compare and unschedule disabled
-        for organization, intentions in organization_to_intentions.items():
-            try:
-                automatic = Automatic.objects.get(month=month, organization=organization)
-            except Automatic.DoesNotExist:
-                automatic = None
-            if automatic:
-                # delete missing
-                existing_intentions = list(
-                    FetchIntention.objects.select_for_update().filter(
-                        start_date=month,
-                        end_date=month_last,
-                        credentials__organization=organization,
-                    )
-                )
-                to_add, to_delete = cls._cmp_intentions(intentions, existing_intentions)
-                counter.update({"added": len(to_add), "deleted": len(to_delete)})
-                # Delete extra intentions
-                FetchIntention.objects.filter(pk__in=[e.pk for e in to_delete]).delete()
-                # Extends harvest with new intentions
-                Harvest.plan_harvesting(to_add, automatic.harvest)
-
-            else:
-                # plan right away
-                harvest = Harvest.plan_harvesting(intentions)
-                counter.update({"added": len(intentions)})
-                Automatic.objects.create(month=month, organization=organization, harvest=harvest)
+            FetchIntention.objects.filter(pk__in=new_pks).update(queue_id=F('pk'))
+            harvest_stats_changed(*{fi.harvest_id for fi in to_add})
+            counter["added"] = len(to_add)
 
         return counter
 
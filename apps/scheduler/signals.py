@@ -3,10 +3,11 @@ from django.conf import settings
 from django.db import transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from sushi.models import CounterReportsToCredentials, SushiCredentials
+from sushi.models import CounterReportsToCredentials, SushiCredentials, SushiFetchAttempt
 
 from .logic.automatic import update_cr2c
-from .models import Automatic, FetchIntention, FetchIntentionQueue
+from .logic.harvest_stats import harvest_stats_changed
+from .models import Automatic, FetchIntention, FetchIntentionQueue, Scheduler
 
 
 @receiver(post_save, sender=SushiCredentials)
@@ -71,3 +72,30 @@ def fill_in_queue(sender, instance, created, raw, using, update_fields, **kwargs
     if not instance.queue:
         queue = FetchIntentionQueue.objects.create(id=instance.pk, start=instance, end=instance)
         FetchIntention.objects.filter(pk=instance.pk).update(queue=queue)
+
+
+# should be connected after `fill_in_queue` as the queue is a part of the stats
+@receiver(post_save, sender=FetchIntention)
+@receiver(post_delete, sender=FetchIntention)
+def update_harvest_stats_from_intention(sender, instance, **kwargs):
+    harvest_stats_changed(instance.harvest_id)
+
+
+@receiver(post_save, sender=SushiFetchAttempt)
+def update_harvest_stats_from_attempt(sender, instance, created, **kwargs):
+    if not created:
+        # status of the attempt may have changed
+        harvest_stats_changed(
+            *FetchIntention.objects.filter(attempt=instance).values_list('harvest_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Scheduler)
+def update_harvest_stats_from_scheduler(sender, instance, **kwargs):
+    if instance.current_intention_id:
+        # the intention is being worked on
+        harvest_stats_changed(
+            FetchIntention.objects.filter(pk=instance.current_intention_id)
+            .values_list('harvest_id', flat=True)
+            .first()
+        )
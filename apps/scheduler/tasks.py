@@ -3,15 +3,19 @@ from datetime import datetime, timedelta
 
 import celery
 from core.logic.error_reporting import email_if_fails
+from core.task_support import cache_based_semaphore
 from django.conf import settings
 from django.utils import timezone
 
+from .logic.harvest_stats import refresh_harvest_stats
+from .logic.harvesting import Harvester
 from .models import Automatic, FetchIntention, RunResponse, Scheduler
 
 logger = logging.getLogger(__name__)
 
 
 BUSY_TIMEOUT = 5.0  # in seconds
+HARVESTER_RUN_TIME = 10 * 60  # in seconds
 
 
 @celery.shared_task
@@ -20,12 +24,33 @@ def plan_schedulers_triggering():
     """This job should be run in cron mode with high frequency."""
     logger.info("Trying to unlock schedulers which are stucked.")
     Scheduler.unlock_stucked_schedulers()
+    if settings.SUSHI_HARVESTER_CONCURRENCY:
+        # the harvester finds the schedulers to trigger itself
+        run_harvester.delay()
+        return
     logger.info("Planning schedulers triggering")
     for scheduler in FetchIntention.objects.schedulers_to_trigger():
         trigger_scheduler.delay(scheduler.url, False)
     logger.info("Schedulers triggering was planned")
 
 
+@celery.shared_task(bind=True, time_limit=Scheduler.JOB_TIME_LIMIT)
+@email_if_fails
+def run_harvester(self):
+    """Processes all schedulers which are ready in one worker, only one instance runs at a time"""
+    with cache_based_semaphore('sushi_harvester', 1, timeout=Scheduler.JOB_TIME_LIMIT) as acquired:
+        if not acquired:
+            logger.info("Harvester is already running")
+            return
+        harvester = Harvester(
+            self.request.id,
+            concurrency=settings.SUSHI_HARVESTER_CONCURRENCY,
+            run_time=HARVESTER_RUN_TIME,
+        )
+        stats = harvester.run()
+        logger.info("Harvester finished: %s", dict(stats))
+
+
 @celery.shared_task(bind=True, time_limit=Scheduler.JOB_TIME_LIMIT)
 @email_if_fails
 def trigger_scheduler(self, url: str, finish: bool = False):
@@ -64,3 +89,12 @@ def update_automatic_harvesting():
         logger.info("Updating planning of automatic harvesting for last month")
         Automatic.update_for_last_month()
         logger.info("Automatic planning for the last month updated")
+
+
+@celery.shared_task
+@email_if_fails
+def reconcile_harvest_stats():
+    """Fixes counters of harvests which were changed without sending signals"""
+    fixed = refresh_harvest_stats()
+    if fixed:
+        logger.warning("Counters of %d harvests were out of date", fixed)
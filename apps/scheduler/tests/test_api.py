@@ -42,10 +42,11 @@ from test_fixtures.scenarios.basic import (  # noqa - fixtures
 
 @pytest.mark.django_db
 class TestHarvestAPI:
-    def test_list(self, basic1, clients, harvests):
+    def test_list(self, basic1, clients, harvests, django_capture_on_commit_callbacks):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         url = reverse('harvest-list')
         resp = clients["master_admin"].get(url, {})
@@ -94,10 +95,13 @@ class TestHarvestAPI:
 
     @pytest.mark.parametrize('column', ['pk', 'created', 'start_date', 'attempt_count'])
     @pytest.mark.parametrize('desc', ['true', 'false', 'undefined'])
-    def test_list_order_by(self, basic1, clients, harvests, desc, column):
+    def test_list_order_by(
+        self, basic1, clients, harvests, desc, column, django_capture_on_commit_callbacks
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         url = reverse('harvest-list')
         resp = clients["master_admin"].get(url, {'order_by': column, 'desc': desc})
@@ -114,13 +118,17 @@ class TestHarvestAPI:
         resorted = list(sorted(values, reverse=desc == 'true'))
         assert values == resorted
 
-    def test_list_filter_finished(self, basic1, clients, harvests):
+    def test_list_filter_finished(
+        self, basic1, clients, harvests, django_capture_on_commit_callbacks
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         # remove unfinished from one harvest
-        harvests["anonymous"].intentions.filter(when_processed__isnull=True).delete()
+        with django_capture_on_commit_callbacks(execute=True):
+            harvests["anonymous"].intentions.filter(when_processed__isnull=True).delete()
 
         url = reverse('harvest-list')
         # test finished filter
@@ -142,10 +150,13 @@ class TestHarvestAPI:
         assert data1[0]["pk"] != data2[0]["pk"]
         assert data1[0]["pk"] != data2[1]["pk"]
 
-    def test_list_filter_automatic(self, basic1, clients, harvests):
+    def test_list_filter_automatic(
+        self, basic1, clients, harvests, django_capture_on_commit_callbacks
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         url = reverse('harvest-list')
         # test finished filter
@@ -162,10 +173,19 @@ class TestHarvestAPI:
         assert data1[0]["pk"] != data2[0]["pk"]
         assert data1[0]["pk"] != data2[1]["pk"]
 
-    def test_list_filter_broken(self, basic1, clients, harvests, credentials, counter_report_types):
+    def test_list_filter_broken(
+        self,
+        basic1,
+        clients,
+        harvests,
+        credentials,
+        counter_report_types,
+        django_capture_on_commit_callbacks,
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         # broken credentials
         fi = FetchIntentionFactory(
@@ -204,10 +224,13 @@ class TestHarvestAPI:
         data2 = resp.json()["results"]
         assert len(data2) == 1
 
-    def test_list_filter_platforms(self, basic1, clients, harvests, platforms):
+    def test_list_filter_platforms(
+        self, basic1, clients, harvests, platforms, django_capture_on_commit_callbacks
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         url = reverse('harvest-list')
         resp = clients["master_admin"].get(url + f"?platforms={platforms['branch'].pk}", {})
@@ -365,10 +388,13 @@ class TestHarvestAPI:
             ("user2", 1),
         ),
     )
-    def test_list_filtering(self, basic1, harvests, clients, user, length):
+    def test_list_filtering(
+        self, basic1, harvests, clients, user, length, django_capture_on_commit_callbacks
+    ):
 
         # Make sure that automatic are planned
-        Automatic.update_for_last_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_last_month()
 
         url = reverse('harvest-list')
         resp = clients[user].get(url, {})
@@ -572,7 +598,9 @@ class TestHarvestAPI:
         )
         assert resp.status_code == 400
 
-    def test_automatic(self, basic1, clients, credentials, verified_credentials):
+    def test_automatic(
+        self, basic1, clients, credentials, verified_credentials, django_capture_on_commit_callbacks
+    ):
         # remove all automatic harvests
         Harvest.objects.filter(automatic__isnull=False).delete()
 
@@ -583,7 +611,8 @@ class TestHarvestAPI:
         assert len(data) == 0
 
         # this should create automatic harvests
-        Automatic.update_for_this_month()
+        with django_capture_on_commit_callbacks(execute=True):
+            Automatic.update_for_this_month()
 
         url = reverse('harvest-list')
         resp = clients["master_admin"].get(url, {})
@@ -9,6 +9,9 @@ from freezegun import freeze_time
 from logs.logic.attempt_import import import_one_sushi_attempt
 from logs.tasks import import_one_sushi_attempt_task
 from scheduler import tasks
+from scheduler.logic.harvest_stats import refresh_harvest_stats
+from scheduler.logic.harvesting import Harvester
+from scheduler.logic.rate_control import observe_attempt
 from scheduler.models import (
     Automatic,
     FetchIntention,
@@ -123,6 +126,35 @@ class TestFetchIntention:
         )
         assert fi3.process() == ProcessResponse.BROKEN
 
+    def test_download_not_processable(self, counter_report_types, credentials, monkeypatch):
+        def mocked_download_report(self, *args, **kwargs):
+            raise AssertionError("data should not be downloaded")
+
+        monkeypatch.setattr(SushiCredentials, 'download_report', mocked_download_report)
+        sch = SchedulerFactory()
+
+        processed = FetchIntentionFactory(when_processed=timezone.now(), scheduler=sch)
+        assert processed.download() is None
+        assert processed.process(downloaded=None) == ProcessResponse.ALREADY_PROCESSED
+
+        # missing mapping
+        broken = FetchIntentionFactory(
+            credentials=CredentialsFactory(broken=None),
+            scheduler=sch,
+            counter_report=counter_report_types["tr"],
+        )
+        assert broken.download() is None
+        assert broken.process(downloaded=None) == ProcessResponse.BROKEN
+
+        duplicate = FetchIntentionFactory(
+            credentials=credentials["standalone_tr"],
+            scheduler=sch,
+            counter_report=counter_report_types["tr"],
+            duplicate_of=processed,
+        )
+        assert duplicate.download() is None
+        assert duplicate.process(downloaded=None) == ProcessResponse.DUPLICATE
+
     def test_process_without_scheduler(self):
         fi = FetchIntentionFactory(when_processed=None, scheduler=None, attempt=None)
         with pytest.raises(ValueError):
@@ -297,6 +329,23 @@ class TestFetchIntention:
             e.pk for e in FetchIntention.objects.schedulers_to_trigger()
         }
 
+    def test_schedulers_to_trigger_query_count(
+        self, credentials, counter_report_types, django_assert_max_num_queries
+    ):
+        for creds in credentials.values():
+            FetchIntentionFactory.create_batch(
+                5,
+                not_before=timezone.now() - timedelta(minutes=1),
+                scheduler=None,
+                credentials=creds,
+                counter_report=counter_report_types["tr"],
+            )
+        urls = {creds.url for creds in credentials.values()}
+        with django_assert_max_num_queries(4):
+            to_trigger = FetchIntention.objects.schedulers_to_trigger()
+        assert {scheduler.url for scheduler in to_trigger} == urls
+        assert Scheduler.objects.count() == len(urls)
+
     @pytest.mark.parametrize(
         "error_code,status,recent_success,automatic,empty_ib,delays,last_canceled",
         (
@@ -813,6 +862,140 @@ class TestScheduler:
             )
             assert scheduler.run_next() == RunResponse.PROCESSED
 
+    @pytest.mark.parametrize(["adaptive", "cooldown", "decisions"], [(True, 8, 1), (False, 10, 0)])
+    def test_run_next_adaptive(
+        self,
+        monkeypatch,
+        credentials,
+        counter_report_types,
+        settings,
+        adaptive,
+        cooldown,
+        decisions,
+    ):
+        settings.SCHEDULER_ADAPTIVE = True
+
+        def mocked_fetch_report(
+            self, counter_report, start_date, end_date, fetch_attemp=None, use_url_lock=True
+        ):
+            return FetchAttemptFactory(
+                error_code="",
+                credentials=credentials["standalone_tr"],
+                counter_report=counter_report_types["tr"],
+                processing_info={"download_duration": 0.5},
+            )
+
+        monkeypatch.setattr(SushiCredentials, 'fetch_report', mocked_fetch_report)
+
+        scheduler = SchedulerFactory(
+            url=credentials["standalone_tr"].url,
+            cooldown=10,
+            adaptive=adaptive,
+            when_ready=datetime(2020, 1, 1, 0, 0, 0, tzinfo=current_tz),
+        )
+        with freeze_time("2020-01-01"):
+            FetchIntentionFactory(
+                not_before=datetime(2020, 1, 1, 0, 0, 0, tzinfo=current_tz),
+                scheduler=None,
+                credentials=credentials["standalone_tr"],
+                counter_report=counter_report_types["tr"],
+            )
+            assert scheduler.run_next() == RunResponse.PROCESSED
+            when_ready = timezone.now() + timedelta(seconds=cooldown)
+
+        scheduler.refresh_from_db()
+        # the provider is observed even if the cooldown is not adapted
+        assert scheduler.learned_duration == 0.5
+        assert scheduler.cooldown == cooldown
+        assert scheduler.when_ready == when_ready
+        assert scheduler.cooldown_decisions.count() == decisions
+
+    def test_new_scheduler_not_adaptive(self):
+        # adaptive cooldown has to be enabled explicitly for each scheduler
+        assert SchedulerFactory().adaptive is False
+
+    @pytest.mark.django_db(transaction=True)
+    def test_harvester(self, monkeypatch, credentials, counter_report_types):
+        def mocked_download_report(self, counter_report, start_date, end_date, use_url_lock=True):
+            return {
+                'credentials': self,
+                'counter_report': counter_report,
+                'start_date': start_date,
+                'end_date': end_date,
+            }
+
+        def mocked_store_report(self, attempt_params, fetch_attempt=None):
+            return FetchAttemptFactory(error_code="", **attempt_params)
+
+        monkeypatch.setattr(SushiCredentials, 'download_report', mocked_download_report)
+        monkeypatch.setattr(SushiCredentials, 'store_report', mocked_store_report)
+        monkeypatch.setattr(import_one_sushi_attempt_task, 'delay', lambda x: None)
+
+        for creds in ("standalone_tr", "standalone_br1_jr1", "branch_pr"):
+            SchedulerFactory(url=credentials[creds].url, cooldown=0)
+        for creds, report in [
+            ("standalone_tr", "tr"),
+            ("standalone_br1_jr1", "br1"),
+            ("standalone_br1_jr1", "jr1"),
+            ("branch_pr", "pr"),
+        ]:
+            FetchIntentionFactory(
+                not_before=timezone.now() - timedelta(minutes=1),
+                scheduler=None,
+                credentials=credentials[creds],
+                counter_report=counter_report_types[report],
+            )
+
+        stats = Harvester(concurrency=2, poll_interval=0.1).run()
+        assert stats[RunResponse.PROCESSED.name] == 4
+        assert not FetchIntention.objects.filter(when_processed__isnull=True).exists()
+        assert FetchIntention.objects.filter(attempt__isnull=False).count() == 4
+        assert not Scheduler.objects.filter(current_intention__isnull=False).exists()
+
+    def test_adaptive_cooldown(self, credentials, counter_report_types):
+        scheduler = SchedulerFactory(
+            url=credentials["standalone_tr"].url, cooldown=10, adaptive=True
+        )
+
+        def attempt(error_code="", duration=0.5):
+            return FetchAttemptFactory(
+                error_code=error_code,
+                credentials=credentials["standalone_tr"],
+                counter_report=counter_report_types["tr"],
+                processing_info={"download_duration": duration},
+            )
+
+        # well behaving provider - cooldown shrinks
+        observe_attempt(scheduler, attempt())
+        assert scheduler.cooldown == 8
+        assert scheduler.learned_duration == 0.5
+        assert scheduler.learned_throttle_rate == 0
+
+        # throttled - cooldown doubles
+        observe_attempt(scheduler, attempt(str(ErrorCode.SERVICE_BUSY.value)))
+        assert scheduler.cooldown == 16
+        assert scheduler.learned_throttle_rate == pytest.approx(0.2)
+
+        # recently throttled - cooldown is kept
+        observe_attempt(scheduler, attempt())
+        assert scheduler.cooldown == 16
+
+        # slow responses - cooldown is at least the download time
+        scheduler.learned_duration = 30
+        observe_attempt(scheduler, attempt(duration=30))
+        assert scheduler.cooldown == 30
+
+        assert [
+            (d.old_cooldown, d.new_cooldown) for d in scheduler.cooldown_decisions.order_by("-pk")
+        ] == [(16, 30), (8, 16), (10, 8)]
+        assert scheduler.cooldown_decisions.order_by("-pk")[0].reason == "slow responses"
+
+        # learning continues without adapting the cooldown
+        scheduler.adaptive = False
+        observe_attempt(scheduler, attempt(str(ErrorCode.TOO_MANY_REQUESTS.value)))
+        assert scheduler.cooldown == 30
+        assert scheduler.cooldown_decisions.count() == 3
+
     def test_unlock_stucked_schedulers(self, credentials, counter_report_types):
 
         scheduler1 = SchedulerFactory(
@@ -1118,7 +1301,9 @@ class TestHarvest:
         }
 
         assert list(
-            Harvest.objects.annotate_stats().order_by('pk').values_list('pk', 'planned', 'total')
+            Harvest.objects.annotate_computed_stats()
+            .order_by('pk')
+            .values_list('pk', 'planned', 'total')
         ) == [
             (harvest1.pk, 1, 2),
             (harvest2.pk, 2, 3),
@@ -1127,6 +1312,83 @@ class TestHarvest:
             (harvest5.pk, 0, 0),
         ]
 
+    def test_materialized_stats(
+        self, counter_report_types, credentials, settings, django_capture_on_commit_callbacks
+    ):
+        settings.AUTOMATIC_HARVESTING_ENABLED = False
+        harvest = HarvestFactory()
+
+        def stored_stats():
+            return (
+                Harvest.objects.annotate_stats()
+                .values("planned", "working", "total", "finished", "attempt_count")
+                .get(pk=harvest.pk)
+            )
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            fi = FetchIntentionFactory(
+                credentials=credentials["standalone_tr"],
+                counter_report=counter_report_types["tr"],
+                when_processed=None,
+                harvest=harvest,
+                duplicate_of=None,
+                attempt=None,
+            )
+            # counters are refreshed only after commit
+            assert stored_stats()["total"] == 0
+        assert len(callbacks) > 0
+        assert stored_stats() == {
+            "planned": 1,
+            "working": 0,
+            "total": 1,
+            "finished": 0,
+            "attempt_count": 0,
+        }
+
+        with django_capture_on_commit_callbacks(execute=True):
+            scheduler = SchedulerFactory(current_intention=fi)
+        assert stored_stats()["working"] == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            fi.attempt = FetchAttemptFactory(
+                counter_report=counter_report_types["tr"],
+                credentials=credentials["standalone_tr"],
+                status=AttemptStatus.IMPORTING,
+            )
+            fi.when_processed = timezone.now()
+            fi.save()
+            scheduler.unassign_intention()
+        assert stored_stats() == {
+            "planned": 1,
+            "working": 1,
+            "total": 1,
+            "finished": 0,
+            "attempt_count": 1,
+        }
+
+        with django_capture_on_commit_callbacks(execute=True):
+            fi.attempt.status = AttemptStatus.SUCCESS
+            fi.attempt.save()
+        assert stored_stats() == {
+            "planned": 0,
+            "working": 0,
+            "total": 1,
+            "finished": 1,
+            "attempt_count": 1,
+        }
+
+        # changes which do not send signals are fixed by reconciliation
+        FetchIntention.objects.filter(pk=fi.pk).update(when_processed=None)
+        assert stored_stats()["planned"] == 0
+        assert refresh_harvest_stats() == 1
+        assert stored_stats()["planned"] == 1
+        assert refresh_harvest_stats() == 0
+        # harvests are processed in batches
+        HarvestFactory.create_batch(2)
+        FetchIntention.objects.filter(pk=fi.pk).update(when_processed=timezone.now())
+        assert Harvest.objects.all().refresh_stats(batch_size=1) == 1
+        assert stored_stats()["planned"] == 0
+
     def test_latest_intentions(self, harvests):
         assert harvests["anonymous"].intentions.count() == 4
         assert harvests["anonymous"].latest_intentions.count() == 3
@@ -1280,6 +1542,40 @@ class TestAutomatic:
             "deleted": 0,
         }, 'no intentions deleted'
 
+    def test_update_for_last_month_query_count(
+        self,
+        credentials,
+        counter_report_types,
+        disable_automatic_scheduling,
+        verified_credentials,
+        django_assert_max_num_queries,
+    ):
+        for _ in range(10):
+            creds = CredentialsFactory(enabled=True)
+            FetchAttemptFactory(
+                credentials=creds,
+                status=AttemptStatus.SUCCESS,
+                credentials_version_hash=creds.version_hash,
+            )
+            for code in ("tr", "pr"):
+                CounterReportsToCredentials.objects.create(
+                    credentials=creds, counter_report=counter_report_types[code]
+                )
+        # the number of queries does not depend on the number of credentials or organizations
+        with django_assert_max_num_queries(15):
+            assert Automatic.update_for_last_month() == {"added": 24, "deleted": 0}
+        assert not FetchIntention.objects.filter(queue__isnull=True).exists()
+        assert all(
+            fi.queue.start == fi.queue.end == fi
+            for fi in FetchIntention.objects.select_related('queue')
+        )
+
+        CounterReportsToCredentials.objects.filter(
+            counter_report=counter_report_types["pr"]
+        ).delete()
+        with django_assert_max_num_queries(20):
+            assert Automatic.update_for_last_month() == {"added": 0, "deleted": 11}
+
     @freeze_time(datetime(2020, 1, 1, 0, 0, 0, 0, tzinfo=current_tz))
     def test_credentials_signals(
         self,
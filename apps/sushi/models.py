@@ -9,6 +9,7 @@ from datetime import date, timedelta
 from functools import reduce
 from hashlib import blake2b
 from tempfile import TemporaryFile
+from time import monotonic
 from typing import IO, Dict, Iterable, Optional, Union
 
 import requests
@@ -405,7 +406,25 @@ class SushiCredentials(BrokenCredentialsMixin, CreatedUpdatedMixin):
                              to one URL
         :return:
         """
+        attempt_params = self.download_report(
+            counter_report, start_date, end_date, use_url_lock=use_url_lock
+        )
+        return self.store_report(attempt_params, fetch_attempt=fetch_attempt)
+
+    def download_report(
+        self,
+        counter_report: CounterReportType,
+        start_date: Union[str, date],
+        end_date: Union[str, date],
+        use_url_lock=True,
+    ) -> dict:
+        """
+        Downloads the report without storing anything into the database. The data are written
+        into a temporary file which is part of the returned attempt params.
 
+        The result should be passed to `store_report`, so the download may be done outside of
+        any database transaction.
+        """
         if isinstance(start_date, str):
             start_date = parse_date(start_date)
 
@@ -419,15 +438,29 @@ class SushiCredentials(BrokenCredentialsMixin, CreatedUpdatedMixin):
         )
         if use_url_lock:
             with cache_based_lock(self.url_lock_name):
+                start = monotonic()
                 attempt_params = fetch_m(client, counter_report, start_date, end_date, output_file)
         else:
+            start = monotonic()
             attempt_params = fetch_m(client, counter_report, start_date, end_date, output_file)
+        # time the provider needed to answer - used to adapt the scheduler cooldown
+        attempt_params.setdefault('processing_info', {})['download_duration'] = monotonic() - start
         # add version info to the attempt
         attempt_params['credentials_version_hash'] = self.version_hash
-        # now store it - into an existing object or a new one
+        return attempt_params
+
+    def store_report(
+        self, attempt_params: dict, fetch_attempt: 'SushiFetchAttempt' = None
+    ) -> 'SushiFetchAttempt':
+        """
+        Stores the result of `download_report` - into an existing `fetch_attempt`
+        or a new one
+        """
         if fetch_attempt:
+            processing_info = attempt_params.pop('processing_info', {})
             for key, value in attempt_params.items():
                 setattr(fetch_attempt, key, value)
+            fetch_attempt.processing_info.update(processing_info)
             fetch_attempt.processing_info['credentials_version'] = self.version_dict()
             fetch_attempt.save()
         else:
@@ -3,9 +3,9 @@ import logging
 from pathlib import Path
 from typing import Callable, Iterable, Optional, Union
 
-from django.db.models import Q
 from logs.logic.validation import normalize_issn
-from publications.models import Title
+from publications.models import TitleIdentifier
+from tags.logic.titles_lists import match_title_identifiers
 from tags.models import AccessibleBy, Tag, TagClass, TaggingBatch, TagScope, TitleTag
 
 logger = logging.getLogger(__name__)
@@ -57,13 +57,16 @@ class ScopusTitleListTagger:
     ):
         to_insert = []
         batch = TaggingBatch.objects.create(internal_name='scopus-topics')
-        titles = Title.objects.filter(~Q(issn='') | ~Q(eissn=''))
-        total = titles.count()
-        for i, title in enumerate(titles.iterator()):
-            for issn in (title.issn, title.eissn):
-                if not issn:
-                    continue
-                for code in self._issn_to_code_map.get(issn, []):
+        # both issn and eissn from the title list are compared to both issn and eissn of titles
+        issn_to_title_ids = match_title_identifiers(
+            (issn, kind, issn)
+            for issn in self._issn_to_code_map
+            for kind in (TitleIdentifier.KIND_ISSN, TitleIdentifier.KIND_EISSN)
+        )
+        total = len(issn_to_title_ids)
+        for i, (issn, title_ids) in enumerate(issn_to_title_ids.items()):
+            for title_id in title_ids:
+                for code in self._issn_to_code_map[issn]:
                     for level, topic in self._class_code_map.get(code, {}).items():
                         if levels and level not in levels:
                             continue
@@ -99,7 +102,7 @@ class ScopusTitleListTagger:
                         to_insert.append(
                             TitleTag(
                                 tag_id=tag.pk,
-                                target_id=title.pk,
+                                target_id=title_id,
                                 tagging_batch=batch,
                                 _tag_class=tag.tag_class,
                                 _exclusive=tag.tag_class.exclusive,
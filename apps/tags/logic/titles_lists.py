@@ -1,18 +1,97 @@
 import abc
 import codecs
 import csv
+import io
 import itertools
 import operator
 from collections import defaultdict
 from dataclasses import dataclass, field
 from functools import reduce
 from gettext import ngettext
-from typing import Any, BinaryIO, Callable, Dict, Generator, Iterable, Optional, Set
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Hashable,
+    Iterable,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from django.db.models import Q
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.db.transaction import atomic
+from logs.logic.copy_binary import BinaryStream
 from logs.logic.data_import import TitleRec
 from logs.logic.validation import normalize_isbn, normalize_issn
-from publications.models import Title
+from publications.models import Title, TitleIdentifier
+
+MATCH_TABLE = 'tmp_title_identifier_match'
+MATCH_FETCH_SIZE = 10_000
+
+
+def _encode_identifier_rows(
+    identifiers: Iterable[Tuple[int, str, str]], chunk_size: int = 1000
+) -> Generator[bytes, None, None]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for chunk in iter(lambda: list(itertools.islice(identifiers, chunk_size)), []):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def match_title_identifiers(
+    identifiers: Iterable[Tuple[Hashable, str, str]], title_qs: Optional[QuerySet] = None
+) -> Dict[Hashable, Set[int]]:
+    """
+    Finds titles for a large number of identifiers at once.
+
+    :param identifiers: triplets (key, kind, value) where kind is one of the
+                        `TitleIdentifier` kinds and key is any value used to identify
+                        the results - typically a row number
+    :param title_qs: if given, only titles from this queryset will be matched
+    :return: dict mapping keys to sets of matched title ids
+
+    The identifiers are copied into a temporary table using `COPY` and matched by a single join
+    against the `TitleIdentifier` table which uses its (kind, value) index.
+    """
+    keys = {}
+    identifiers = (
+        (keys.setdefault(key, len(keys)), kind, value) for key, kind, value in identifiers
+    )
+    identifier_table = TitleIdentifier._meta.db_table
+    match_sql = (
+        f'SELECT m.key, ti.title_id FROM {MATCH_TABLE} m '
+        f'JOIN {identifier_table} ti ON ti.kind = m.kind AND ti.value = m.value'
+    )
+    params = ()
+    if title_qs is not None and title_qs.query.where:
+        title_sql, params = title_qs.values('pk').query.sql_with_params()
+        match_sql += f' WHERE ti.title_id IN ({title_sql})'
+    matches = defaultdict(set)
+    with atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {MATCH_TABLE}')
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {MATCH_TABLE} '
+            f'(key integer NOT NULL, kind text NOT NULL, value text NOT NULL)'
+        )
+        cursor.copy_expert(
+            f'COPY {MATCH_TABLE} (key, kind, value) FROM STDIN WITH (FORMAT csv)',
+            BinaryStream(_encode_identifier_rows(identifiers)),
+        )
+        cursor.execute(f'ANALYZE {MATCH_TABLE}')
+        cursor.execute(match_sql, params)
+        while rows := cursor.fetchmany(MATCH_FETCH_SIZE):
+            for key, title_id in rows:
+                matches[key].add(title_id)
+        cursor.execute(f'DROP TABLE {MATCH_TABLE}')
+    index_to_key = {index: key for key, index in keys.items()}
+    return {index_to_key[index]: title_ids for index, title_ids in matches.items()}
 
 
 @dataclass
@@ -31,11 +110,41 @@ class TitleListReader(abc.ABC):
         merge_issns: bool = True,
         batch_size: int = 100,
         dump_file: Optional[BinaryIO] = None,
+        bulk: bool = False,
+    ) -> Generator[TitleTaggingRecord, None, None]:
+        return self.process_records(
+            self.parse_data(source),
+            merge_issns=merge_issns,
+            batch_size=batch_size,
+            dump_file=dump_file,
+            bulk=bulk,
+        )
+
+    def process_records(
+        self,
+        records: Iterable[TitleTaggingRecord],
+        merge_issns: bool = True,
+        batch_size: int = 100,
+        dump_file: Optional[BinaryIO] = None,
+        bulk: bool = False,
     ) -> Generator[TitleTaggingRecord, None, None]:
+        """
+        Matches titles to records (usually from `parse_data`) and writes the annotated records
+        into `dump_file` if given.
+
+        :param bulk: if True, titles for all records are matched at once using
+                     `add_title_ids_to_records_bulk`, otherwise in batches of `batch_size`
+        """
         dump_writer = None
-        for rec in self.add_title_ids_to_records(
-            self.parse_data(source), merge_issns=merge_issns, batch_size=batch_size
-        ):
+        if bulk:
+            matched = self.add_title_ids_to_records_bulk(
+                records, merge_issns=merge_issns, batch_size=batch_size
+            )
+        else:
+            matched = self.add_title_ids_to_records(
+                records, merge_issns=merge_issns, batch_size=batch_size
+            )
+        for rec in matched:
             if dump_file:
                 if not dump_writer:
                     dump_stream = codecs.getwriter('utf-8')(dump_file)
@@ -90,6 +199,37 @@ class TitleListReader(abc.ABC):
         while batch := list(itertools.islice(irecords, batch_size)):
             yield from self._add_title_ids_to_records_one_chunk(batch, merge_issns=merge_issns)
 
+    def add_title_ids_to_records_bulk(
+        self, records: Iterable[TitleTaggingRecord], merge_issns=True, batch_size=100
+    ) -> Generator[TitleTaggingRecord, None, None]:
+        """
+        Same as `add_title_ids_to_records`, but matches titles for all the records using one
+        query (see `match_title_identifiers`), which is much faster for long lists of titles.
+        `batch_size` is only used for `add_extra_data_to_rec_batch`.
+        """
+        records = list(records)
+
+        def identifiers():
+            for i, record in enumerate(records):
+                if record.title_ids:
+                    continue
+                for attr in ('isbn', 'issn', 'eissn', 'doi'):
+                    if value := getattr(record.title_rec, attr, ''):
+                        if merge_issns and attr in ('issn', 'eissn'):
+                            yield i, TitleIdentifier.KIND_ISSN, value
+                            yield i, TitleIdentifier.KIND_EISSN, value
+                        else:
+                            yield i, attr, value
+
+        matches = match_title_identifiers(identifiers(), title_qs=self.title_qs())
+        for i, record in enumerate(records):
+            if not record.title_ids:
+                record.title_ids = matches.get(i, set())
+        for start in range(0, len(records), batch_size):
+            end = start + batch_size
+            self.add_extra_data_to_rec_batch(records[start:end])
+        yield from records
+
     def _add_title_ids_to_records_one_chunk(
         self, records: [TitleTaggingRecord], merge_issns=True
     ) -> Generator[TitleTaggingRecord, None, None]:
@@ -116,16 +256,16 @@ class TitleListReader(abc.ABC):
             'eissn': eissn_dict,
             'doi': defaultdict(set),
         }
-        q_filters = [Q(**{f'{attr}__in': array}) for attr, array in filters.items() if array]
+        # the identifier lookup table is used instead of OR-ing conditions on the title table,
+        # so that each of the conditions may use the (kind, value) index
+        q_filters = [Q(kind=attr, value__in=array) for attr, array in filters.items() if array]
         if q_filters:
-            for title_rec in (
-                self.title_qs()
+            for title_id, kind, value in (
+                TitleIdentifier.objects.filter(title__in=self.title_qs())
                 .filter(reduce(operator.or_, q_filters))
-                .values('pk', *id_to_titles.keys())
+                .values_list('title_id', 'kind', 'value')
             ):
-                for attr, storage in id_to_titles.items():
-                    if value := title_rec.get(attr):
-                        storage[value].add(title_rec['pk'])
+                id_to_titles[kind][value].add(title_id)
         # now process the records
         for record in records:
             title_ids = set()
@@ -1,5 +1,4 @@
 import codecs
-import csv
 import operator
 import os
 import tempfile
@@ -20,7 +19,7 @@ from logs.logic.data_import import TitleManager
 from organizations.models import Organization
 from publications.models import Platform, Title
 from rest_framework.exceptions import PermissionDenied, ValidationError
-from tags.logic.titles_lists import CsvTitleListReader
+from tags.logic.titles_lists import CsvTitleListReader, TitleTaggingRecord
 
 
 class AccessibleBy(models.IntegerChoices):
@@ -580,13 +579,13 @@ class TaggingBatch(CreatedUpdatedMixin, models.Model):
             ),
         ]
 
-    def file_row_count(self):
-        orig_pos = self.source_file.tell()
+    def parse_source_file(self, reader: CsvTitleListReader) -> [TitleTaggingRecord]:
+        """
+        Parses the whole source file, so that the number of records is known before
+        the titles are matched and the file does not have to be read twice
+        """
         self.source_file.seek(0)
-        check_reader = csv.reader(codecs.getreader('utf-8')(self.source_file))
-        total = sum(1 for _ in check_reader) - 1  # -1 because of header
-        self.source_file.seek(orig_pos)
-        return total
+        return list(reader.parse_data(codecs.iterdecode(self.source_file, 'utf-8')))
 
     def compute_preflight(
         self,
@@ -604,10 +603,9 @@ class TaggingBatch(CreatedUpdatedMixin, models.Model):
         reader = CsvTitleListReader(dump_id_formatter=title_id_formatter)
         stats = Counter()
         unique_title_ids = set()
-        total = self.file_row_count()
-        for rec in reader.process_source(
-            codecs.getreader('utf-8')(self.source_file), dump_file=dump_file
-        ):
+        records = self.parse_source_file(reader)
+        total = len(records)
+        for rec in reader.process_records(records, dump_file=dump_file, bulk=True):
             stats['row_count'] += 1
             unique_title_ids |= rec.title_ids
             if not rec.title_ids:
@@ -669,11 +667,10 @@ class TaggingBatch(CreatedUpdatedMixin, models.Model):
         stats = Counter()
         unique_title_ids = set()
         unmatched_title_recs = []
-        rows_total = self.file_row_count()
+        records = self.parse_source_file(reader)
+        rows_total = len(records)
         with tempfile.NamedTemporaryFile('wb') as dump_file:
-            for rec in reader.process_source(
-                codecs.iterdecode(self.source_file, 'utf-8'), dump_file=dump_file
-            ):
+            for rec in reader.process_records(records, dump_file=dump_file, bulk=True):
                 stats['row_count'] += 1
                 unique_title_ids |= rec.title_ids
                 if not rec.title_ids:
@@ -1,5 +1,6 @@
 import pytest
-from tags.logic.titles_lists import CsvTitleListReader
+from publications.models import Title
+from tags.logic.titles_lists import CsvTitleListReader, match_title_identifiers
 
 from test_fixtures.entities.titles import TitleFactory
 
@@ -48,3 +49,41 @@ class TestCsvTitleListReader:
                 )
         assert len(data) == 6
         assert [len(rec.title_ids) for rec in data] == expected_counts
+
+    @pytest.mark.parametrize(
+        ['merge_issns', 'expected_counts'],
+        [(False, [1, 1, 0, 0, 0, 0]), (True, [1, 1, 0, 0, 1, 0])],
+    )
+    def test_title_matching_bulk(self, merge_issns, expected_counts):
+        TitleFactory.create(isbn='9780787960186')
+        TitleFactory.create(issn='1234-5678')
+        reader = CsvTitleListReader()
+        with open('test-data/tagging_batch/plain-title-list.csv', 'r') as infile:
+            data = list(reader.process_source(infile, merge_issns=merge_issns, bulk=True))
+        assert len(data) == 6
+        assert [len(rec.title_ids) for rec in data] == expected_counts
+        with open('test-data/tagging_batch/plain-title-list.csv', 'r') as infile:
+            data_by_batch = list(reader.process_source(infile, merge_issns=merge_issns))
+        assert [rec.title_ids for rec in data] == [rec.title_ids for rec in data_by_batch]
+
+
+@pytest.mark.django_db
+def test_match_title_identifiers():
+    t1 = TitleFactory.create(issn='1234-5678', doi='10.1234/a,"b"')
+    t2 = TitleFactory.create(eissn='1234-5678')
+    TitleFactory.create(issn='2345-6789')
+    matches = match_title_identifiers(
+        [
+            ('a', 'issn', '1234-5678'),
+            ('a', 'eissn', '1234-5678'),
+            ('b', 'doi', '10.1234/a,"b"'),
+            ('c', 'isbn', '1234-5678'),
+        ]
+    )
+    assert matches == {'a': {t1.pk, t2.pk}, 'b': {t1.pk}}
+    # only titles from the queryset are matched
+    matches = match_title_identifiers(
+        [('a', 'issn', '1234-5678'), ('a', 'eissn', '1234-5678')],
+        title_qs=Title.objects.filter(pk=t2.pk),
+    )
+    assert matches == {'a': {t2.pk}}
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/2.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
+import importlib.util
 import socket
 import sys
 import warnings
@@ -350,6 +351,7 @@ CELERY_TASK_ROUTES = {
     'logs.tasks.recompute_interest_by_batch_task': {'queue': 'interest'},
     'logs.tasks.import_new_sushi_attempts_task': {'queue': 'import'},
     'logs.tasks.import_one_sushi_attempt_task': {'queue': 'import'},
+    'logs.tasks.import_sushi_attempts_worker_task': {'queue': 'import'},
     'logs.tasks.smart_interest_sync_task': {'queue': 'interest'},
     'logs.tasks.sync_materialized_reports_task': {'queue': 'interest'},
     'logs.tasks.process_outstanding_import_batch_sync_logs_task': {'queue': 'celery'},
@@ -361,17 +363,22 @@ CELERY_TASK_ROUTES = {
     'logs.tasks.reprocess_mdu_task': {'queue': 'import'},
     'logs.tasks.compare_db_with_clickhouse_task': {'queue': 'import'},
     'logs.tasks.compare_db_with_clickhouse_delayed_task': {'queue': 'celery'},
+    'logs.tasks.sync_clickhouse_resync_shard_task': {'queue': 'import'},
     'publications.tasks.clean_obsolete_platform_title_links_task': {'queue': 'interest'},
     'publications.tasks.merge_titles_task': {'queue': 'interest'},
     'publications.tasks.process_title_overlap_batch_task': {'queue': 'celery'},
     'scheduler.tasks.plan_schedulers_triggering': {'queue': 'sushi'},
     'scheduler.tasks.update_automatic_harvesting': {'queue': 'sushi'},
     'scheduler.tasks.trigger_scheduler': {'queue': 'sushi'},
+    'scheduler.tasks.run_harvester': {'queue': 'sushi'},
+    'scheduler.tasks.reconcile_harvest_stats': {'queue': 'celery'},
     'export.tasks.delete_expired_flexible_data_exports_task': {'queue': 'celery'},
 }
 
 # FlexibleDataExport settings
 EXPORT_DELETING_PERIOD = timedelta(days=config('EXPORT_DELETING_DAYS', cast=int, default=7))
+# Parquet and Arrow exports need the optional `pyarrow` package, they are not offered without it
+ENABLE_COLUMNAR_EXPORT = importlib.util.find_spec('pyarrow') is not None
 
 CELERY_BEAT_SCHEDULE = {
     'smart_interest_sync_task': {
@@ -389,16 +396,21 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': schedule(run_every=timedelta(minutes=5)),
         'options': {'expires': 5 * 60},
     },
-    'find_and_renew_first_due_cached_query_task': {
-        'task': 'recache.tasks.find_and_renew_first_due_cached_query_task',
-        'schedule': schedule(run_every=timedelta(minutes=29)),
-        'options': {'expires': 29 * 60},
+    'renew_due_cached_queries_task': {
+        'task': 'recache.tasks.renew_due_cached_queries_task',
+        'schedule': schedule(run_every=timedelta(minutes=1)),
+        'options': {'expires': 60},
     },
     'scheduler_plan_fetching': {
         'task': 'scheduler.tasks.plan_schedulers_triggering',
         'schedule': schedule(run_every=timedelta(minutes=1)),
         'options': {'expires': 60},
     },
+    'scheduler_reconcile_harvest_stats': {
+        'task': 'scheduler.tasks.reconcile_harvest_stats',
+        'schedule': schedule(run_every=timedelta(hours=1)),
+        'options': {'expires': 60 * 60},
+    },
     'knowledgebase_sync_routes': {
         'task': 'knowledgebase.tasks.sync_routes',
         'schedule': schedule(run_every=timedelta(minutes=5)),
@@ -683,6 +695,58 @@ HARVESTER_IPV6_ADDRESSES = config('HARVESTER_IPV6_ADDRESSES', cast=Csv(), defaul
 # If there is enough memory available, it may help to increase the size to 100k or more
 # but as there are not so many so large files there anyway, it probably does not make much sense
 COUNTER_RECORD_BUFFER_SIZE = config('COUNTER_RECORD_BUFFER_SIZE', cast=int, default='50_000')
+# Records with the same dimensions are merged during import. When there are more than
+# the following number of distinct records in one import batch, they are spilled to disk
+# in sorted runs, which are merged back when the data are ingested. This keeps RAM consumption
+# bounded even for very large files.
+COUNTER_RECORD_AGGREGATION_LIMIT = config(
+    'COUNTER_RECORD_AGGREGATION_LIMIT', cast=int, default='500_000'
+)
+# Max number of resolved titles kept in memory by each worker process between imports.
+# The same titles appear in many reports, so this saves a lot of title lookups. 0 disables it.
+SHARED_TITLE_CACHE_SIZE = config('SHARED_TITLE_CACHE_SIZE', cast=int, default='50_000')
+# Format used to COPY imported data into the AccessLog table - `csv` goes through a temporary
+# table, `binary` writes directly into the table and saves CPU time on both sides
+ACCESSLOG_INGEST_FORMAT = config(
+    'ACCESSLOG_INGEST_FORMAT', cast=Choices(['csv', 'binary']), default='csv'
+)
+# When set to a positive number, new SUSHI attempts are not imported serially in one transaction,
+# but by this many parallel workers, each attempt in its own transaction.
+SUSHI_IMPORT_WORKERS = config('SUSHI_IMPORT_WORKERS', cast=int, default=0)
+# Max number of attempts imported in parallel for one platform or organization (0 means no limit).
+# It prevents one big provider from occupying all the workers.
+SUSHI_IMPORT_MAX_PER_PLATFORM = config('SUSHI_IMPORT_MAX_PER_PLATFORM', cast=int, default=0)
+SUSHI_IMPORT_MAX_PER_ORGANIZATION = config('SUSHI_IMPORT_MAX_PER_ORGANIZATION', cast=int, default=0)
+# Number of import batches for which interest is computed together in one query
+INTEREST_SYNC_CHUNK_SIZE = config('INTEREST_SYNC_CHUNK_SIZE', cast=int, default=200)
+# Flexible reports with more than this number of groups (columns) are computed by one GROUP BY
+# query which is pivoted in Python instead of computing one filtered SUM per group in the database
+SLICER_PIVOT_GROUP_THRESHOLD = config('SLICER_PIVOT_GROUP_THRESHOLD', cast=int, default=20)
+# Max number of groups (columns) of a flexible report computed by pivoting in Python.
+# Reports computed the other way are limited to 100 groups.
+SLICER_PIVOT_MAX_GROUPS = config('SLICER_PIVOT_MAX_GROUPS', cast=int, default='10_000')
+# Number of seconds for which results of flexible reports are cached. Cached results are also
+# invalidated when data they depend on are imported or deleted. 0 disables the cache.
+SLICER_CACHE_TIMEOUT = config('SLICER_CACHE_TIMEOUT', cast=int, default=24 * 3600)
+# Number of seconds for which valid recache results are kept in memory of each process,
+# 0 disables this local cache. It also limits how long after renewal old data may be returned.
+RECACHE_LOCAL_TTL = config('RECACHE_LOCAL_TTL', cast=int, default=60)
+RECACHE_LOCAL_MAX_ENTRIES = config('RECACHE_LOCAL_MAX_ENTRIES', cast=int, default=256)
+# Hits of recache results are written to the database at most once per this number of seconds
+RECACHE_HIT_FLUSH_INTERVAL = config('RECACHE_HIT_FLUSH_INTERVAL', cast=int, default=60)
+# Cached queries are renewed in the background this many seconds before they time out
+# by at most RECACHE_RENEWAL_WORKERS workers running at the same time
+RECACHE_RENEW_AHEAD = config('RECACHE_RENEW_AHEAD', cast=int, default=300)
+RECACHE_RENEWAL_WORKERS = config('RECACHE_RENEWAL_WORKERS', cast=int, default=2)
+# Number of threads obtaining data for individual files or sheets of split flexible exports
+# while already obtained data are being written, 0 or 1 obtains the data one by one
+EXPORT_PART_WORKERS = config('EXPORT_PART_WORKERS', cast=int, default=4)
+# When set to a positive number, SUSHI data are harvested by one worker which runs at most
+# this many downloads for different URLs at the same time instead of one celery task per URL
+SUSHI_HARVESTER_CONCURRENCY = config('SUSHI_HARVESTER_CONCURRENCY', cast=int, default=0)
+# Providers are observed by SUSHI schedulers and the cooldown of schedulers which have
+# adaptive cooldown enabled in admin is adapted to their throttling and response times
+SCHEDULER_ADAPTIVE = config('SCHEDULER_ADAPTIVE', cast=bool, default=True)
 
 # Email
 ADMINS = config('ADMINS', cast=Csv(cast=Csv(post_process=tuple), delimiter=';'), default='')
@@ -721,6 +785,7 @@ EXPORTED_SETTINGS = [
     'USES_ERMS',
     'EXPORT_DELETING_PERIOD',
     'ENABLE_RAW_DATA_IMPORT',
+    'ENABLE_COLUMNAR_EXPORT',
 ]
 
 # Enables Automatic harvesting
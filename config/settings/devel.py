@@ -50,8 +50,8 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': schedule(run_every=timedelta(minutes=1)),  # noqa F405
         'options': {'expires': 10 * 60},
     },
-    'find_and_renew_first_due_cached_query_task': {
-        'task': 'recache.tasks.find_and_renew_first_due_cached_query_task',
+    'renew_due_cached_queries_task': {
+        'task': 'recache.tasks.renew_due_cached_queries_task',
         'schedule': schedule(run_every=timedelta(seconds=300)),  # noqa F405
         'options': {'expires': 4},
     },
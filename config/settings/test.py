@@ -15,6 +15,15 @@ DATABASES["default"]["HOST"] = config("POSTGRES_HOST", "127.0.0.1")  # noqa F405
 
 CACHES["default"]["LOCATION"] = config("REDIS_URL", "redis://127.0.0.1:6379/1")  # noqa F405
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://localhost')  # noqa F405
+# the cache is shared between tests which use the same object ids, so it has to be off
+SLICER_CACHE_TIMEOUT = 0
+# tests manipulate the cached queries directly in the database
+RECACHE_LOCAL_TTL = 0
+RECACHE_HIT_FLUSH_INTERVAL = 0
+# worker threads would not see data created inside test transactions
+EXPORT_PART_WORKERS = 0
+# tests expect the scheduler cooldown to stay as it was set
+SCHEDULER_ADAPTIVE = False
 
 ALLOW_USER_CREATED_PLATFORMS = True
 ALLOW_USER_REGISTRATION = True
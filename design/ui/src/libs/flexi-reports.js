@@ -292,6 +292,8 @@ class FlexiExport {
   static formatToText = {
     XLSX: "Excel",
     ZIP_CSV: "CSV",
+    PARQUET: "Parquet",
+    ARROW: "Arrow",
   };
 
   constructor() {
@@ -248,6 +248,9 @@ export default new Vuex.Store({
     enableDataCoverage(state) {
       return state.basicInfo.ENABLE_DATA_COVERAGE ?? false;
     },
+    enableColumnarExport(state) {
+      return state.basicInfo.ENABLE_COLUMNAR_EXPORT ?? false;
+    },
     celusAdminSitePath(state) {
       if ("CELUS_ADMIN_SITE_PATH" in state.basicInfo) {
         return state.basicInfo.CELUS_ADMIN_SITE_PATH;
@@ -12,6 +12,7 @@ from django.utils import timezone
 from logs.models import ReportInterestMetric
 from organizations.models import Organization
 from rest_framework.test import APIClient
+from scheduler.logic.harvest_stats import refresh_harvest_stats
 from sushi.models import AttemptStatus
 
 from ..entities.counter_report_types import CounterReportTypeFactory
@@ -477,6 +478,8 @@ def harvests(users, credentials, counter_report_types, schedulers, organizations
     AutomaticFactory(
         harvest=automatic, month="2020-01-01", organization=organizations["standalone"]
     )
+    # counters are refreshed after commit which does not happen within tests
+    refresh_harvest_stats()
 
     return locals()
 